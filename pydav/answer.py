@@ -1,7 +1,54 @@
 import httplib2
+from StringIO import StringIO
+from collections import OrderedDict
+from xml.sax.saxutils import escape
 from lxml import etree
 import time
-import dateutil.parser
+from dates import parse_date
+
+def build_propertyupdate(changes, namespaces=None):
+	""" Build the "propertyupdate" body of a PROPPATCH request
+	
+		:param changes: Property name -> new value, None to remove the property. Names are either in the DAV: namespace or qualified ("{namespace}name")
+		:type  changes: Dict
+	
+		:param namespaces: Prefix -> namespace of the prefixes to use. Others are numbered
+		:type  namespaces: Dict
+	
+		Returns the XML string, without the XML declaration.
+	"""
+	prefixes = {'DAV:': 'D'}
+	for prefix, namespace in (namespaces or {}).items():
+		prefixes.setdefault(namespace, prefix)
+	sets, removes = [], []
+	for name, value in changes.items():
+		if name.startswith('{'):
+			namespace, local = name[1:].split('}', 1)
+		else:
+			namespace, local = 'DAV:', name
+		prefix = prefixes.get(namespace)
+		if prefix is None:
+			used = set(prefixes.values())
+			prefix = next('ns%d' % index for index in xrange(len(used) + 1) if 'ns%d' % index not in used)
+			prefixes[namespace] = prefix
+		tag = prefix + ':' + local
+		if value is None:
+			removes.append('<%s/>' % tag)
+		else:
+			sets.append('<%s>%s</%s>' % (tag, escape(value), tag))
+	xml = ['<D:propertyupdate']
+	for namespace, prefix in sorted(prefixes.items(), key=lambda item: item[1]):
+		xml.append(' xmlns:%s="%s"' % (prefix, escape(namespace, {'"': '&quot;'})))
+	xml.append('>')
+	if sets:
+		xml += ['<D:set><D:prop>'] + sets + ['</D:prop></D:set>']
+	if removes:
+		xml += ['<D:remove><D:prop>'] + removes + ['</D:prop></D:remove>']
+	xml.append('</D:propertyupdate>')
+	xml = ''.join(xml)
+	if isinstance(xml, unicode):
+		xml = xml.encode('utf-8')
+	return xml
 
 class ResourceProperties(object):
 	""" ResourceProperties Object for storing information about WebDAV resource
@@ -19,7 +66,7 @@ class ResourceProperties(object):
 		* getcontentlength => TODO: implement a way to refresh it...
 		* getcontenttype
 		* getetag
-		* getlastmodified (ISO 8601)
+		* getlastmodified (RFC 1123)
 		* lockdiscovery
 	"""
 	
@@ -32,8 +79,9 @@ class ResourceProperties(object):
 		#init local data
 		self.path  = ""
 		self.props = {}
-		self.dels  = []
-		self.edits = []
+		# edited and deleted property names (ordered sets)
+		self.dels  = OrderedDict()
+		self.edits = OrderedDict()
 		self.href  = ""
 		self.status = ""
 		self.localexists = False
@@ -41,7 +89,10 @@ class ResourceProperties(object):
 		#init the object from the response object
 		self.href = prop.findtext(".//{DAV:}href")
 		self.status = prop.findtext(".//{DAV:}status")
-		for p in prop.find(".//{DAV:}prop").getchildren():
+		propnode = prop.find(".//{DAV:}prop")
+		if propnode is None:#status only response. Removed member in a sync report for instance
+			return
+		for p in propnode.getchildren():
 			tag = p.tag[6:]
 			if tag == "resourcetype":
 				if len(p.getchildren()) > 0 and p.getchildren()[0].tag=="{DAV:}collection":
@@ -49,41 +100,27 @@ class ResourceProperties(object):
 				else:
 					self.props[tag] = "resource"
 			elif tag == "creationdate" or tag == "getlastmodified":
-				self.props[tag] = dateutil.parser.parse(p.text)
+				self.props[tag] = parse_date(p.text)
 			else:
 				self.props[tag] = p.text
 	
 	def buildProppatch(self):
 		""" Build the "propertyupdate" part of the PROPPATCH command
 		"""
-		xml = '<D:propertyupdate xmlns:D="DAV:"xmlns:Z="http://www.w3.com/standards/z39.50/">'
+		changes = OrderedDict()
 		#commit editions
-		if len(self.edits):
-			xml += '<D:set><D:prop>'
-			for name in self.edits:
-				xml += '<S:'+name+'>'
-				if name == "getlastmodified":
-					xml += str(self.props[name])
-				else:
-					xml += self.props[name]
-				xml += '</S:'+name+'>'
-			xml += '</D:prop></D:set>'
+		for name in self.edits:
+			value = self.props[name]
+			changes[name] = value if isinstance(value, basestring) else str(value)
 		#commit deletions
-		if len(self.dels):
-			xml += '<D:remove><D:prop>'
-			for name in self.dels:
-				ns = 'S' if name.startswith("synchro") else 'D'
-				xml += '<S:'+name+'/>'
-			xml += '</D:prop></D:remove>'
-		xml += '</D:propertyupdate>'
+		for name in self.dels:
+			changes[name] = None
 		#reset tracker
-		self.edits = []
-		self.dels  = []
+		self.edits = OrderedDict()
+		self.dels  = OrderedDict()
 		#return
-		return xml
-			
-			 
-	
+		return build_propertyupdate(changes)
+
 	def __getitem__(self, name):
 		return self.props[name]
 	
@@ -93,10 +130,8 @@ class ResourceProperties(object):
 		if name == "creationdate":     return #it is forbidden to change this header !
 
 		self.props[name] = value
-		if not self.edits.append(name):#record edition
-			self.edits.append(name)
-		if self.dels.count(name):#record NO delete
-			self.dels.remove(name)
+		self.edits[name] = True#record edition
+		self.dels.pop(name, None)#record NO delete
 		
 	def __delitem__(self, name):
 		if name == "displayname":      return #it is forbidden to remove this header !
@@ -105,10 +140,8 @@ class ResourceProperties(object):
 		if name == "getcontentlength": return #this is a non-sense to change the content length !
 		
 		del self.props[name]
-		if not self.dels.append(name):#record deletion
-			self.dels.append(name)
-		if self.edits.count(name):#record NO edited
-			self.edits.remove(name)
+		self.dels[name] = True#record deletion
+		self.edits.pop(name, None)#record NO edited
 		
 	def __iter__(self):
 		return self.props.__iter__()
@@ -146,11 +179,25 @@ class Answer(object):
 		self.props = []
 		parser = etree.XMLParser(remove_blank_text=True)
 		root = etree.XML(xml, parser)
+		self.sync_token = root.findtext("{DAV:}sync-token")
 		
 		for response in root.iter("{DAV:}response"):
 			if isinstance(response.tag, basestring):#make sure it is an elem
 				prop = ResourceProperties(response)
 				self.props.append(prop)
-				
 
+	@staticmethod
+	def iterresponses(xml):
+		""" Parse a multistatus answer incrementally, yielding its "response"
+			elements one at a time. Each element is freed once the next one is
+			read, so that large answers never build a whole tree.
 
+			:param xml: raw XML answer
+			:type  xml: String
+		"""
+		for event, element in etree.iterparse(StringIO(xml), tag='{DAV:}response',
+											  remove_blank_text=True):
+			yield element
+			element.clear()
+			while element.getprevious() is not None:
+				del element.getparent()[0]
@@ -0,0 +1,179 @@
+""" Auth Module
+
+	Authentication shared by a Connection and all its clones
+"""
+import os
+import re
+import time
+import base64
+import hashlib
+import threading
+
+# auth scheme, or name=value parameter
+_TOKEN = re.compile(r'([A-Za-z][\w-]*)(?:\s*=\s*("(?:[^"\\]|\\.)*"|[^\s,]*))?')
+# boundary between two cookies of a folded Set-Cookie header (not the
+# comma of an Expires date)
+_COOKIE_SPLIT = re.compile(r',\s*(?=[^;,=\s]+=)')
+
+def parse_challenges(value):
+	""" Parse a WWW-Authenticate header into a dict mapping lower case scheme
+		names to dicts of parameters
+
+		:param value: Header value
+		:type  value: String
+	"""
+	challenges = {}
+	params = None
+	for match in _TOKEN.finditer(value or ''):
+		name, param = match.groups()
+		if param is None:#a name alone starts a new challenge
+			params = challenges[name.lower()] = {}
+		elif params is not None:
+			if param.startswith('"'):
+				param = re.sub(r'\\(.)', r'\1', param[1:-1])
+			params[name.lower()] = param
+	return challenges
+
+def _md5(text):
+	return hashlib.md5(text).hexdigest()
+
+class Authenticator(object):
+	""" Credentials of a server, answering its challenges once for all the
+		connections and threads sharing this object.
+
+		The first 401 answer tells the scheme: from then on every request
+		carries its credentials up front, so that no other request is
+		challenged. Basic credentials can also be sent from the very first
+		request (scheme "basic"). Digest nonces are reused, with an
+		increasing nonce count, until the server reports them stale.
+		Session cookies set by the server are sent back: ownCloud then skips
+		the password check of the requests of a logged in session.
+
+		Statistics: challenges counts the 401 answers, preemptive the
+		requests sent with credentials before any challenge, and avoided the
+		preemptive requests that were not challenged (each one saved a round
+		trip).
+	"""
+	def __init__(self, username, password, scheme=None):
+		""" Set up the object
+
+			:param username: User name. No authentication when empty
+			:type  username: String
+
+			:param password: Password
+			:type  password: String
+
+			:param scheme: "basic" to send Basic credentials without waiting for a challenge. None by default
+			:type  scheme: String
+		"""
+		self.username = username
+		self.password = password
+		self.scheme = scheme.lower() if scheme else None
+		self.digest = None
+		self.cookies = {}
+		self._nc = 0
+		self._lock = threading.Lock()
+		# statistics
+		self.challenges = 0
+		self.preemptive = 0
+		self.avoided = 0
+
+	def _digest_header(self, method, uri):
+		params = self.digest
+		self._nc += 1
+		nc = '%08x' % self._nc
+		cnonce = _md5('%s:%s:%s' % (time.time(), os.getpid(), self._nc))[:16]
+		realm, nonce = params.get('realm', ''), params.get('nonce', '')
+		algorithm = params.get('algorithm', 'MD5')
+		ha1 = _md5('%s:%s:%s' % (self.username, realm, self.password))
+		if algorithm.upper() == 'MD5-SESS':
+			ha1 = _md5('%s:%s:%s' % (ha1, nonce, cnonce))
+		ha2 = _md5('%s:%s' % (method, uri))
+		qop = 'auth' if 'auth' in params.get('qop', '').replace(' ', '').split(',') else None
+		if qop:
+			response = _md5(':'.join((ha1, nonce, nc, cnonce, qop, ha2)))
+		else:
+			response = _md5(':'.join((ha1, nonce, ha2)))
+		value = 'Digest username="%s", realm="%s", nonce="%s", uri="%s", response="%s", algorithm=%s' % (
+			self.username, realm, nonce, uri, response, algorithm)
+		if qop:
+			value += ', qop=%s, nc=%s, cnonce="%s"' % (qop, nc, cnonce)
+		if 'opaque' in params:
+			value += ', opaque="%s"' % params['opaque']
+		return value
+
+	def headers(self, method, uri):
+		""" Get the authentication headers (Authorization, Cookie) of a
+			request
+
+			:param method: HTTP method
+			:type  method: String
+
+			:param uri: Request uri: path and query, without host
+			:type  uri: String
+
+			Returns a dict, empty when there is nothing to send.
+		"""
+		headers = {}
+		with self._lock:
+			if self.cookies:
+				headers['Cookie'] = '; '.join('%s=%s' % item for item in sorted(self.cookies.items()))
+			if self.username and self.scheme == 'basic':
+				headers['Authorization'] = 'Basic ' + base64.b64encode(
+					'%s:%s' % (self.username, self.password))
+			elif self.username and self.scheme == 'digest' and self.digest is not None:
+				headers['Authorization'] = self._digest_header(method, uri)
+		return headers
+
+	def response(self, resp, sent, first=True):
+		""" Learn from the answer to a request: session cookies and
+			challenges
+
+			:param resp: Response
+			:type  resp: httplib2.Response
+
+			:param sent: Authentication headers the request was sent with, as returned by headers()
+			:type  sent: Dict
+
+			:param first: Whether this was the first attempt of the request, not an answer to a challenge
+			:type  first: Boolean
+
+			Returns True if the request should be sent again with the new credentials.
+		"""
+		authorized = 'Authorization' in sent
+		with self._lock:
+			self._store_cookies(resp.get('set-cookie'))
+			if first and authorized:
+				self.preemptive += 1
+			if resp.status != 401:
+				if first and authorized:
+					self.avoided += 1
+				return False
+			self.challenges += 1
+			if not self.username:
+				return False
+			challenges = parse_challenges(resp.get('www-authenticate'))
+			previous = self.scheme
+			if 'digest' in challenges:
+				params = challenges['digest']
+				stale = params.get('stale', '').lower() == 'true'
+				self.scheme, self.digest, self._nc = 'digest', params, 0
+				# a new nonce without "stale" means the credentials were refused
+				return not authorized or stale or previous != 'digest'
+			if 'basic' in challenges:
+				self.scheme = 'basic'
+				return not authorized or previous != 'basic'
+			return False
+
+	def _store_cookies(self, value):
+		if not value:
+			return
+		for cookie in _COOKIE_SPLIT.split(value):
+			pair = cookie.split(';', 1)[0].strip()
+			if '=' not in pair:
+				continue
+			name, cookie_value = [part.strip() for part in pair.split('=', 1)]
+			if cookie_value in ('', 'deleted') or 'max-age=0' in cookie.lower():
+				self.cookies.pop(name, None)
+			else:
+				self.cookies[name] = cookie_value
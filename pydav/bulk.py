@@ -0,0 +1,172 @@
+""" Bulk Module
+
+	Server side operations on many resources at once
+"""
+import re
+import urllib
+import urlparse
+import fnmatch
+import posixpath
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple
+from answer import Answer
+from listing import Listing
+from workers import ConnectionPool, TaskPool
+
+_MAGIC = re.compile('[*?[]')
+
+class BulkResult(namedtuple('BulkResult', ['source', 'destination', 'status', 'failures'])):
+	""" Outcome of one COPY or MOVE request. source and destination are
+		hrefs, status the HTTP status code and failures a list of
+		(href, status line) for the members that failed, parsed from a 207
+		multistatus answer.
+	"""
+	__slots__ = ()
+
+	@property
+	def ok(self):
+		return 200 <= self.status < 300 and not self.failures
+
+class BulkOperation(object):
+	""" COPY or MOVE many resources, designated by lists of paths or glob
+		patterns, into a destination collection.
+
+		Requests are sent concurrently, after the destination collection is
+		created if needed. When the sources of a COPY are all the members of
+		a collection, the destination does not exist yet and the depth is
+		infinite, a single request on the collection itself is sent instead.
+		MOVE is never coalesced: moving the collection would take its dead
+		properties, ACLs and locks away, and leave it missing for a while.
+	"""
+	def __init__(self, connection, workers=4):
+		""" Set up the object
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+		"""
+		self.connection = connection
+		self.pool = ConnectionPool(connection)
+		self.workers = workers
+
+	def _href(self, path):
+		return urlparse.urlparse(self.connection.get_uri(urllib.quote(path))).path
+
+	def _members(self, href):
+		resp, content = self.pool.get().send_propfind(href, ['resourcetype'], 1, raw=True)
+		if resp.status == 404:
+			return []
+		if resp.status < 200 or resp.status >= 300:
+			raise httplib2.HttpLib2Error([resp, content])
+		listing = Listing.parse(content)
+		return [(h, bool(c)) for h, c in zip(listing.hrefs, listing.collections)
+				if h.rstrip('/') != href.rstrip('/')]
+
+	def _exists(self, href):
+		resp, content = self.pool.get().send_propfind(href, ['resourcetype'], 0, raw=True)
+		return resp.status != 404
+
+	def expand(self, pattern):
+		""" Expand a glob pattern (*, ? and [...] in any path component) into
+			the matching hrefs. Paths without magic are returned as is.
+
+			:param pattern: Path or pattern, relative to the connection base path
+			:type  pattern: String
+
+			Returns a tuple: list of matching hrefs, and the href of the
+			collection whose members all matched (None if there is none).
+		"""
+		parts = pattern.strip('/').split('/')
+		fixed = []
+		while parts and not _MAGIC.search(parts[0]):
+			fixed.append(parts.pop(0))
+		if not parts:
+			return [self._href(pattern)], None
+
+		current = [self._href('/'.join(fixed) + '/' if fixed else '')]
+		complete = None
+		for index, part in enumerate(parts):
+			last = index == len(parts) - 1
+			matched = []
+			for directory in current:
+				members = self._members(directory)
+				found = [(href, collection) for href, collection in members
+						 if fnmatch.fnmatchcase(urllib.unquote(posixpath.basename(href.rstrip('/'))), part)]
+				if last and found and len(found) == len(members) and len(current) == 1:
+					complete = directory
+				matched.extend(href for href, collection in found if last or collection)
+			current = matched
+		return current, complete
+
+	def _send(self, method, source, destination, overwrite, depth):
+		connection = self.pool.get()
+		if method == 'COPY':
+			resp, content = connection.send_copy(source, destination, overwrite, depth)
+		else:
+			resp, content = connection.send_move(source, destination, overwrite)
+		failures = []
+		if resp.status == 207:
+			for prop in Answer(content).props:
+				if prop.status and int(prop.status.split()[1]) >= 300:
+					failures.append((prop.href, prop.status))
+		return BulkResult(source, destination, resp.status, failures)
+
+	def run(self, method, sources, destination, overwrite=False, depth=-1):
+		""" COPY or MOVE sources into the destination collection
+
+			:param method: "COPY" or "MOVE"
+			:type  method: String
+
+			:param sources: Paths or glob patterns relative to the connection base path, or (source, destination) path tuples
+			:type  sources: List
+
+			:param destination: Destination collection, relative to the connection base path. Ignored for tuples
+			:type  destination: String
+
+			:param overwrite: Allow existing destinations to be overwritten. Defaults to False
+			:type  overwrite: Boolean
+
+			:param depth: Depth of collection copies, infinity (-1) by default. MOVE is always infinite
+			:type  depth: Integer
+
+			Returns a list of BulkResult.
+		"""
+		if method not in ('COPY', 'MOVE'):
+			raise ValueError("invalid method: %r" % method)
+		if isinstance(sources, basestring):
+			sources = [sources]
+		target = self._href(destination.rstrip('/') + '/') if destination is not None else None
+		pairs = []
+		for source in sources:
+			if isinstance(source, tuple):
+				pairs.append((self._href(source[0]), self._href(source[1])))
+				continue
+			hrefs, complete = self.expand(source)
+			# a single request on the collection only does the same when
+			# its whole subtree is transferred
+			if complete is not None and method == 'COPY' and depth < 0 and not self._exists(target):
+				pairs.append(self._send(method, complete, target, overwrite, depth))
+				continue
+			for href in hrefs:
+				name = posixpath.basename(href.rstrip('/'))
+				pairs.append((href, target + name + ('/' if href.endswith('/') else '')))
+
+		if target is not None and any(isinstance(pair, tuple) for pair in pairs):
+			# members of a missing collection can not be created (409)
+			resp, content = self.pool.get().send_mkcol(target)
+			if resp.status not in (201, 405):#405: exists already
+				raise httplib2.HttpLib2Error([resp, content])
+
+		results = [None] * len(pairs)
+		tasks = TaskPool(self.workers)
+		def send(index, source, destination):
+			results[index] = self._send(method, source, destination, overwrite, depth)
+		for index, pair in enumerate(pairs):
+			if isinstance(pair, BulkResult):
+				results[index] = pair
+			else:
+				tasks.submit(send, index, pair[0], pair[1])
+		tasks.join()
+		return results
@@ -0,0 +1,212 @@
+""" Cache Module
+"""
+import os
+import json
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
+
+class ContentCache(object):
+	""" Size bounded on-disk cache of resource bodies.
+
+		Each entry is stored as two files in the cache directory: the raw
+		body and a small JSON document holding the URL and its validators
+		(ETag, Last-Modified). Entries are evicted in least recently used
+		order as soon as the total size of the stored bodies exceeds max_size.
+		The LRU order survives restarts: it is rebuilt from the body files
+		modification times, which are bumped on every hit.
+	"""
+	def __init__(self, directory, max_size=500000000):
+		""" Set up the object and load any existing entry
+
+			:param directory: Local directory where the bodies are stored. Created if needed
+			:type  directory: String
+
+			:param max_size: Maximum total size of the cached bodies in bytes. 500MB by default
+			:type  max_size: Integer
+		"""
+		self.directory = directory
+		self.max_size = max_size
+		self.size = 0
+		self.entries = OrderedDict()
+		self._lock = threading.Lock()
+
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self._load()
+
+	def _load(self):
+		found = []
+		for name in os.listdir(self.directory):
+			if not name.endswith('.meta'):
+				continue
+			key = name[:-5]
+			try:
+				meta_fd = open(self._meta_path(key), 'r')
+				meta = json.load(meta_fd)
+				meta_fd.close()
+				atime = os.stat(self._body_path(key)).st_mtime
+			except (IOError, OSError, ValueError):
+				self._remove_files(key)
+				continue
+			found.append((atime, key, meta))
+		found.sort()
+		for atime, key, meta in found:
+			self.entries[key] = meta
+			self.size += meta['size']
+		self._evict()
+
+	def _key(self, url):
+		return hashlib.sha1(url).hexdigest()
+
+	def _body_path(self, key):
+		return os.path.join(self.directory, key)
+
+	def _meta_path(self, key):
+		return os.path.join(self.directory, key + '.meta')
+
+	def _remove_files(self, key):
+		for path in (self._body_path(key), self._meta_path(key)):
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+	def _touch(self, key):
+		self.entries[key] = self.entries.pop(key)
+		try:
+			os.utime(self._body_path(key), None)
+		except OSError:
+			pass
+
+	def _evict(self):
+		while self.size > self.max_size and self.entries:
+			key, meta = self.entries.popitem(last=False)
+			self.size -= meta['size']
+			self._remove_files(key)
+
+	def lookup(self, url):
+		""" Get the metadata stored for an url, or None when it is not cached.
+			This does not count as a hit for the LRU order.
+
+			:param url: Full url of the resource
+			:type  url: String
+		"""
+		with self._lock:
+			return self.entries.get(self._key(url))
+
+	def conditional_headers(self, url):
+		""" Build the headers needed to revalidate a cached url. Empty when the
+			url is not cached.
+
+			:param url: Full url of the resource
+			:type  url: String
+		"""
+		meta = self.lookup(url)
+		headers = {}
+		if meta is None:
+			return headers
+		if meta['etag']:
+			headers['If-None-Match'] = meta['etag']
+		if meta['lastmodified']:
+			headers['If-Modified-Since'] = meta['lastmodified']
+		return headers
+
+	def store(self, url, data, etag=None, lastmodified=None):
+		""" Store a body. Bodies larger than the cache itself are not stored.
+
+			:param url: Full url of the resource
+			:type  url: String
+
+			:param data: Resource body
+			:type  data: String
+
+			:param etag: ETag returned by the server, if any
+			:type  etag: String
+
+			:param lastmodified: Last-Modified header returned by the server, if any
+			:type  lastmodified: String
+		"""
+		if len(data) > self.max_size:
+			self.invalidate(url)
+			return
+		key = self._key(url)
+		meta = {'url': url, 'etag': etag, 'lastmodified': lastmodified,
+				'size': len(data)}
+
+		with self._lock:
+			# write to temporary files first so that a concurrent reader never
+			# gets a partial body
+			tmp = self._body_path(key) + '.%d.tmp' % threading.current_thread().ident
+			body_fd = open(tmp, 'wb')
+			body_fd.write(data)
+			body_fd.close()
+			os.rename(tmp, self._body_path(key))
+			meta_fd = open(self._meta_path(key), 'w')
+			json.dump(meta, meta_fd)
+			meta_fd.close()
+
+			old = self.entries.pop(key, None)
+			if old is not None:
+				self.size -= old['size']
+			self.entries[key] = meta
+			self.size += meta['size']
+			self._evict()
+
+	def copy_to(self, url, local_file_name):
+		""" Copy a cached body to a local file and record the hit. Returns
+			False if the url is not cached (anymore).
+
+			:param url: Full url of the resource
+			:type  url: String
+
+			:param local_file_name: Destination file
+			:type  local_file_name: String
+		"""
+		key = self._key(url)
+		with self._lock:
+			if key not in self.entries:
+				return False
+			self._touch(key)
+			shutil.copyfile(self._body_path(key), local_file_name)
+		return True
+
+	def read(self, url):
+		""" Read a cached body and record the hit. Returns None if the url is
+			not cached.
+
+			:param url: Full url of the resource
+			:type  url: String
+		"""
+		key = self._key(url)
+		with self._lock:
+			if key not in self.entries:
+				return None
+			self._touch(key)
+			body_fd = open(self._body_path(key), 'rb')
+			data = body_fd.read()
+			body_fd.close()
+		return data
+
+	def invalidate(self, url):
+		""" Drop an url from the cache
+
+			:param url: Full url of the resource
+			:type  url: String
+		"""
+		key = self._key(url)
+		with self._lock:
+			meta = self.entries.pop(key, None)
+			if meta is not None:
+				self.size -= meta['size']
+				self._remove_files(key)
+
+	def clear(self):
+		""" Drop every entry
+		"""
+		with self._lock:
+			for key in self.entries:
+				self._remove_files(key)
+			self.entries.clear()
+			self.size = 0
@@ -0,0 +1,146 @@
+""" Checksum Module
+
+	Integrity checksums computed while data streams through
+"""
+import re
+import zlib
+import base64
+import hashlib
+import httplib2#fimxe: this is imported only for exceptions
+
+ALGORITHMS = ('MD5', 'SHA1', 'SHA256', 'ADLER32')
+_MD5_ETAG = re.compile('^"?([0-9a-fA-F]{32})"?$')
+
+class ChecksumMismatch(httplib2.HttpLib2Error): pass
+
+class Adler32(object):
+	""" hashlib-like wrapper around zlib.adler32
+	"""
+	def __init__(self):
+		self.value = 1
+
+	def update(self, data):
+		self.value = zlib.adler32(data, self.value)
+
+	def digest(self):
+		return ('%08x' % (self.value & 0xffffffff)).decode('hex')
+
+	def hexdigest(self):
+		return '%08x' % (self.value & 0xffffffff)
+
+def _new(algorithm):
+	if algorithm == 'ADLER32':
+		return Adler32()
+	return hashlib.new(algorithm.lower())
+
+def parse_oc_checksum(value):
+	""" Parse an OC-Checksum header ("SHA1:abc... MD5:def...") into a dict
+		mapping upper case algorithm names to lower case hex digests
+
+		:param value: Header value
+		:type  value: String
+	"""
+	found = {}
+	for item in (value or '').replace(',', ' ').split():
+		if ':' in item:
+			algorithm, digest = item.split(':', 1)
+			found[algorithm.strip().upper()] = digest.strip().lower()
+	return found
+
+class Checksums(object):
+	""" Running checksums of a byte stream. Feed every chunk to update() as
+		it is read or written, so that no second pass over the data is
+		needed.
+	"""
+	def __init__(self, algorithms=ALGORITHMS):
+		""" Set up the object
+
+			:param algorithms: Names among "MD5", "SHA1", "SHA256" and "ADLER32". All of them by default
+			:type  algorithms: List
+		"""
+		self.hashes = {}
+		for algorithm in algorithms:
+			algorithm = algorithm.upper()
+			if algorithm not in ALGORITHMS:
+				raise ValueError("unsupported checksum: %r" % algorithm)
+			self.hashes[algorithm] = _new(algorithm)
+		self.size = 0
+
+	def update(self, data):
+		for value in self.hashes.itervalues():
+			value.update(data)
+		self.size += len(data)
+
+	def hexdigest(self, algorithm):
+		return self.hashes[algorithm.upper()].hexdigest()
+
+	def digests(self):
+		""" Get all the hex digests, as a dict keyed by algorithm name
+		"""
+		return dict((name, value.hexdigest()) for name, value in self.hashes.items())
+
+	def content_md5(self):
+		""" Value of the Content-MD5 header (base64 of the binary digest)
+		"""
+		return base64.b64encode(self.hashes['MD5'].digest())
+
+	def oc_checksum(self, algorithm):
+		""" Value of the OC-Checksum header for one algorithm
+		"""
+		return '%s:%s' % (algorithm.upper(), self.hexdigest(algorithm))
+
+	def headers(self, oc_algorithm=None):
+		""" Build the checksum headers of an upload: Content-MD5 when MD5 is
+			computed, OC-Checksum when an algorithm is given
+
+			:param oc_algorithm: Algorithm sent as OC-Checksum, None to omit it
+			:type  oc_algorithm: String
+		"""
+		headers = {}
+		if 'MD5' in self.hashes:
+			headers['Content-MD5'] = self.content_md5()
+		if oc_algorithm is not None and oc_algorithm.upper() in self.hashes:
+			headers['OC-Checksum'] = self.oc_checksum(oc_algorithm)
+		return headers
+
+	def verify(self, resp, etag=False, content_md5=True, partial=False):
+		""" Compare the checksums with the ones the server reported in resp:
+			OC-Checksum, Content-MD5 and, when etag is True, an ETag made of an
+			MD5 hex digest. Checksums the server did not report are skipped.
+
+			:param resp: Response of the GET or PUT request
+			:type  resp: httplib2.Response
+
+			:param etag: Trust the ETag to be the MD5 of the body. False by default
+			:type  etag: Boolean
+
+			:param content_md5: Use Content-MD5. It describes the response body, so it must be False for uploads
+			:type  content_md5: Boolean
+
+			:param partial: The body is a part of the resource (206 answer): only Content-MD5 applies to it
+			:type  partial: Boolean
+
+			Returns the list of verified algorithms. Raises ChecksumMismatch.
+		"""
+		if partial:
+			reported = {}
+		else:
+			reported = parse_oc_checksum(resp.get('oc-checksum'))
+		if content_md5 and resp.get('content-md5') and 'MD5' in self.hashes:
+			try:
+				reported['MD5'] = base64.b64decode(resp['content-md5']).encode('hex')
+			except TypeError:
+				pass
+		if etag and not partial and 'MD5' not in reported:
+			match = _MD5_ETAG.match(resp.get('etag') or '')
+			if match:
+				reported['MD5'] = match.group(1).lower()
+		verified = []
+		for algorithm, digest in sorted(reported.items()):
+			if algorithm not in self.hashes:
+				continue
+			if self.hexdigest(algorithm) != digest:
+				raise ChecksumMismatch([resp, '%s mismatch: expected %s, got %s' % (
+					algorithm, digest, self.hexdigest(algorithm))])
+			verified.append(algorithm)
+		return verified
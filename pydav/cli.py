@@ -0,0 +1,328 @@
+""" Cli Module
+
+	The pydav command: ls, get, put, sync, rm and du on a WebDAV server
+
+	Remote paths are full urls (http://user@host/dav/dir), or paths relative
+	to the PYDAV_URL environment variable. The password comes from -p, the
+	url or PYDAV_PASSWORD. No request is sent before the first one the
+	command needs: the server capabilities are detected lazily.
+"""
+import os
+import sys
+import time
+import urllib
+import urlparse
+import argparse
+import posixpath
+import httplib2#fimxe: this is imported only for exceptions
+from client import Client
+from listing import list_collection, walk, href_path
+from scheduler import TransferScheduler, DONE
+from workers import ConnectionPool, TaskPool
+
+class CliError(Exception): pass
+
+def settings_from_url(url, username=None, password=None):
+	""" Connection settings of the server of an url, with the path of the url
+
+		:param url: Full url, possibly with user and password
+		:type  url: String
+
+		Returns a tuple: settings dict, and unquoted absolute path.
+	"""
+	parsed = urlparse.urlsplit(url)
+	if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+		raise CliError('not an http(s) url: %s' % url)
+	netloc = parsed.hostname + (':%d' % parsed.port if parsed.port else '')
+	settings = {'host': '%s://%s' % (parsed.scheme, netloc),
+				'path': '/',
+				'username': username or urllib.unquote(parsed.username or ''),
+				'password': password or urllib.unquote(parsed.password or ''),
+				'realm': '',
+				'port': parsed.port or (443 if parsed.scheme == 'https' else 80),
+				'lazy': True}
+	return settings, urllib.unquote(parsed.path or '/')
+
+def human(size):
+	""" Size in bytes as a short human readable string
+	"""
+	for unit in ('B', 'K', 'M', 'G', 'T'):
+		if abs(size) < 1024 or unit == 'T':
+			return ('%d%s' if unit == 'B' else '%.1f%s') % (size, unit)
+		size /= 1024.0
+
+class Progress(object):
+	""" Live throughput of a TransferScheduler, on one terminal line
+	"""
+	def __init__(self, stream, enabled=True):
+		self.stream = stream
+		self.enabled = enabled
+		self.started = time.time()
+		self.last = None
+
+	def __call__(self, event):
+		self.last = event
+		if self.enabled:
+			self.stream.write('\r%d/%d files  %s/%s  %s/s   ' % (
+				event.finished, event.jobs, human(event.transferred), human(event.total), human(event.rate)))
+			self.stream.flush()
+
+	def done(self, out):
+		if self.enabled and self.last is not None:
+			self.stream.write('\n')
+		elapsed = time.time() - self.started
+		if self.last is not None:
+			out.write('%d files, %s in %.1fs (%s/s)\n' % (
+				self.last.jobs, human(self.last.transferred), elapsed,
+				human(self.last.transferred / elapsed if elapsed else 0)))
+
+class Cli(object):
+	""" Run one pydav command
+	"""
+	def __init__(self, options, stdout, stderr):
+		self.options = options
+		self.stdout = stdout
+		self.stderr = stderr
+		self.clients = {}
+
+	def remote(self, target):
+		""" Client and unquoted absolute path of a remote argument
+		"""
+		if '://' not in target:
+			base = os.environ.get('PYDAV_URL')
+			if not base:
+				raise CliError('%s: not an url, and PYDAV_URL is not set' % target)
+			target = urlparse.urljoin(base.rstrip('/') + '/', target)
+		settings, path = settings_from_url(target, self.options.user,
+										   self.options.password or os.environ.get('PYDAV_PASSWORD'))
+		key = (settings['host'], settings['username'])
+		if key not in self.clients:
+			self.clients[key] = Client(settings)
+		return self.clients[key], path
+
+	def _transfer(self, jobs):
+		""" Run (kind, client, path, local path, size) transfers with live progress
+		"""
+		progress = Progress(self.stderr, not self.options.quiet and hasattr(self.stderr, 'isatty') and
+							self.stderr.isatty())
+		scheduler = TransferScheduler(workers=self.options.jobs, per_host=self.options.jobs, callback=progress)
+		for kind, client, path, local_path, size in jobs:
+			if kind == 'upload':
+				scheduler.upload(client, path, local_path)
+			else:
+				scheduler.download(client, path, local_path, size)
+		scheduler.wait()
+		scheduler.close()
+		progress.done(self.stderr if self.options.quiet else self.stdout)
+		failed = [job for job in scheduler.jobs if job.state != DONE]
+		for job in failed:
+			self.stderr.write('%s %s: %s\n' % (job.kind, job.path, job.error))
+		return 1 if failed else 0
+
+	def ls(self):
+		client, path = self.remote(self.options.url)
+		if self.options.recursive:
+			entries = walk(client.connection, path, self.options.jobs)
+			if entries is None:
+				raise CliError('%s: not found' % path)
+		else:
+			itself, entries = list_collection(client.connection, path)
+			if itself is None:
+				raise CliError('%s: not found' % path)
+			if not itself.collection:
+				entries = [itself]
+		for entry in entries:
+			mtime = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.mtime)) if entry.mtime == entry.mtime else '-'
+			size = '-' if entry.collection else str(entry.size)
+			self.stdout.write('%s %12s %s %s\n' % ('d' if entry.collection else '-', size, mtime, entry.path))
+		return 0
+
+	def get(self):
+		client, path = self.remote(self.options.source)
+		local = self.options.destination
+		itself, members = list_collection(client.connection, path, 0)
+		if itself is None:
+			raise CliError('%s: not found' % path)
+		if not itself.collection:
+			if os.path.isdir(local):
+				local = os.path.join(local, posixpath.basename(path))
+			return self._transfer([('download', client, path, local, itself.size)])
+		if not self.options.recursive:
+			raise CliError('%s: is a collection (use -r)' % path)
+		entries = walk(client.connection, path, self.options.jobs)
+		root = itself.path
+		jobs = []
+		if not os.path.isdir(local):
+			os.makedirs(local)
+		for entry in entries:
+			target = os.path.join(local, *entry.path[len(root):].rstrip('/').split('/'))
+			if entry.collection:
+				if not os.path.isdir(target):
+					os.makedirs(target)
+			else:
+				jobs.append(('download', client, entry.path, target, entry.size))
+		return self._transfer(jobs)
+
+	def _local_tree(self, local):
+		""" Relative paths of the directories and files below a local directory
+		"""
+		directories, files = [], []
+		for dirpath, dirnames, filenames in os.walk(local):
+			relative = os.path.relpath(dirpath, local)
+			prefix = '' if relative == '.' else relative.replace(os.sep, '/') + '/'
+			directories.extend(prefix + name + '/' for name in sorted(dirnames))
+			files.extend(prefix + name for name in sorted(filenames))
+		return directories, files
+
+	def _mkcols(self, client, paths):
+		""" Create collections, parents first, concurrently within a level
+		"""
+		pool = ConnectionPool(client.connection)
+		def mkcol(path):
+			resp, content = pool.get().send_mkcol(urllib.quote(path))
+			if resp.status not in (201, 405):#405: exists already
+				raise httplib2.HttpLib2Error([resp, content])
+		levels = {}
+		for path in paths:
+			levels.setdefault(path.rstrip('/').count('/'), []).append(path)
+		for level in sorted(levels):
+			TaskPool(self.options.jobs).map(mkcol, levels[level])
+
+	def put(self):
+		local = self.options.source
+		client, path = self.remote(self.options.destination)
+		if not os.path.isdir(local):
+			if path.endswith('/'):
+				path += os.path.basename(local)
+			return self._transfer([('upload', client, path, local, None)])
+		if not self.options.recursive:
+			raise CliError('%s: is a directory (use -r)' % local)
+		root = path if path.endswith('/') else path + '/'
+		directories, files = self._local_tree(local)
+		self._mkcols(client, [root] + [root + directory for directory in directories])
+		return self._transfer([('upload', client, root + name, os.path.join(local, *name.split('/')), None)
+							   for name in files])
+
+	def sync(self):
+		""" Make the remote tree a copy of the local one: upload the files
+			that are missing or differ in size or are newer locally
+		"""
+		local = self.options.source
+		client, path = self.remote(self.options.destination)
+		root = path if path.endswith('/') else path + '/'
+		entries = walk(client.connection, root, self.options.jobs)
+		remote = dict((entry.path[len(root):], entry) for entry in entries or [])
+		directories, files = self._local_tree(local)
+		self._mkcols(client, ([] if entries is not None else [root]) +
+					 [root + directory for directory in directories if directory not in remote])
+		jobs = []
+		for name in files:
+			local_path = os.path.join(local, *name.split('/'))
+			entry = remote.get(name)
+			stat = os.stat(local_path)
+			if entry is None or entry.collection or entry.size != stat.st_size or \
+			   not (entry.mtime == entry.mtime and int(stat.st_mtime) <= entry.mtime):#dates are to the second
+				jobs.append(('upload', client, root + name, local_path, None))
+		status = self._transfer(jobs) if jobs else 0
+		if self.options.delete:
+			wanted = set(directories) | set(files)
+			extra = [name for name in sorted(remote) if name not in wanted]
+			# a collection goes with everything below it
+			extra = [name for name in extra if not any(
+				name.startswith(other) for other in extra if other.endswith('/') and other != name)]
+			self._delete(client, [root + name for name in extra])
+		if not jobs:
+			self.stdout.write('up to date\n')
+		return status
+
+	def _delete(self, client, paths):
+		pool = ConnectionPool(client.connection)
+		failed = []
+		def delete(path):
+			resp, content = pool.get().send_delete(urllib.quote(path))
+			if resp.status >= 300 and resp.status != 404:
+				failed.append(path)
+				self.stderr.write('rm %s: %s\n' % (path, resp.status))
+			elif self.options.verbose:
+				self.stdout.write('removed %s\n' % path)
+		TaskPool(self.options.jobs).map(delete, paths)
+		return 1 if failed else 0
+
+	def rm(self):
+		targets = [self.remote(url) for url in self.options.urls]
+		if not self.options.recursive:
+			for client, path in targets:
+				itself, members = list_collection(client.connection, path, 0)
+				if itself is None:
+					raise CliError('%s: not found' % path)
+				if itself.collection:
+					raise CliError('%s: is a collection (use -r)' % path)
+		status = 0
+		for client in set(client for client, path in targets):
+			status |= self._delete(client, [path for other, path in targets if other is client])
+		return status
+
+	def du(self):
+		client, path = self.remote(self.options.url)
+		usage = client.du(path, self.options.depth, self.options.jobs)
+		for href, size in sorted(usage.sizes.items(), key=lambda item: href_path(item[0])):
+			self.stdout.write('%10s  %s\n' % (str(size) if self.options.bytes else human(size), href_path(href)))
+		if usage.files is not None:
+			self.stdout.write('%d files\n' % usage.files)
+		return 0
+
+def parser():
+	""" Build the argument parser of the pydav command
+	"""
+	main = argparse.ArgumentParser(prog='pydav', description='WebDAV command line client')
+	main.add_argument('-u', '--user', help='user name (default: from the url, or PYDAV_USER)',
+					  default=os.environ.get('PYDAV_USER'))
+	main.add_argument('-p', '--password', help='password (default: from the url, or PYDAV_PASSWORD)')
+	main.add_argument('-j', '--jobs', type=int, default=4, help='concurrent requests (default: 4)')
+	main.add_argument('-q', '--quiet', action='store_true', help='no progress line')
+	main.add_argument('-v', '--verbose', action='store_true')
+	commands = main.add_subparsers(dest='command')
+
+	command = commands.add_parser('ls', help='list a collection')
+	command.add_argument('-R', '--recursive', action='store_true')
+	command.add_argument('url')
+
+	command = commands.add_parser('get', help='download a file or (-r) a collection')
+	command.add_argument('-r', '--recursive', action='store_true')
+	command.add_argument('source')
+	command.add_argument('destination')
+
+	command = commands.add_parser('put', help='upload a file or (-r) a directory')
+	command.add_argument('-r', '--recursive', action='store_true')
+	command.add_argument('source')
+	command.add_argument('destination')
+
+	command = commands.add_parser('sync', help='upload the new and changed files of a directory')
+	command.add_argument('--delete', action='store_true', help='remove the remote resources missing locally')
+	command.add_argument('source')
+	command.add_argument('destination')
+
+	command = commands.add_parser('rm', help='delete resources')
+	command.add_argument('-r', '--recursive', action='store_true')
+	command.add_argument('urls', nargs='+')
+
+	command = commands.add_parser('du', help='disk usage of a collection')
+	command.add_argument('-d', '--depth', type=int, default=1)
+	command.add_argument('-b', '--bytes', action='store_true', help='sizes in bytes')
+	command.add_argument('url')
+	return main
+
+def main(argv=None, stdout=sys.stdout, stderr=sys.stderr):
+	""" Entry point of the pydav command
+
+		Returns the exit status.
+	"""
+	options = parser().parse_args(argv)
+	cli = Cli(options, stdout, stderr)
+	try:
+		return getattr(cli, options.command)()
+	except (CliError, httplib2.HttpLib2Error, IOError, OSError), error:
+		if isinstance(error, httplib2.HttpLib2Error) and isinstance(error.args[0], list):
+			error = '%s %s' % (error.args[0][0].status, error.args[0][0].reason)
+		stderr.write('pydav %s: %s\n' % (options.command, error))
+		return 1
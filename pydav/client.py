@@ -3,8 +3,24 @@
 
 from connection import Connection
 from answer import Answer
+from cache import ContentCache
+from remotefile import RemoteFile, WritableRemoteFile
+from sync import ChangeFeed
+from listing import Listing, DEFAULT_PROPERTIES
+from du import DiskUsageWalker
+from bulk import BulkOperation
+from lock import LockManager
+from checksum import Checksums
+from multiget import MultiGet
+from proppatch import BulkPropPatch
+from watch import Watcher
+from dedup import UploadCache, UploadResult
+from workers import ConnectionPool, TaskPool
 import os
 import urllib
+import threading
+import urlparse
+import posixpath
 import httplib2#fimxe: this is imported only for exceptions
 
 class Client(object):
@@ -24,6 +40,23 @@ class Client(object):
 			self._maxChunkSize = settings['maxChunkSize']
 		else:
 			self._maxChunkSize = 100000000#100MB
+		if settings.get('cacheDir'):
+			self.cache = ContentCache(settings['cacheDir'],
+									  settings.get('cacheMaxSize', 500000000))
+		else:
+			self.cache = None
+		self._locks = None
+		# integrity checks: algorithms computed on every transfer, the one
+		# sent as OC-Checksum (ownCloud), and whether ETags are body MD5s
+		self._checksums = settings.get('checksums', ['MD5'])
+		self._checksumHeader = settings.get('checksumHeader')
+		self._checksumETag = settings.get('checksumETag', False)
+		# upload deduplication: SQLite database of the local file digests
+		# and of the contents last written
+		if settings.get('uploadCache'):
+			self.dedup = UploadCache(settings['uploadCache'])
+		else:
+			self.dedup = None
 	
 	def mkdir(self, path):
 		self.connection.send_mkcol(urllib.quote(path))
@@ -88,9 +121,32 @@ class Client(object):
 		else:
 			raise httplib2.HttpLib2Error([resp, prop])
 	
+	def setPropertiesMany(self, updates, workers=4, namespaces=None):
+		""" Set and remove properties of many resources, with concurrent
+			PROPPATCH requests. See BulkPropPatch.
+
+			:param updates: (path, changes) tuples. changes map property names ("displayname", "{namespace}name") to their new value, None to remove them
+			:type  updates: List
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+
+			:param namespaces: Prefix -> namespace of the prefixes to use in the requests
+			:type  namespaces: Dict
+
+			Returns a list of PropPatchResult, in the same order.
+		"""
+		operation = BulkPropPatch(self.connection, workers, namespaces)
+		return operation.run((urllib.quote(path), changes) for path, changes in updates)
+
 	def getFile(self, path, local_file_name,
-				 extra_headers={}):
+				 extra_headers={}, etag=None, checksums=None):
 		""" Download file
+			When the client was set up with a "cacheDir", bodies are kept in
+			a local cache and revalidated with conditional requests: a 304
+			answer is served from disk.
+			Checksums of the body are computed as it is written and compared
+			with the ones reported by the server (see Checksums.verify).
 
 			:param path: the path of the resource / collection minus the host section
 			:type path: String
@@ -101,23 +157,111 @@ class Client(object):
 			:param extra_headers: Add any extra headers for the request here
 			:type extra_headers: Dict
 
+			:param etag: Known current ETag of the resource, typically the "getetag" property from a PROPFIND. If the cached copy has the same ETag, no request is sent at all
+			:type etag: String
+
+			:param checksums: Checksums object to feed. One with the "checksums" algorithms of the settings by default
+			:type checksums: Checksums
+
+			Returns the Checksums of the downloaded body, None when it was served from the cache.
+
 		"""
 		path = urllib.quote(path)
+		if checksums is None:
+			checksums = Checksums(self._checksums)
+		if self.cache is not None:
+			return self._getFileCached(path, local_file_name, extra_headers, etag, checksums)
 		resp, data = self.connection.send_get(path, headers=extra_headers)
-		file_fd = open(local_file_name, 'w')
-		file_fd.write(data)
-		file_fd.close()
+		self._writeChecked(resp, data, local_file_name, checksums)
+		return checksums
+
+	def _writeChecked(self, resp, data, local_file_name, checksums):
+		# written next to the target and renamed once verified: a corrupt
+		# body never replaces a good copy
+		checksums.update(data)
+		tmp = local_file_name + '.%d.tmp' % threading.current_thread().ident
+		try:
+			file_fd = open(tmp, 'wb')
+			file_fd.write(data)
+			file_fd.close()
+			if resp.status >= 200 and resp.status < 300:
+				checksums.verify(resp, self._checksumETag, partial=resp.status == 206)
+			os.rename(tmp, local_file_name)
+		except:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+			raise
+
+	def _getFileCached(self, path, local_file_name, extra_headers, etag, checksums):
+		url = self.connection.get_uri(path)
+		meta = self.cache.lookup(url)
+		if meta is not None and etag and meta['etag'] == etag:
+			if self.cache.copy_to(url, local_file_name):
+				return None
+
+		headers = dict(extra_headers)
+		headers.update(self.cache.conditional_headers(url))
+		resp, data = self.connection.send_get(path, headers=headers)
+		if resp.status == 304:
+			if self.cache.copy_to(url, local_file_name):
+				return None
+			#evicted in the meantime: fetch it again, unconditionally
+			resp, data = self.connection.send_get(path, headers=extra_headers)
+		if resp.status < 200 or resp.status >= 300:
+			raise httplib2.HttpLib2Error([resp, data])
+
+		self._writeChecked(resp, data, local_file_name, checksums)
+		if resp.status == 200:
+			self.cache.store(url, data, resp.get('etag'), resp.get('last-modified'))
+		return checksums
 	
-	def _sendFileChunk(self, path, local_file_path, begin, chunksize, filesize, extra_headers={}):
+	def open(self, path, mode='r', **options):
+		""" Open a remote resource as a seekable file-like object.
+			In read mode, only the byte ranges actually read are downloaded.
+			In write modes, only the modified byte ranges are uploaded.
+
+			:param path: the path of the resource minus the host section
+			:type  path: String
+
+			:param mode: 'r' (default) to read, 'w' to truncate and write, 'a' to append or 'r+' to update in place
+			:type  mode: String
+
+			:param options: See RemoteFile (read mode) and WritableRemoteFile (write modes)
+			:type  options: Dict
+
+			Returns a RemoteFile or a WritableRemoteFile.
+
+		"""
+		path = urllib.quote(path)
+		if mode in ('r', 'rb'):
+			return RemoteFile(self.connection, path, **options)
+		return WritableRemoteFile(self.connection, path, mode.replace('b', ''), **options)
+
+	def _sendFileChunk(self, path, local_file_path, begin, chunksize, filesize, extra_headers={},
+					   checksums=None, last=False, connection=None):
 		local_file_fd = open(local_file_path, 'r')
 		local_file_fd.seek(begin, os.SEEK_SET)
 		data = local_file_fd.read(chunksize)
-		
-		resp, contents = self.connection.send_put_partial(path, data, begin, filesize, headers=extra_headers)
+		local_file_fd.close()
+
+		# Content-MD5 covers this request body only
+		headers = dict(extra_headers)
+		if 'MD5' in [algorithm.upper() for algorithm in self._checksums]:
+			chunk_checksums = Checksums(['MD5'])
+			chunk_checksums.update(data)
+			headers.update(chunk_checksums.headers())
+		if checksums is not None:
+			checksums.update(data)
+			if last and self._checksumHeader:
+				headers['OC-Checksum'] = checksums.oc_checksum(self._checksumHeader)
+		connection = connection or self.connection
+		resp, contents = connection.send_put_partial(path, data, begin, filesize, headers=headers)
 		if resp.status >= 200 and resp.status < 300:
+			if checksums is not None and last:
+				checksums.verify(resp, self._checksumETag, content_md5=False)
 			return resp, contents
 		else:
-			raise httplib2.HttpLib2Error([resp, prop])
+			raise httplib2.HttpLib2Error([resp, contents])
 	
 	def sendFileChunk(self, path, local_file_path, begin, chunksize, extra_headers={}):
 		""" Send file chunk. This method may be used to resume uploads or
@@ -136,8 +280,12 @@ class Client(object):
 		path = urllib.quote(path)
 		return self._sendFileChunk(path, local_file_path, begin, chunksize, filesize, extra_headers)
 	
-	def sendFile(self, path, local_file_path, initial_offset=0, extra_headers={}):
+	def sendFile(self, path, local_file_path, initial_offset=0, extra_headers={}, checksums=None,
+				 progress=None):
 		""" Send file
+			Checksums are computed while the file is read and sent along as
+			Content-MD5 and, with a "checksumHeader" setting, OC-Checksum
+			headers. They are then compared with the ones the server reports.
 
 			:param path: the path of the resource / collection minus the host section
 			:type  path: String
@@ -151,28 +299,131 @@ class Client(object):
 			:param extra_headers: Additional headers may be added here
 			:type  extra_headers: Dict
 
+			:param checksums: Checksums object to feed. One with the "checksums" algorithms of the settings by default. Whole file checksums are not available when resuming
+			:type  checksums: Checksums
+
+			:param progress: Called with the number of bytes sent so far and the file size, after each request. See TransferScheduler for queued transfers
+			:type  progress: Callable
+
+			With an "uploadCache" setting, the upload is skipped when the
+			server already has the content: the answer is then the one of
+			the HEAD request checking it.
+
 		"""
-		filesize = os.stat(local_file_path).st_size
 		path = urllib.quote(path)
+		if self.dedup is not None and not initial_offset:
+			digest = self.dedup.candidate(self.connection.get_uri(path), local_file_path, self._checksumETag)
+			if digest is not None and 'HEAD' in self.connection.methods:
+				resp = self.connection.send_head(path)
+				if resp.status == 200 and self.dedup.unchanged(
+						self.connection.get_uri(path), digest, resp.get('etag'),
+						resp.get('oc-checksum'), self._checksumETag):
+					self.dedup.skipped += 1
+					return resp, ''
+		return self._sendFile(self.connection, path, local_file_path, initial_offset, extra_headers, checksums,
+							  progress)
+
+	def _sendFile(self, connection, path, local_file_path, initial_offset=0, extra_headers={}, checksums=None,
+				  progress=None):
+		stat = os.stat(local_file_path)
+		filesize = stat.st_size
+		if checksums is None:
+			checksums = Checksums(self._checksums)
 		
 		if filesize < self._maxChunkSize and not initial_offset:#small enough file. I keep it separate as this is the safest upload method
 			local_file_fd = open(local_file_path, 'r')
 			local_file_fd.seek(initial_offset, os.SEEK_SET)
 			data = local_file_fd.read()
-			resp, contents = self.connection.send_put(path, data, headers=extra_headers)
+			local_file_fd.close()
+			checksums.update(data)
+			headers = dict(extra_headers)
+			headers.update(checksums.headers(self._checksumHeader))
+			resp, contents = connection.send_put(path, data, headers=headers)
+			if resp.status >= 200 and resp.status < 300:
+				checksums.verify(resp, self._checksumETag, content_md5=False)
+				self._recordUpload(connection, path, local_file_path, stat, checksums, resp)
+				if progress is not None:
+					progress(filesize, filesize)
 			return resp, contents
 		
-		#big files and resume cases
-		local_file_fd = open(local_file_path, 'r')
-		local_file_fd.seek(initial_offset, os.SEEK_SET)
+		#big files and resume cases. The bytes before initial_offset are not
+		#read again: no whole file checksum when resuming
+		if initial_offset:
+			checksums = None
 		cursor = initial_offset
 		while cursor < filesize-1:
 			chunksize = min(filesize-cursor, self._maxChunkSize)
-			print '\tsent '+str(cursor)+' of '+str(filesize)+' bytes\r',
-			resp, contents = self._sendFileChunk(path, local_file_path, cursor, chunksize, filesize, extra_headers)
+			resp, contents = self._sendFileChunk(path, local_file_path, cursor, chunksize, filesize, extra_headers,
+												 checksums, cursor + chunksize >= filesize, connection)
 			cursor += chunksize
+			if progress is not None:
+				progress(cursor, filesize)
 		
+		if self.dedup is not None and filesize:
+			self._recordUpload(connection, path, local_file_path, stat, checksums, resp)
 		return resp, contents#of the last one :/
+
+	def _recordUpload(self, connection, path, local_file_path, stat, checksums, resp):
+		if self.dedup is None:
+			return
+		if checksums is not None and 'MD5' in checksums.hashes and os.stat(local_file_path).st_mtime == stat.st_mtime:
+			digest = checksums.hexdigest('MD5')
+			self.dedup.store_digest(stat, digest)#computed while sending: no need to hash it again
+		else:
+			digest = self.dedup.digest(local_file_path)
+		self.dedup.record(connection.get_uri(path), digest, resp.get('etag'))
+
+	def sendFiles(self, files, extra_headers={}, workers=4):
+		""" Send many files concurrently, like sendFile.
+			With an "uploadCache" setting, the files whose content might
+			already be on the server are checked with one PROPFIND per
+			collection rather than one HEAD per file.
+
+			:param files: (path, local_file_path) pairs
+			:type  files: List
+
+			:param extra_headers: Additional headers may be added here
+			:type  extra_headers: Dict
+
+			:param workers: Number of concurrent uploads. 4 by default
+			:type  workers: Integer
+
+			Returns the list of UploadResult, in the order of files. Raises the first upload error.
+		"""
+		files = [(urllib.quote(path), local_file_path) for path, local_file_path in files]
+		results = [None] * len(files)
+		if self.dedup is not None:
+			candidates = {}
+			for index, (path, local_file_path) in enumerate(files):
+				digest = self.dedup.candidate(self.connection.get_uri(path), local_file_path, self._checksumETag)
+				if digest is not None:
+					parent = posixpath.dirname(path.rstrip('/')) + '/'
+					candidates.setdefault(parent, []).append((index, digest))
+			for parent, found in sorted(candidates.items()):
+				resp, content = self.connection.send_propfind(parent, ['getetag'], 1, raw=True)
+				if resp.status < 200 or resp.status >= 300:
+					continue
+				listing = Listing.parse(content)
+				etags = dict((urllib.unquote(href), etag) for href, etag in zip(listing.hrefs, listing.etags))
+				for index, digest in found:
+					url = self.connection.get_uri(files[index][0])
+					etag = etags.get(urllib.unquote(urlparse.urlparse(url).path))
+					if etag is not None and self.dedup.unchanged(url, digest, etag, md5_etags=self._checksumETag):
+						self.dedup.skipped += 1
+						results[index] = UploadResult(urllib.unquote(files[index][0]), 207, etag, True)
+
+		pool = ConnectionPool(self.connection)
+		tasks = TaskPool(workers)
+		def send(index, path, local_file_path):
+			resp, contents = self._sendFile(pool.get(), path, local_file_path, extra_headers=extra_headers)
+			if resp.status < 200 or resp.status >= 300:
+				raise httplib2.HttpLib2Error([resp, contents])
+			results[index] = UploadResult(urllib.unquote(path), resp.status, resp.get('etag'), False)
+		for index, (path, local_file_path) in enumerate(files):
+			if results[index] is None:
+				tasks.submit(send, index, path, local_file_path)
+		tasks.join()
+		return results
 						
 
 	def cp(self, resource_path, resource_destination, allow_overwrite=False, maxdepth=-1):
@@ -210,11 +461,85 @@ class Client(object):
 			:type  allow_overwrite: Boolean
 
 		"""
-		resp, contents = self.connection.send_copy(resource_path,
+		resp, contents = self.connection.send_move(resource_path,
 		                                           resource_destination,
 		                                           allow_overwrite)
 		return resp, contents
 
+	def copyMany(self, sources, destination, allow_overwrite=False, maxdepth=-1, workers=4):
+		""" Copy many resources into a collection, server side. Requests are
+			sent concurrently; copying all the members of a collection into a
+			new one is done with a single request.
+
+			:param sources: Paths or glob patterns (such as "data/*.csv"), or (source, destination) tuples
+			:type  sources: List
+
+			:param destination: Destination collection. Ignored for tuples
+			:type  destination: String
+
+			:param allow_overwrite: Allow the destination resources to be overwritten if they already exist. Defaults to False.
+			:type  allow_overwrite: Boolean
+
+			:param maxdepth: Specify the maximum depth for collection copies. Infinity(-1) by default.
+			:type  maxdepth: Integer
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+
+			Returns a list of BulkResult, including per member failures of 207 answers.
+
+		"""
+		operation = BulkOperation(self.connection, workers)
+		return operation.run('COPY', sources, destination, allow_overwrite, maxdepth)
+
+	def moveMany(self, sources, destination, allow_overwrite=False, workers=4):
+		""" Move many resources into a collection, server side. See copyMany.
+
+			:param sources: Paths or glob patterns (such as "data/*.csv"), or (source, destination) tuples
+			:type  sources: List
+
+			:param destination: Destination collection. Ignored for tuples
+			:type  destination: String
+
+			:param allow_overwrite: Allow the destination resources to be overwritten if they already exist. Defaults to False.
+			:type  allow_overwrite: Boolean
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+
+			Returns a list of BulkResult, including per member failures of 207 answers.
+
+		"""
+		operation = BulkOperation(self.connection, workers)
+		return operation.run('MOVE', sources, destination, allow_overwrite)
+
+	def getMany(self, path, hrefs, kind=None, batch=100, workers=4):
+		""" Get the content of many small resources of a collection (CardDAV
+			address book, CalDAV calendar) with multiget REPORTs, or with
+			concurrent GETs when the server has none. See MultiGet.
+
+			:param path: the path of the collection minus the host section
+			:type  path: String
+
+			:param hrefs: hrefs of the resources, as found in the href of the ResourceProperties returned by ls
+			:type  hrefs: List
+
+			:param kind: "addressbook" or "calendar". Guessed from the server capabilities by default
+			:type  kind: String
+
+			:param batch: Number of resources per REPORT. 100 by default
+			:type  batch: Integer
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+
+			Returns the list of FetchedResource (href, status, etag, data), in the order of hrefs.
+		"""
+		path = urllib.quote(path)
+		if path and path[-1] != '/':
+			path += '/'
+		return MultiGet(self.connection, kind, batch, workers).fetch(path, hrefs)
+
 	def ls(self, path, maxdepth=1):
 		""" List content of a collection. May do it recursively if supported on the server side (not SABRE for instance ...)
 			This is a helper function in top of getProperties. It maps all set of
@@ -233,6 +558,112 @@ class Client(object):
 			files[prop.href] = prop
 		return files
 	
+	def lsColumns(self, path, maxdepth=1, properties=DEFAULT_PROPERTIES, extra=(), numpy=False):
+		""" List content of a collection as a columnar Listing: parallel arrays
+			of hrefs, sizes, mtimes, collection flags and etags. Only the
+			projected properties are requested and no ResourceProperties
+			object is built, which makes it suitable for huge collections.
+
+			:param path: Base path
+			:type  path: String
+
+			:param maxdepth: Specify the maximum depth of the listing. 1 by default.
+			:type  maxdepth: Integer
+
+			:param properties: Properties to request. Defaults to resourcetype, getcontentlength, getlastmodified and getetag
+			:type  properties: List
+
+			:param extra: Additional properties to request and keep as raw values, DAV: names or "{namespace}name"
+			:type  extra: List
+
+			:param numpy: Return the columns as NumPy arrays. Defaults to False
+			:type  numpy: Boolean
+
+			Returns a Listing.
+
+		"""
+		path = urllib.quote(path)
+		if path and path[-1] != '/':
+			path += '/'
+
+		resp, content = self.connection.send_propfind(path, list(properties) + list(extra),
+													  maxdepth, raw=True)
+		if resp.status < 200 or resp.status >= 300:
+			raise httplib2.HttpLib2Error([resp, content])
+		listing = Listing.parse(content, extra)
+		if numpy:
+			listing.to_numpy()
+		return listing
+
+	def du(self, path, depth=1, workers=4, use_quota=True):
+		""" Measure the disk usage of a collection. Uses the RFC 4331
+			quota-used-bytes property when the server reports it, otherwise
+			walks the subtree with concurrent PROPFIND requests.
+
+			:param path: Base path
+			:type  path: String
+
+			:param depth: Depth of the per-collection breakdown. 1 by default, 0 for the total only
+			:type  depth: Integer
+
+			:param workers: Number of concurrent requests for the walk. 4 by default
+			:type  workers: Integer
+
+			:param use_quota: Trust quota-used-bytes when available. Defaults to True
+			:type  use_quota: Boolean
+
+			Returns a DiskUsage.
+
+		"""
+		walker = DiskUsageWalker(self.connection, workers, use_quota)
+		return walker.du(urllib.quote(path), depth)
+
+	def changes(self, path, state=None, level=1, limit=None, properties=['getetag']):
+		""" Iterate over what changed in a collection since the last call,
+			using the RFC 6578 sync-collection REPORT. Only the delta is
+			transferred.
+
+			:param path: Base path of the collection
+			:type  path: String
+
+			:param state: Where the sync-token is kept between calls: SyncState object or path to its SQLite database
+			:type  state: SyncState or String
+
+			:param level: 1 for the immediate members only, -1 for the whole subtree
+			:type  level: Integer
+
+			:param limit: Maximum number of results per REPORT request. Unlimited by default
+			:type  limit: Integer
+
+			:param properties: DAV: properties to get for added and changed members
+			:type  properties: List
+
+			Returns a generator of Change(kind, href, properties), kind being "added", "changed" or "removed".
+
+		"""
+		feed = ChangeFeed(self.connection, urllib.quote(path), state, level,
+						  limit, properties)
+		return feed.changes()
+
+	def watch(self, path, callback=None, initial=False):
+		""" Get a Watcher reporting the changes of a subtree between polls.
+			Only the collections whose ctag (or etag) changed are listed
+			again, so a poll costs one request when nothing changed.
+
+			:param path: Base path of the watched subtree
+			:type  path: String
+
+			:param callback: Called with each WatchEvent(kind, path, collection), kind being "created", "modified" or "deleted"
+			:type  callback: Callable
+
+			:param initial: Report every resource as created on the first poll. Defaults to False
+			:type  initial: Boolean
+
+			Returns the Watcher: call poll() periodically, or iterate over watch(interval).
+
+		"""
+		return Watcher(self, path, callback, initial)
+
 	def rm(self, path):
 		""" Delete resource. The resource may either be a collection (folder)
 			or a file. If this is a folder, all content will be deleted recursively.
@@ -253,17 +684,24 @@ class Client(object):
 		"""
 		return self.deleteResource(path)
 
-# ------------------------------------------- NOT YET IMPLEMENTED -------------------------------- #
-	def getLock(self, path):
-		""" Get a file lock
+	def getLock(self, path, timeout=600, maxdepth=0):
+		""" Get a lock, refreshed in the background until released. While it
+			is held, writes through this client send its token automatically.
+			Locking an already locked path returns the held lock.
 
 			:param path: the path of the resource / collection minus the host section
 			:type path: String
 
+			:param timeout: Requested lock timeout in seconds. 600 by default
+			:type  timeout: Integer
+
+			:param maxdepth: 0 to lock the resource only, -1 to lock a collection and its whole content
+			:type  maxdepth: Integer
+
+			Returns the LockToken.
+
 		"""
-		lock = self.connection.send_lock(path)
-		self.connection.locks[path] = LockToken(lock)
-		return lock
+		return self.locks.acquire(urllib.quote(path), timeout, maxdepth)
 
 	def releaseLock(self, path):
 		""" Release a file lock
@@ -271,13 +709,25 @@ class Client(object):
 			:param path: the path of the resource / collection minus the host section
 			:type path: String
 
+			Returns the UNLOCK response, False if no lock was held on path.
+
 		"""
-		# If there's not a lock recorded, return false for now. We should
-		# really raise an exception to make it more obvious.
-		if not self.connection.locks.get(path):
+		resp = self.locks.release(urllib.quote(path))
+		if resp is None:
 			return False
-		resp, cont = self.connection.send_unlock(path, self.connection.locks[path])
-		# remove from our dictionary if the lock was released successfully
-		if resp >= 200 and resp < 300:
-			del self.connection.locks[path]
 		return resp
+
+	@property
+	def locks(self):
+		""" The LockManager of this client, created on first use
+		"""
+		if self._locks is None:
+			self._locks = LockManager(self.connection)
+		return self._locks
+
+	def close(self):
+		""" Release every held lock
+		"""
+		if self._locks is not None:
+			self._locks.close()
+			self._locks = None
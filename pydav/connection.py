@@ -1,8 +1,13 @@
 """ Connection Module
 """
+import re
 import httplib2
+import threading
 import parse
+from lxml import etree
 from answer import Answer
+from transport import make_transport, clone_transport
+from auth import Authenticator
 
 #TODO
 # * detection of the server type
@@ -11,6 +16,57 @@ from answer import Answer
 
 class MethodNotAvailable(httplib2.HttpLib2Error): pass
 
+# Paths get_uri may append to the base url without urljoin
+_PLAIN_PATH = re.compile('^(?!//)[^:?#;]*$')
+
+# Methods modifying resources: they get the If header of the held locks
+WRITE_METHODS = ('PUT', 'PATCH', 'DELETE', 'MKCOL', 'PROPPATCH', 'COPY', 'MOVE')
+
+class Capabilities(object):
+	""" What the server supports, detected with one OPTIONS request and
+		shared by a connection and all its clones: only the first of them to
+		need it sends the request, the others wait for its answer.
+	"""
+	def __init__(self):
+		self.methods = None
+		self.dav = None
+		self.server = None
+		self._lock = threading.Lock()
+
+	@property
+	def detected(self):
+		return self.methods is not None
+
+	def detect(self, connection):
+		""" Detect the capabilities through connection, unless done already
+		"""
+		with self._lock:
+			if self.detected:
+				return
+			resp, content = connection.send_options()
+
+			# Get list of supported methods
+			if resp.get('allow'):
+				methods = resp['allow'].split(", ")
+			else:
+				methods = []
+
+			# DAV compliance classes ("addressbook", "calendar-access"...)
+			self.dav = [c.strip().lower() for c in resp.get('dav', '').split(',') if c.strip()]
+
+			# Try to detect "sabredav-partialupdate"
+			if resp.get('dav') and resp['dav'].find("sabredav-partialupdate") > -1:
+				methods.append("PATCH")
+
+			# Try to guess the server type
+			if resp.get('x-sabre-version'):
+				self.server = "sabre"
+			elif resp.get('dav'):
+				self.server = "apache"
+			else:
+				self.server = "generic"
+			self.methods = methods
+
 class Connection(object):
 	""" Connection object
 	"""
@@ -32,13 +88,58 @@ class Connection(object):
 		self.path = settings['path']
 		self.port = settings['port']
 		self.locks = {}
+		self.lock_manager = None
+		self._base_for = None
 
-		# Make an http object for this connection
-		self.httpcon = httplib2.Http()
-		self.httpcon.add_credentials(self.username, self.password)
+		# Challenges are answered here rather than by the transport, once
+		# for this connection and all its clones ("auth": "basic" sends
+		# credentials from the first request)
+		self.auth = Authenticator(self.username, self.password, settings.get('auth'))
+
+		# Make an http object (transport) for this connection
+		self.httpcon = make_transport(settings)
 		
-		# Detect server capabilities at root
+		# Detect server capabilities at root. With the "lazy" setting, they
+		# are detected on first use instead: no request is sent before the
+		# first real one
+		self.capabilities = Capabilities()
+		if not settings.get('lazy'):
+			self._detect_capabilities()
+
+	@property
+	def methods(self):
+		self._detect_capabilities()
+		return self.capabilities.methods
+
+	@property
+	def dav(self):
+		self._detect_capabilities()
+		return self.capabilities.dav
+
+	@property
+	def server(self):
 		self._detect_capabilities()
+		return self.capabilities.server
+
+	def _allows(self, method):
+		""" Whether a method may be sent. Before the capabilities are
+			detected, every method is tried rather than probing the server.
+		"""
+		if not self.capabilities.detected:
+			return True
+		return method in self.capabilities.methods
+
+	def clone(self):
+		""" Get a new Connection to the same server with its own http object.
+			httplib2 is not thread safe: each thread must use its own clone.
+			Capabilities are shared: they are detected once for all. A multiplexed
+			(HTTP/2) http object is thread safe and shared instead. The
+			authentication state is shared too, so clones are not challenged.
+		"""
+		other = object.__new__(self.__class__)
+		other.__dict__.update(self.__dict__)
+		other.httpcon = clone_transport(self.httpcon)
+		return other
 	
 	def _send_request(self, request_method, path, body='', headers={}):
 		""" Send a request over http to the webdav server
@@ -56,35 +157,59 @@ class Connection(object):
 			:type headers: Dict
 
 		"""
-		uri = httplib2.urlparse.urljoin(self.host, self.path)
-		uri = httplib2.urlparse.urljoin(uri, path)
+		uri = self.get_uri(path)
+		if self.lock_manager is not None and request_method in WRITE_METHODS:
+			condition = self.lock_manager.if_header(uri, headers.get('Destination'))
+			if condition and 'If' not in headers:
+				headers = dict(headers)
+				headers['If'] = condition
+		if uri.startswith(self._origin + '/'):
+			target = uri[len(self._origin):]
+		else:
+			parsed = httplib2.urlparse.urlsplit(uri)
+			target = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+		sent = self.auth.headers(request_method, target)
+		if sent:
+			headers = dict(sent, **headers)
 		try:
 			resp, content = self.httpcon.request(uri, request_method,
 												 body=body, headers=headers)
+			# a streamed body can not be sent again
+			if self.auth.response(resp, sent) and not hasattr(body, 'read'):
+				sent = self.auth.headers(request_method, target)
+				headers = dict(headers, **sent)
+				resp, content = self.httpcon.request(uri, request_method,
+													 body=body, headers=headers)
+				self.auth.response(resp, sent, first=False)
 		except httplib2.ServerNotFoundError:
 			raise
 		return resp, content
 	
+	def get_uri(self, path):
+		""" Build the full uri of a resource
+
+			:param path: The path (without host) to the resource
+			:type path: String
+
+		"""
+		if self._base_for != (self.host, self.path):
+			self._base = httplib2.urlparse.urljoin(self.host, self.path)
+			parsed = httplib2.urlparse.urlsplit(self._base)
+			self._origin = '%s://%s' % (parsed.scheme, parsed.netloc)
+			self._base_for = (self.host, self.path)
+		# plain paths are appended to the precomputed base, anything else
+		# (dot segments, scheme, query...) goes through urljoin
+		if not path:
+			return self._base
+		if _PLAIN_PATH.match(path) and '/.' not in '/' + path:
+			if path[0] == '/':
+				return self._origin + path
+			if self._base[-1] == '/':
+				return self._base + path
+		return httplib2.urlparse.urljoin(self._base, path)
+
 	def _detect_capabilities(self):
-		resp, content = self.send_options()
-		
-		# Get list of supported methods
-		if resp['allow']:
-			self.methods = resp['allow'].split(", ")
-		else:
-			self.methods = []
-			
-		# Try to detect "sabredav-partialupdate"
-		if resp['dav'] and resp['dav'].find("sabredav-partialupdate") > -1:
-			self.methods.append("PATCH")
-		
-		# Try to guess the server type
-		if resp['x-sabre-version']:
-			self.server = "sabre"
-		elif resp['DAV']:
-			self.server = "apache"
-		else:
-			self.server = "generic"
+		self.capabilities.detect(self)
 	
 	def send_options(self):
 		""" Send an OPTION request
@@ -112,7 +237,7 @@ class Connection(object):
 			:type path: String
 
 		"""
-		if 'DELETE' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('DELETE'): raise MethodNotAvailable()
 		try:
 			resp, content = self._send_request('DELETE', path)
 			return resp, content
@@ -129,7 +254,7 @@ class Connection(object):
 			:type headers: Dict
 
 		"""
-		if 'HEAD' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('HEAD'): raise MethodNotAvailable()
 		try:
 			resp, content = self._send_request('HEAD', path, headers=headers)
 			return resp
@@ -150,7 +275,7 @@ class Connection(object):
 			:type headers: Dict
 
 		"""
-		if 'GET' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('GET'): raise MethodNotAvailable()
 		try:
 			resp, content = self._send_request('GET', path, headers=headers)
 			return resp, content
@@ -184,8 +309,9 @@ class Connection(object):
 		
 		#compute end:
 		end = begin + len(body) - 1
-		if end > filesize:
+		if end >= filesize:
 			raise httplib2.ServerNotFoundError
+		headers = dict(headers)
 			
 		#We have 3 options here:
 		# * the server supports the PATCH method (recommended)
@@ -194,12 +320,12 @@ class Connection(object):
 		
 		if 'PATCH' in self.methods:
 			if begin == 0:
-				return self.send_put(path, body)
+				return self.send_put(path, body, headers)
 			else:
 				headers['X-Update-Range'] = "bytes="+str(begin)+"-"+str(end)
 				return self.send_patch(path, body, headers)
 		else: 
-			headers['Content-Range'] = "bytes="+str(begin)+"-"+str(end)+"/"+str(filesize)
+			headers['Content-Range'] = "bytes "+str(begin)+"-"+str(end)+"/"+str(filesize)
 			return self.send_put(path, body, headers)
 	
 	def send_patch(self, path, body, headers={}):
@@ -216,7 +342,8 @@ class Connection(object):
 			:type  headers: Dict
 
 		"""
-		if 'PATCH' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('PATCH'): raise MethodNotAvailable()
+		headers = dict(headers)
 		headers['Content-Type'] = "application/x-sabredav-partialupdate"
 		try:
 			resp, content = self._send_request('PATCH', path, body=body, headers=headers)
@@ -242,27 +369,30 @@ class Connection(object):
 			:type  headers: Dict
 
 		"""
-		if 'PUT' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('PUT'): raise MethodNotAvailable()
 		try:
 			resp, content = self._send_request('PUT', path, body=body, headers=headers)
 			return resp, content
 		except httplib2.ServerNotFoundError:
 			raise
 
-	def send_propfind(self, path, properties=[], maxdepth=1, extra_headers={}):
+	def send_propfind(self, path, properties=[], maxdepth=1, extra_headers={}, raw=False):
 		""" Send a PROPFIND request
 
 			:param path: Path (without host) to the resource from which the properties are required
 			:type path: String
 
-			:param body: The body of the request
-			:type body: String
+			:param properties: Names of the properties to get. Either a DAV: property name or "{namespace}name". All properties if empty
+			:type properties: List
 
 			:param extra_headers: Additional headers for the request may be added here
 			:type extra_headers: Dict
 
+			:param raw: Return the raw XML content instead of an Answer. Defaults to False
+			:type raw: Boolean
+
 		"""
-		if 'PROPFIND' not in self.methods: 
+		if not self._allows('PROPFIND'): 
 			raise MethodNotAvailable()
 		# Build body
 		body = '<?xml version="1.0" encoding="utf-8" ?>'
@@ -270,7 +400,11 @@ class Connection(object):
 		if properties:
 			body += '<D:prop>'
 			for prop in properties:
-				body += '<D:' + prop + '/>'
+				if prop.startswith('{'):
+					ns, name = prop[1:].split('}', 1)
+					body += '<' + name + ' xmlns="' + ns + '"/>'
+				else:
+					body += '<D:' + prop + '/>'
 			body += '</D:prop>'
 		else:
 			body += '<D:allprop/>'
@@ -283,53 +417,126 @@ class Connection(object):
 			headers.update(extra_headers)
 			resp, content = self._send_request('PROPFIND', path, body=body,
 											   headers=headers)
+			if raw:
+				return resp, content
 			return resp, Answer(content)
 		except httplib2.ServerNotFoundError:
 			raise
 
-	def send_proppatch(self, path, properties,extra_headers={}):
+	def send_proppatch(self, path, properties,extra_headers={}, raw=False):
 		""" Send a PROPPATCH request
 
 			:param path: Path (without host) to the resource from which the properties are required
 			:type path: String
 
-			:param body: The body of the request
-			:type body: String
+			:param properties: The edited properties, or the "propertyupdate" body of the request
+			:type properties: ResourceProperties or String
 
 			:param extra_headers: Additional headers for the request may be added here
 			:type extra_headers: Dict
 
+			:param raw: Return the raw XML content instead of an Answer. Defaults to False
+			:type raw: Boolean
+
 		"""
-		if 'PROPPATCH' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('PROPPATCH'): raise MethodNotAvailable()
 		body  = '<?xml version="1.0" encoding="utf-8" ?>'
-		body += properties.buildProppatch()
+		if isinstance(properties, basestring):
+			body += properties
+		else:
+			body += properties.buildProppatch()
 		
 		try:
 			headers = {'Depth':'1'}
 			headers.update(extra_headers)
 			resp, content = self._send_request('PROPPATCH', path, body=body,
 											   headers=headers)
+			if raw:
+				return resp, content
 			return resp, Answer(content)
 		except httplib2.ServerNotFoundError:
 			raise
 
-	def send_lock(self, path):
+	def send_report(self, path, body, depth=0, extra_headers={}, raw=False):
+		""" Send a REPORT request
+
+			:param path: Path (without host) to the resource the report applies to
+			:type path: String
+
+			:param body: The XML body of the request, without the XML declaration
+			:type body: String
+
+			:param depth: Depth header. 0 by default, -1 for none
+			:type depth: Integer
+
+			:param extra_headers: Additional headers for the request may be added here
+			:type extra_headers: Dict
+
+			:param raw: Return the raw XML content instead of an Answer. Defaults to False
+			:type raw: Boolean
+
+			Returns the response and an Answer for 207 multistatus responses,
+			the raw content otherwise.
+
+		"""
+		if not self._allows('REPORT'): raise MethodNotAvailable()
+		body = '<?xml version="1.0" encoding="utf-8" ?>' + body
+
+		try:
+			headers = {'Content-Type': 'application/xml; charset="utf-8"'}
+			if depth > -1:
+				headers['Depth'] = str(depth)
+			headers.update(extra_headers)
+			resp, content = self._send_request('REPORT', path, body=body,
+											   headers=headers)
+			if resp.status == 207 and not raw:
+				return resp, Answer(content)
+			return resp, content
+		except httplib2.ServerNotFoundError:
+			raise
+
+	def send_lock(self, path, timeout=None, refresh_token=None, maxdepth=0):
 		""" Send a LOCK request
 
 			:param path: Path (without host) to the resource to lock
 			:type path: String
 
+			:param timeout: Requested lock timeout in seconds. Left to the server if None
+			:type timeout: Integer
+
+			:param refresh_token: LockToken of a held lock. If given, this lock is refreshed instead of a new one being created
+			:type refresh_token: LockToken
+
+			:param maxdepth: 0 to lock the resource only, -1 to lock a collection and its whole content. 0 by default
+			:type maxdepth: Integer
+
+			Returns the response, its content and the LockToken (None on failure).
+
 		"""
-		if 'LOCK' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('LOCK'): raise MethodNotAvailable()
 		try:
-			body = '<?xml version="1.0" encoding="utf-8" ?>'
-			body += '<D:lockinfo xmlns:D="DAV:"><D:lockscope><D:exclusive/>'
-			body += '</D:lockscope><D:locktype><D:write/></D:locktype><D:owner>'
-			body += '<D:href>%s</D:href>' % httplib2.urlparse.urljoin(
-				self.host, path)
-			body += '</D:owner></D:lockinfo>'
-			resp, content = self._send_request('LOCK', path, body=body)
-			lock_token = LockToken(resp['lock-token'])
+			headers = {}
+			if timeout is not None:
+				headers['Timeout'] = 'Second-%d' % timeout
+			if refresh_token is not None:
+				headers['If'] = '(<%s>)' % refresh_token.bare
+				body = ''
+			else:
+				headers['Depth'] = 'infinity' if maxdepth < 0 else '0'
+				body = '<?xml version="1.0" encoding="utf-8" ?>'
+				body += '<D:lockinfo xmlns:D="DAV:"><D:lockscope><D:exclusive/>'
+				body += '</D:lockscope><D:locktype><D:write/></D:locktype><D:owner>'
+				body += '<D:href>%s</D:href>' % httplib2.urlparse.urljoin(
+					self.host, path)
+				body += '</D:owner></D:lockinfo>'
+			resp, content = self._send_request('LOCK', path, body=body, headers=headers)
+			if resp.status < 200 or resp.status >= 300:
+				return resp, content, None
+			if refresh_token is not None:
+				lock_token = LockToken(refresh_token.token)
+			else:
+				lock_token = LockToken(resp['lock-token'])
+			lock_token.parse_discovery(content)
 			return resp, content, lock_token
 		except httplib2.ServerNotFoundError:
 			raise
@@ -344,9 +551,9 @@ class Connection(object):
 			:type lock_token: LockToken
 
 		"""
-		if 'UNLOCK' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('UNLOCK'): raise MethodNotAvailable()
 		try:
-			headers = {'Lock-Token': lock_token.token}
+			headers = {'Lock-Token': '<%s>' % lock_token.bare}
 			body = '<?xml version="1.0" encoding="utf-8" ?>'
 			body += '<D:lockinfo xmlns:D="DAV:"><D:lockscope><D:exclusive/>'
 			body += '</D:lockscope><D:locktype><D:write/></D:locktype><D:owner>'
@@ -389,10 +596,10 @@ class Connection(object):
 			:type  maxdepth: Integer
 
 		"""
-		if 'COPY' not in self.methods: raise MethodNotAvailable()
+		if not self._allows('COPY'): raise MethodNotAvailable()
 		try:
 			headers = {}
-			full_destination = httplib2.urlparse.urljoin(self.host, destination)
+			full_destination = self.get_uri(destination)
 			headers['Destination'] = full_destination
 			if not allow_overwrite : headers['Overwrite'] = "F"
 			if maxdepth > -1       : headers['Depth']     = str(maxdepth)
@@ -404,20 +611,24 @@ class Connection(object):
 	def send_move(self, path, destination, allow_overwrite=False):
 		""" Send a MOVE request
 
-			:param path: Path (without host) to the source resource to copy
+			:param path: Path (without host) to the source resource to move
 			:type  path: String
 
-			:param destination: Path (without host) to the destination of the copied resource
+			:param destination: Path (without host) to the destination of the moved resource
 			:type  destination: String
 						
 			:param allow_overwrite: Allow the destination resource to be overwritten if already exists. Defaults to False.
 			:type  allow_overwrite: Boolean
+
+			Collections are always moved with their whole content (Depth: infinity).
 		"""
+		if not self._allows('MOVE'): raise MethodNotAvailable()
 		try:
 			headers = {}
-			full_destination = httplib2.urlparse.urljoin(self.host, destination)
+			full_destination = self.get_uri(destination)
 			headers['Destination'] = full_destination
 			if not allow_overwrite : headers['Overwrite'] = "F"
+			headers['Depth'] = "infinity"
 			resp, content = self._send_request('MOVE', path, headers=headers)
 			return resp, content
 		except httplib2.ServerNotFoundError:
@@ -429,6 +640,39 @@ class LockToken(object):
 	"""
 	def __init__(self, lock_token):
 		""" Make a lock token
+
+			:param lock_token: Lock-Token header value
+			:type  lock_token: String
 		"""
 		self.token = lock_token
+		self.timeout = None
+		self.depth = '0'
 
+	@property
+	def bare(self):
+		""" The token without its surrounding angle brackets
+		"""
+		return self.token.strip().lstrip('<').rstrip('>')
+
+	def parse_discovery(self, content):
+		""" Read the timeout (in seconds, None if infinite or unknown) and the
+			depth of the lock from a LOCK answer body
+
+			:param content: Body of the LOCK answer
+			:type  content: String
+		"""
+		if not content:
+			return
+		try:
+			root = etree.XML(content)
+		except etree.XMLSyntaxError:
+			return
+		for active in root.iter('{DAV:}activelock'):
+			token = active.findtext('{DAV:}locktoken/{DAV:}href')
+			if token is not None and token.strip() != self.bare:
+				continue
+			timeout = (active.findtext('{DAV:}timeout') or '').strip()
+			if timeout.lower().startswith('second-'):
+				self.timeout = int(timeout[7:])
+			self.depth = (active.findtext('{DAV:}depth') or self.depth).strip()
+			return
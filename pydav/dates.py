@@ -0,0 +1,143 @@
+""" Dates Module
+
+	Fast parsing of the WebDAV date properties: RFC 1123 for
+	"getlastmodified", ISO 8601 for "creationdate". Other formats go
+	through the email package parser, then dateutil, imported on first
+	use only.
+"""
+import re
+import time
+import calendar
+import datetime
+import email.utils
+
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+		   'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+_ISO_8601 = re.compile(r'^(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:[.,](\d+))?'
+					   r'(Z|[+-]\d\d(?::?\d\d)?)?$')
+# memoized strings: listings repeat the same timestamps a lot
+CACHE_SIZE = 65536
+
+class FixedOffset(datetime.tzinfo):
+	""" Time zone at a fixed offset from UTC, in minutes
+	"""
+	def __init__(self, minutes):
+		self.minutes = minutes
+		self.offset = datetime.timedelta(minutes=minutes)
+
+	def utcoffset(self, dt):
+		return self.offset
+
+	def dst(self, dt):
+		return datetime.timedelta(0)
+
+	def tzname(self, dt):
+		if not self.minutes:
+			return 'UTC'
+		sign = '-' if self.minutes < 0 else '+'
+		return '%s%02d:%02d' % ((sign,) + divmod(abs(self.minutes), 60))
+
+	def __repr__(self):
+		return 'FixedOffset(%d)' % self.minutes
+
+UTC = FixedOffset(0)
+_zones = {0: UTC}
+_cache = {}
+
+def _zone(text):
+	if text == 'Z':
+		return UTC
+	minutes = int(text[1:3]) * 60 + int(text[-2:] if len(text) > 3 else 0)
+	if text[0] == '-':
+		minutes = -minutes
+	zone = _zones.get(minutes)
+	if zone is None:
+		zone = _zones[minutes] = FixedOffset(minutes)
+	return zone
+
+def parse_rfc1123(text):
+	""" Parse an RFC 1123 date ("Sun, 06 Nov 1994 08:49:37 GMT") into an
+		aware datetime. Returns None for anything else.
+
+		:param text: Date
+		:type  text: String
+	"""
+	if len(text) != 29 or not text.endswith(' GMT'):
+		return None
+	try:
+		return datetime.datetime(int(text[12:16]), _MONTHS[text[8:11]], int(text[5:7]),
+								 int(text[17:19]), int(text[20:22]), int(text[23:25]), 0, UTC)
+	except (KeyError, ValueError):
+		return None
+
+def parse_iso8601(text):
+	""" Parse an ISO 8601 date and time ("1997-12-01T17:42:21-08:00") into a
+		datetime, aware if a zone is given. Returns None for anything else.
+
+		:param text: Date
+		:type  text: String
+	"""
+	match = _ISO_8601.match(text)
+	if match is None:
+		return None
+	year, month, day, hour, minute, second, fraction, zone = match.groups()
+	micro = int((fraction + '00000')[:6]) if fraction else 0
+	try:
+		return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+								 int(second), micro, _zone(zone) if zone else None)
+	except ValueError:
+		return None
+
+def _parse_other(text):
+	parsed = email.utils.parsedate_tz(text)#RFC 850, asctime
+	if parsed is not None and parsed[9] is not None:
+		try:
+			return datetime.datetime.fromtimestamp(email.utils.mktime_tz(parsed), UTC)
+		except (ValueError, OverflowError):
+			pass
+	import dateutil.parser#optional: only for unusual formats
+	return dateutil.parser.parse(text)
+
+def parse_date(text):
+	""" Parse a date property value, whatever its format: RFC 1123 and ISO
+		8601 are parsed directly, other formats by email.utils or dateutil.
+		Results are memoized.
+
+		:param text: Date
+		:type  text: String
+
+		Returns a datetime. Raises ValueError when the date can not be parsed.
+	"""
+	value = _cache.get(text)
+	if value is not None:
+		return value
+	stripped = text.strip()
+	if stripped[:4].isdigit():
+		value = parse_iso8601(stripped)
+	else:
+		value = parse_rfc1123(stripped)
+	if value is None:
+		value = _parse_other(stripped)
+	if len(_cache) >= CACHE_SIZE:
+		_cache.clear()
+	_cache[text] = value
+	return value
+
+def to_epoch(value):
+	""" Epoch timestamp of a datetime. Naive ones are taken as local time.
+	"""
+	if value.utcoffset() is not None:
+		return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+	return time.mktime(value.timetuple()) + value.microsecond / 1e6
+
+def http_date_to_epoch(text):
+	""" Epoch timestamp of a "getlastmodified" value, NaN if it can not be
+		parsed
+
+		:param text: Date
+		:type  text: String
+	"""
+	try:
+		return float(to_epoch(parse_date(text)))
+	except (ValueError, OverflowError, TypeError, ImportError):
+		return float('nan')
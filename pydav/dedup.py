@@ -0,0 +1,167 @@
+""" Dedup Module
+
+	Persistent record of the uploaded contents, to skip uploads of files the
+	server already has
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import namedtuple
+from checksum import parse_oc_checksum, _MD5_ETAG
+
+_BLOCK = 1048576
+
+class UploadResult(namedtuple('UploadResult', ['path', 'status', 'etag', 'skipped'])):
+	""" Outcome of one upload of Client.sendFiles. path is the remote path,
+		status the HTTP status code (of the check request for skipped
+		uploads) and skipped True when the content was already on the
+		server.
+	"""
+	__slots__ = ()
+
+class UploadCache(object):
+	""" Local state of the upload deduplication, stored in a SQLite database.
+
+		Two tables: the MD5 digests of local files, keyed by device and
+		inode and valid as long as their size and modification time do not
+		change (so that a file is hashed once, not on every upload), and for
+		every uploaded url the digest of the content written and the ETag
+		the server answered with. An upload can be skipped when the local
+		digest is the one last written and the server still reports the same
+		ETag, or a checksum matching the digest.
+	"""
+	def __init__(self, dbpath=':memory:'):
+		""" Open (and create if needed) the cache database
+
+			:param dbpath: Path to the SQLite database. In memory by default
+			:type  dbpath: String
+		"""
+		self.db = sqlite3.connect(dbpath, check_same_thread=False)
+		self.db.execute('CREATE TABLE IF NOT EXISTS dedup_hashes (device INTEGER, inode INTEGER, '
+						'size INTEGER, mtime REAL, digest TEXT, PRIMARY KEY (device, inode))')
+		self.db.execute('CREATE TABLE IF NOT EXISTS dedup_uploads (url TEXT PRIMARY KEY, '
+						'digest TEXT, etag TEXT)')
+		self.db.commit()
+		self._lock = threading.Lock()
+		# statistics
+		self.hashed = 0
+		self.skipped = 0
+
+	def cached_digest(self, stat):
+		""" Digest of a file recorded for this os.stat() result, None if
+			there is none or the file changed since
+		"""
+		with self._lock:
+			row = self.db.execute('SELECT size, mtime, digest FROM dedup_hashes WHERE device = ? AND inode = ?',
+								  (stat.st_dev, stat.st_ino)).fetchone()
+		if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+			return row[2]
+		return None
+
+	def store_digest(self, stat, digest):
+		""" Record the digest of a file as it was when stat was taken
+		"""
+		with self._lock:
+			self.db.execute('INSERT OR REPLACE INTO dedup_hashes (device, inode, size, mtime, digest) '
+							'VALUES (?, ?, ?, ?, ?)',
+							(stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime, digest))
+			self.db.commit()
+
+	def digest(self, local_file_path):
+		""" MD5 hex digest of a local file, read only when it is not cached
+
+			:param local_file_path: Path of the local file
+			:type  local_file_path: String
+		"""
+		stat = os.stat(local_file_path)
+		digest = self.cached_digest(stat)
+		if digest is not None:
+			return digest
+		value = hashlib.md5()
+		local_file_fd = open(local_file_path, 'rb')
+		for block in iter(lambda: local_file_fd.read(_BLOCK), ''):
+			value.update(block)
+		local_file_fd.close()
+		self.hashed += 1
+		digest = value.hexdigest()
+		if os.stat(local_file_path).st_mtime == stat.st_mtime:#not modified while read
+			self.store_digest(stat, digest)
+		return digest
+
+	def remote(self, url):
+		""" Get the (digest, etag) last written to an url, None if unknown
+
+			:param url: Full url of the resource
+			:type  url: String
+		"""
+		with self._lock:
+			row = self.db.execute('SELECT digest, etag FROM dedup_uploads WHERE url = ?', (url,)).fetchone()
+		return tuple(row) if row is not None else None
+
+	def record(self, url, digest, etag):
+		""" Record a successful upload
+
+			:param url: Full url of the resource
+			:type  url: String
+
+			:param digest: MD5 hex digest of the uploaded content
+			:type  digest: String
+
+			:param etag: ETag returned by the server, if any
+			:type  etag: String
+		"""
+		with self._lock:
+			self.db.execute('INSERT OR REPLACE INTO dedup_uploads (url, digest, etag) VALUES (?, ?, ?)',
+							(url, digest, etag))
+			self.db.commit()
+
+	def forget(self, url):
+		with self._lock:
+			self.db.execute('DELETE FROM dedup_uploads WHERE url = ?', (url,))
+			self.db.commit()
+
+	def candidate(self, url, local_file_path, md5_etags=False):
+		""" Whether the upload of a file might be skipped, before asking the
+			server: its content must be the one last written to the url, or
+			ETags must be content MD5s. Files are hashed only in that case.
+
+			Returns the digest of the file, None if it must be uploaded.
+		"""
+		record = self.remote(url)
+		if record is None and not md5_etags:
+			return None
+		digest = self.digest(local_file_path)
+		if record is not None and record[0] == digest:
+			return digest
+		return digest if md5_etags else None
+
+	def unchanged(self, url, digest, etag, checksum=None, md5_etags=False):
+		""" Whether the server holds the content of digest at url, given the
+			ETag (and OC-Checksum header, if any) it reports now
+
+			:param url: Full url of the resource
+			:type  url: String
+
+			:param digest: MD5 hex digest of the local content
+			:type  digest: String
+
+			:param etag: Current ETag of the resource
+			:type  etag: String
+
+			:param checksum: Current OC-Checksum of the resource
+			:type  checksum: String
+
+			:param md5_etags: Trust ETags to be the MD5 of the content
+			:type  md5_etags: Boolean
+		"""
+		record = self.remote(url)
+		if record is not None and record[0] == digest and etag and record[1] == etag:
+			return True
+		if parse_oc_checksum(checksum).get('MD5') == digest:
+			return True
+		match = _MD5_ETAG.match(etag or '')
+		return bool(md5_etags and match and match.group(1).lower() == digest)
+
+	def close(self):
+		self.db.close()
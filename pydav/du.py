@@ -0,0 +1,160 @@
+""" Du Module
+
+	Disk usage of remote subtrees
+"""
+import threading
+import httplib2#fimxe: this is imported only for exceptions
+from listing import Listing, href_path
+from workers import ConnectionPool, TaskPool
+
+QUOTA_USED = 'quota-used-bytes'
+QUOTA_AVAILABLE = 'quota-available-bytes'
+WALK_PROPERTIES = ['resourcetype', 'getcontentlength']
+
+def _same(href, path):
+	""" Whether an href names path, whatever their quoting and trailing slash
+	"""
+	return href_path(href).rstrip('/') == href_path(path).rstrip('/')
+
+class DiskUsage(object):
+	""" Result of a du
+
+		* path: href of the measured collection
+		* total: bytes used by the whole subtree
+		* sizes: dict mapping the href of the root and of every collection up to the requested depth to the bytes used below it
+		* files: number of files seen, None when the total comes from quotas only
+		* available: quota-available-bytes of the root, if reported
+		* source: "quota" if the RFC 4331 properties were used, "walk" otherwise
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.total = 0
+		self.sizes = {}
+		self.files = None
+		self.available = None
+		self.source = 'walk'
+
+	def breakdown(self):
+		""" Get the per-collection sizes as a list of (href, bytes), sorted by href
+		"""
+		return sorted(self.sizes.items())
+
+class DiskUsageWalker(object):
+	""" Compute the disk usage of a subtree.
+
+		When the server supports RFC 4331, the quota-used-bytes property of
+		each collection gives its size in a single request. Otherwise the
+		subtree is walked with concurrent Depth 1 PROPFIND requests, asking
+		for sizes only. Sizes are streamed into the per-collection totals as
+		listings come back: no ResourceProperties object is ever built.
+	"""
+	def __init__(self, connection, workers=4, use_quota=True):
+		""" Set up the object
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param workers: Number of concurrent requests for the walk
+			:type  workers: Integer
+
+			:param use_quota: Use quota-used-bytes when available. Defaults to True
+			:type  use_quota: Boolean
+		"""
+		self.connection = connection
+		self.workers = workers
+		self.use_quota = use_quota
+		self.pool = ConnectionPool(connection)
+		self._lock = threading.Lock()
+
+	def _listing(self, connection, path, properties, depth):
+		resp, content = connection.send_propfind(path, properties, depth, raw=True)
+		if resp.status < 200 or resp.status >= 300:
+			raise httplib2.HttpLib2Error([resp, content])
+		return Listing.parse(content, [QUOTA_USED, QUOTA_AVAILABLE])
+
+	def du(self, path, depth=1):
+		""" Measure a collection
+
+			:param path: Path (without host) of the collection. Must already be quoted
+			:type  path: String
+
+			:param depth: Depth of the per-collection breakdown. 0 for the total only
+			:type  depth: Integer
+
+			Returns a DiskUsage.
+		"""
+		if path and path[-1] != '/':
+			path += '/'
+		head = self._listing(self.connection, path, WALK_PROPERTIES + [QUOTA_USED, QUOTA_AVAILABLE], 0)
+		root = head.hrefs[0]
+		result = DiskUsage(root)
+		available = head.extra[QUOTA_AVAILABLE][0]
+		if available is not None:
+			result.available = int(available)
+		if not head.collections[0]:
+			result.total = result.sizes[root] = max(head.sizes[0], 0)
+			result.files = 1
+			return result
+
+		used = head.extra[QUOTA_USED][0]
+		if self.use_quota and used is not None:
+			result.source = 'quota'
+			result.total = result.sizes[root] = int(used)
+			if depth > 0:
+				self._quota_breakdown(result, root, depth)
+			return result
+
+		result.files = 0
+		tasks = TaskPool(self.workers)
+		tasks.submit(self._walk, tasks, result, root, [root], depth)
+		tasks.join()
+		result.total = result.sizes[root]
+		return result
+
+	def _quota_breakdown(self, result, root, depth):
+		""" Breakdown from quota-used-bytes, one request per listed
+			collection. Collections not reporting it are walked.
+		"""
+		tasks = TaskPool(self.workers)
+		def visit(path, level):
+			listing = self._listing(self.pool.get(), path, WALK_PROPERTIES + [QUOTA_USED], 1)
+			for href, size, collection, used in zip(listing.hrefs, listing.sizes,
+													 listing.collections, listing.extra[QUOTA_USED]):
+				if not collection or _same(href, path):
+					continue
+				if used is None:
+					with self._lock:
+						result.sizes.setdefault(href, 0)
+					tasks.submit(self._walk, tasks, result, href, [href], depth - level)
+					continue
+				with self._lock:
+					result.sizes[href] = int(used)
+				if level < depth:
+					tasks.submit(visit, href, level + 1)
+		tasks.submit(visit, root, 1)
+		tasks.join()
+
+	def _walk(self, tasks, result, path, chain, depth):
+		""" List one collection and add the sizes of its files to every
+			collection of chain (its ancestors within the breakdown depth).
+		"""
+		listing = self._listing(self.pool.get(), path, WALK_PROPERTIES, 1)
+		total, files = 0, 0
+		for href, size, collection in zip(listing.hrefs, listing.sizes, listing.collections):
+			if _same(href, path):
+				continue
+			if collection:
+				if len(chain) <= depth:
+					subchain = chain + [href]
+				else:
+					subchain = chain
+				tasks.submit(self._walk, tasks, result, href, subchain, depth)
+			elif size > 0:
+				total += size
+				files += 1
+			else:
+				files += 1
+		with self._lock:
+			result.files = (result.files or 0) + files
+			for href in chain:
+				result.sizes[href] = result.sizes.get(href, 0) + total
@@ -0,0 +1,337 @@
+""" HTTP/2 Module
+
+	Multiplexed HTTP/2 transport for Connection. Requires the "h2" package.
+"""
+import ssl
+import time
+import socket
+import urlparse
+import threading
+import httplib2
+import h2.config
+import h2.errors
+import h2.events
+import h2.settings
+import h2.exceptions
+import h2.connection
+from transport import Transport
+
+class H2Error(httplib2.HttpLib2Error): pass
+
+# connection specific headers, forbidden in HTTP/2
+HOP_HEADERS = frozenset(['connection', 'keep-alive', 'proxy-connection',
+						 'transfer-encoding', 'upgrade', 'host', 'te'])
+
+class _Stream(object):
+	""" State of one request/response exchange
+	"""
+	def __init__(self):
+		self.headers = []
+		self.data = []
+		self.done = threading.Event()
+		self.error = None
+		# last time something was received on the stream
+		self.touched = time.time()
+
+	def fail(self, error):
+		if not self.done.is_set():
+			self.error = error
+			self.done.set()
+
+class H2Transport(Transport):
+	""" Drop-in replacement for httplib2.Http speaking HTTP/2.
+
+		A single connection (TLS with ALPN for https, cleartext with prior
+		knowledge for http) carries every request: request() is thread safe
+		and concurrent calls are multiplexed as separate streams. At most
+		max_streams streams are open at once (fewer if the server says so in
+		its MAX_CONCURRENT_STREAMS setting); other callers wait for a slot.
+		Request bodies are sent as the server's flow control windows allow,
+		response bodies are acknowledged as they arrive.
+	"""
+	multiplexed = True
+
+	def __init__(self, host, max_streams=100, window=16777215, timeout=None,
+				 ca_certs=None, disable_ssl_certificate_validation=False):
+		""" Set up the object. Nothing is connected until the first request.
+
+			:param host: Server url ("https://host:port"). Only the scheme, host and port are used
+			:type  host: String
+
+			:param max_streams: Maximum number of concurrent streams. 100 by default
+			:type  max_streams: Integer
+
+			:param window: Receive flow control window of the connection and of each stream, in bytes
+			:type  window: Integer
+
+			:param timeout: Seconds to wait for the connection, and for a response before its stream is reset
+			:type  timeout: Float
+
+			:param ca_certs: File of the CA certificates used to check the server. System ones by default
+			:type  ca_certs: String
+
+			:param disable_ssl_certificate_validation: Do not check the server certificate. False by default
+			:type  disable_ssl_certificate_validation: Boolean
+		"""
+		parsed = urlparse.urlparse(host)
+		self.scheme = parsed.scheme or 'http'
+		self.hostname = parsed.hostname
+		self.port = parsed.port or (443 if self.scheme == 'https' else 80)
+		self.authority = parsed.netloc.rsplit('@', 1)[-1]
+		self.max_streams = max_streams
+		self.window = window
+		self.timeout = timeout
+		self.ca_certs = ca_certs
+		self.disable_ssl_certificate_validation = disable_ssl_certificate_validation
+		self._cond = threading.Condition()
+		self._sock = None
+		self._conn = None
+		self._streams = {}
+		self._active = 0
+		# statistics
+		self.connections = 0
+		self.requests = 0
+		self.peak_streams = 0
+
+	def clone(self):
+		return self
+
+	def _connect(self):
+		sock = socket.create_connection((self.hostname, self.port), self.timeout)
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if self.scheme == 'https':
+			context = ssl.create_default_context(cafile=self.ca_certs)
+			if self.disable_ssl_certificate_validation:
+				context.check_hostname = False
+				context.verify_mode = ssl.CERT_NONE
+			context.set_alpn_protocols(['h2'])
+			sock = context.wrap_socket(sock, server_hostname=self.hostname)
+			if sock.selected_alpn_protocol() != 'h2':
+				sock.close()
+				raise H2Error('%s does not speak HTTP/2' % self.authority)
+		sock.settimeout(None)
+
+		conn = h2.connection.H2Connection(h2.config.H2Configuration(
+			client_side=True, header_encoding=None))
+		conn.initiate_connection()
+		conn.update_settings({
+			h2.settings.SettingCodes.ENABLE_PUSH: 0,
+			h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: self.window,
+		})
+		if self.window > 65535:
+			conn.increment_flow_control_window(self.window - 65535)
+		sock.sendall(conn.data_to_send())
+
+		self._sock, self._conn, self._streams = sock, conn, {}
+		self.connections += 1
+		reader = threading.Thread(target=self._read, args=(sock, conn, self._streams))
+		reader.daemon = True
+		reader.start()
+
+	def _flush(self):
+		data = self._conn.data_to_send()
+		if data:
+			self._sock.sendall(data)
+
+	def _limit(self):
+		return max(min(self.max_streams, self._conn.remote_settings.max_concurrent_streams), 1)
+
+	def _read(self, sock, conn, streams):
+		""" Reader thread of one connection: dispatch the received frames to
+			the streams
+		"""
+		try:
+			while True:
+				data = sock.recv(65536)
+				if not data:
+					raise H2Error('connection closed by the server')
+				with self._cond:
+					for event in conn.receive_data(data):
+						self._dispatch(conn, streams, event)
+					if self._conn is conn:
+						self._flush()
+					self._cond.notify_all()
+		except Exception, error:
+			with self._cond:
+				for stream in streams.values():
+					stream.fail(error)
+				streams.clear()
+				if self._conn is conn:
+					self._sock = self._conn = None
+				self._cond.notify_all()
+			try:
+				sock.close()
+			except socket.error:
+				pass
+
+	def _dispatch(self, conn, streams, event):
+		stream = streams.get(getattr(event, 'stream_id', None))
+		if stream is not None:
+			stream.touched = time.time()
+		if isinstance(event, h2.events.ResponseReceived):
+			if stream is not None:
+				stream.headers = event.headers
+		elif isinstance(event, h2.events.DataReceived):
+			if stream is not None:
+				stream.data.append(event.data)
+			try:
+				conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+			except h2.exceptions.StreamClosedError:
+				pass
+		elif isinstance(event, h2.events.StreamEnded):
+			if stream is not None:
+				stream.done.set()
+		elif isinstance(event, h2.events.StreamReset):
+			if stream is not None:
+				stream.fail(H2Error('stream reset by the server (error %s)' % event.error_code))
+		elif isinstance(event, h2.events.ConnectionTerminated):
+			# streams above last_stream_id were not processed
+			for stream_id, stream in streams.items():
+				if event.last_stream_id is None or stream_id > event.last_stream_id:
+					stream.fail(H2Error('connection terminated by the server'))
+			if self._conn is conn:
+				self._sock = self._conn = None
+
+	def _open(self, headers, end_stream):
+		with self._cond:
+			while True:
+				if self._conn is None:
+					self._connect()
+				if self._active < self._limit():
+					break
+				self._cond.wait()
+			self._active += 1
+			self.peak_streams = max(self.peak_streams, self._active)
+			self.requests += 1
+			conn = self._conn
+			stream_id = conn.get_next_available_stream_id()
+			stream = _Stream()
+			self._streams[stream_id] = stream
+			conn.send_headers(stream_id, headers, end_stream=end_stream)
+			self._flush()
+			return conn, stream_id, stream
+
+	def _send_data(self, conn, stream_id, stream, data):
+		""" Send one piece of a request body, as the flow control windows
+			allow
+		"""
+		offset = 0
+		while offset < len(data):
+			with self._cond:
+				while True:
+					if stream.error is not None:
+						raise stream.error
+					if self._conn is not conn:
+						raise H2Error('connection lost')
+					window = min(conn.local_flow_control_window(stream_id),
+								 conn.max_outbound_frame_size)
+					if window > 0:
+						break
+					self._cond.wait()
+				conn.send_data(stream_id, data[offset:offset + window])
+				self._flush()
+			offset += window
+
+	def _send_body(self, conn, stream_id, stream, body):
+		if hasattr(body, 'read'):
+			while True:
+				data = body.read(65536)
+				if not data:
+					break
+				self._send_data(conn, stream_id, stream, data)
+		else:
+			self._send_data(conn, stream_id, stream, body)
+		with self._cond:
+			if self._conn is conn:
+				conn.end_stream(stream_id)
+				self._flush()
+
+	def _wait(self, conn, stream_id, stream):
+		""" Wait for the end of a response. The stream is reset when nothing
+			was received on it for timeout seconds.
+		"""
+		while True:
+			# always wait with a timeout: an untimed wait can not be interrupted in python 2
+			if self.timeout is None:
+				delay = 3600
+			else:
+				delay = stream.touched + self.timeout - time.time()
+				if delay <= 0:
+					break
+			if stream.done.wait(delay):
+				return
+		with self._cond:
+			if self._conn is conn:
+				try:
+					conn.reset_stream(stream_id, h2.errors.ErrorCodes.CANCEL)
+					self._flush()
+				except h2.exceptions.StreamClosedError:
+					pass
+		if not stream.done.is_set():
+			raise socket.timeout('no response from %s in %ss' % (self.authority, self.timeout))
+
+	def _exchange(self, method, path, body, headers):
+		request = [(':method', method), (':scheme', self.scheme),
+				   (':authority', self.authority), (':path', path)]
+		for name, value in headers.items():
+			name = name.lower()
+			if name not in HOP_HEADERS:
+				request.append((name, str(value)))
+		if body and not hasattr(body, 'read') and 'content-length' not in [n for n, v in request]:
+			request.append(('content-length', str(len(body))))
+
+		conn, stream_id, stream = self._open(request, not body)
+		try:
+			if body:
+				self._send_body(conn, stream_id, stream, body)
+			self._wait(conn, stream_id, stream)
+		finally:
+			with self._cond:
+				self._active -= 1
+				if self._conn is conn:
+					self._streams.pop(stream_id, None)
+				self._cond.notify_all()
+		if stream.error is not None:
+			raise stream.error
+
+		info = {}
+		for name, value in stream.headers:
+			if name == ':status':
+				info['status'] = value
+			elif name in info:
+				info[name] += ', ' + value
+			else:
+				info[name] = value
+		return httplib2.Response(info), ''.join(stream.data)
+
+	def request(self, uri, method='GET', body=None, headers=None, **ignored):
+		""" Send a request and wait for its response. Same interface as
+			httplib2.Http.request.
+
+			Returns the httplib2.Response and the body.
+		"""
+		headers = headers or {}
+		parsed = urlparse.urlsplit(uri)
+		path = parsed.path or '/'
+		if parsed.query:
+			path += '?' + parsed.query
+		return self._exchange(method, path, body, headers)
+
+	def close(self):
+		""" Close the connection. The next request opens a new one.
+		"""
+		with self._cond:
+			sock, conn = self._sock, self._conn
+			self._sock = self._conn = None
+			if conn is not None:
+				try:
+					conn.close_connection()
+					sock.sendall(conn.data_to_send())
+				except (socket.error, h2.exceptions.ProtocolError):
+					pass
+		if sock is not None:
+			try:
+				sock.shutdown(socket.SHUT_RDWR)
+			except socket.error:
+				pass
+			sock.close()
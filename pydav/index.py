@@ -0,0 +1,300 @@
+""" Index Module
+
+	Local SQLite index of the metadata of a remote tree
+"""
+import sqlite3
+import time
+import urllib
+import urlparse
+import posixpath
+import calendar
+import datetime
+import threading
+from collections import namedtuple
+from listing import href_path
+
+CTAG = '{http://calendarserver.org/ns/}getctag'
+
+class Entry(namedtuple('Entry', ['path', 'size', 'mtime', 'etag', 'collection'])):
+	""" One indexed resource. path is the unquoted absolute path of the
+		resource, size is -1 for collections and mtime an epoch timestamp.
+	"""
+	__slots__ = ()
+
+class Member(namedtuple('Member', ['path', 'size', 'mtime', 'etag', 'tag', 'collection'])):
+	""" A resource seen by walk_changed(): unquoted absolute path (ending
+		with a slash for collections), size, modification time, etag and,
+		for collections, the tag compared from one walk to the next
+		("getctag", or "getetag" if the server has no ctag).
+	"""
+	__slots__ = ()
+
+def walk_changed(client, root, known, full=False):
+	""" Walk a remote tree, listing only the collections whose tag changed.
+		The tag of the root is asked first; the walk then only descends into
+		the collections whose tag differs from the known one. This relies on
+		the server changing the tag of a collection whenever something
+		changes below it.
+
+		:param client: Client used to list the remote tree
+		:type  client: Client
+
+		:param root: Unquoted absolute path of the root collection, ending with a slash
+		:type  root: String
+
+		:param known: Called with the path of a collection, returns its tag as of the previous walk or None
+		:type  known: Callable
+
+		:param full: List every collection, whatever its tag. Defaults to False
+		:type  full: Boolean
+
+		Returns a generator of (collection, members) tuples, one per
+		PROPFIND request after the first: the Member of a listed collection,
+		with the tag it was reached with, and the Members in it.
+	"""
+	head = client.lsColumns(root, 0, extra=[CTAG])
+	tag = head.extra[CTAG][0] or head.etags[0]
+	if not full and tag is not None and known(root) == tag:
+		return
+	stack = [(root, tag)]
+	while stack:
+		path, tag = stack.pop()
+		listing = client.lsColumns(path, 1, extra=[CTAG])
+		itself, members = Member(path, -1, None, None, tag, True), []
+		for href, size, mtime, collection, etag, ctag in zip(
+				listing.hrefs, listing.sizes, listing.mtimes, listing.collections,
+				listing.etags, listing.extra[CTAG]):
+			child = href_path(href)
+			if collection and not child.endswith('/'):
+				child += '/'
+			if child == path:
+				itself = Member(child, -1, mtime, etag, tag, True)
+			elif collection:
+				members.append(Member(child, -1, mtime, etag, ctag or etag, True))
+			else:
+				members.append(Member(child, size, mtime, etag, None, False))
+		# decided before the caller updates what it knows
+		changed = [(member.path, member.tag) for member in members if member.collection and
+				   (full or member.tag is None or known(member.path) != member.tag)]
+		yield itself, members
+		stack.extend(changed)
+
+def _epoch(value):
+	if isinstance(value, datetime.datetime):
+		if value.utcoffset() is not None:
+			return calendar.timegm(value.utctimetuple())
+		return time.mktime(value.timetuple())
+	return value
+
+class MetadataIndex(object):
+	""" Local index of a remote tree, built from columnar PROPFIND listings
+		and stored in SQLite with indexes on path, parent, size, mtime and
+		etag, so that find-like queries no longer need any remote walk.
+
+		refresh() is incremental: a collection is only listed again when its
+		"getctag" (or "getetag" if the server has no ctag) changed since the
+		last refresh. This relies on the server changing the tag of a
+		collection whenever something changes below it, as ownCloud and
+		SabreDAV (ctag) do. On servers where collection ETags only follow the
+		immediate members, deep changes are only seen by refresh(full=True).
+	"""
+	SCHEMA = [
+		'CREATE TABLE IF NOT EXISTS entries (path TEXT PRIMARY KEY, parent TEXT,'
+		' name TEXT, ext TEXT, size INTEGER, mtime REAL, etag TEXT, tag TEXT,'
+		' collection INTEGER)',
+		'CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)',
+		'CREATE INDEX IF NOT EXISTS entries_size ON entries (size)',
+		'CREATE INDEX IF NOT EXISTS entries_mtime ON entries (mtime)',
+		'CREATE INDEX IF NOT EXISTS entries_etag ON entries (etag)',
+	]
+
+	def __init__(self, client, dbpath=':memory:', root=''):
+		""" Open (and create if needed) the index. Nothing is fetched until
+			refresh() is called.
+
+			:param client: Client used to list the remote tree
+			:type  client: Client
+
+			:param dbpath: Path to the SQLite database. In memory by default
+			:type  dbpath: String
+
+			:param root: Path of the indexed subtree, relative to the client base path
+			:type  root: String
+		"""
+		self.client = client
+		self.root = root
+		self.db = sqlite3.connect(dbpath, check_same_thread=False)
+		self._lock = threading.Lock()
+		for statement in self.SCHEMA:
+			self.db.execute(statement)
+		self.db.commit()
+
+	def _abspath(self, path):
+		uri = self.client.connection.get_uri(urllib.quote(path))
+		return urllib.unquote(urlparse.urlparse(uri).path)
+
+	def _row(self, path):
+		return self.db.execute('SELECT tag, collection FROM entries WHERE path = ?',
+							   (path,)).fetchone()
+
+	def _known(self, path):
+		row = self._row(path)
+		return row[0] if row is not None and row[1] else None
+
+	def _store(self, path, size, mtime, etag, tag, collection):
+		stripped = path.rstrip('/')
+		parent = stripped[:stripped.rfind('/') + 1] if stripped else None
+		name = posixpath.basename(stripped)
+		ext = posixpath.splitext(name)[1].lower() if not collection else ''
+		if mtime != mtime:#NaN
+			mtime = None
+		self.db.execute('INSERT OR REPLACE INTO entries (path, parent, name, ext, size,'
+						' mtime, etag, tag, collection) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+						(path, parent, name, ext, size, mtime, etag, tag, int(collection)))
+
+	def _remove(self, path):
+		self.db.execute('DELETE FROM entries WHERE path = ?', (path,))
+		if path.endswith('/'):
+			self.db.execute('DELETE FROM entries WHERE substr(path, 1, ?) = ?',
+							(len(path), path))
+
+	def refresh(self, full=False):
+		""" Bring the index up to date. Only collections whose tag changed are
+			listed again, unless full is True.
+
+			:param full: List every collection, whatever its tag. Defaults to False
+			:type  full: Boolean
+
+			Returns the number of PROPFIND requests sent.
+		"""
+		with self._lock:
+			return self._refresh(full)
+
+	def _refresh(self, full):
+		root = self._abspath(self.root)
+		if not root.endswith('/'):
+			root += '/'
+		requests = 1
+		# collection tags are only recorded once the whole walk succeeded, so
+		# that an interrupted refresh lists them again next time
+		tags = []
+		for itself, members in walk_changed(self.client, root, self._known, full):
+			requests += 1
+			path = itself.path
+			row = self._row(path)
+			self._store(path, -1, itself.mtime, itself.etag, row[0] if row else None, True)
+			tags.append((itself.tag, path))
+			seen = set()
+			for member in members:
+				seen.add(member.path)
+				if not member.collection:
+					self._store(member.path, member.size, member.mtime, member.etag, None, False)
+				elif self._row(member.path) is None:
+					self._store(member.path, -1, member.mtime, member.etag, None, True)
+			for (old,) in self.db.execute('SELECT path FROM entries WHERE parent = ?',
+										  (path,)).fetchall():
+				if old not in seen:
+					self._remove(old)
+			self.db.commit()
+		self.db.executemany('UPDATE entries SET tag = ? WHERE path = ?', tags)
+		self.db.commit()
+		return requests
+
+	def _where(self, pattern, min_size, max_size, since, until, collections, under):
+		clauses, args = [], []
+		if pattern is not None:
+			clauses.append('path GLOB ?' if '/' in pattern else 'name GLOB ?')
+			args.append(pattern)
+		if min_size is not None:
+			clauses.append('size >= ?')
+			args.append(min_size)
+		if max_size is not None:
+			clauses.append('size <= ?')
+			args.append(max_size)
+		if since is not None:
+			clauses.append('mtime >= ?')
+			args.append(_epoch(since))
+		if until is not None:
+			clauses.append('mtime < ?')
+			args.append(_epoch(until))
+		if collections is not None:
+			clauses.append('collection = ?')
+			args.append(int(collections))
+		if under is not None:
+			under = self._abspath(under)
+			if not under.endswith('/'):
+				under += '/'
+			clauses.append('substr(path, 1, ?) = ? AND path != ?')
+			args.extend([len(under), under, under])
+		return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', args
+
+	def query(self, pattern=None, min_size=None, max_size=None, since=None,
+			  until=None, collections=None, under=None, order_by='path', limit=None):
+		""" Find indexed resources. Every criterion is optional.
+
+			:param pattern: Glob pattern (*, ?, [...]) matched against the name, or against the full path if it contains a "/"
+			:type  pattern: String
+
+			:param min_size: Minimum size in bytes, included
+			:type  min_size: Integer
+
+			:param max_size: Maximum size in bytes, included
+			:type  max_size: Integer
+
+			:param since: Minimum modification time, included. Epoch timestamp or datetime
+			:type  since: Float or datetime
+
+			:param until: Maximum modification time, excluded. Epoch timestamp or datetime
+			:type  until: Float or datetime
+
+			:param collections: True for collections only, False for files only
+			:type  collections: Boolean
+
+			:param under: Only resources below this path, relative to the client base path
+			:type  under: String
+
+			:param order_by: "path", "size" or "mtime", optionally followed by " DESC"
+			:type  order_by: String
+
+			:param limit: Maximum number of results
+			:type  limit: Integer
+
+			Returns a list of Entry.
+		"""
+		column = order_by.split()[0]
+		if column not in ('path', 'size', 'mtime') or order_by.split()[1:] not in ([], ['DESC'], ['ASC']):
+			raise ValueError("invalid order_by: %r" % order_by)
+		where, args = self._where(pattern, min_size, max_size, since, until,
+								  collections, under)
+		sql = 'SELECT path, size, mtime, etag, collection FROM entries' + where
+		sql += ' ORDER BY ' + order_by
+		if limit is not None:
+			sql += ' LIMIT %d' % limit
+		return [Entry(path, size, mtime, etag, bool(collection))
+				for path, size, mtime, etag, collection in self.db.execute(sql, args)]
+
+	def aggregate(self, by=None, **criteria):
+		""" Count and sum the sizes of the indexed files matching the query()
+			criteria.
+
+			:param by: None for a single total, "parent" to group by directory or "ext" to group by file extension
+			:type  by: String
+
+			Returns a list of (group, count, total size) tuples, group being None when by is None.
+		"""
+		if by not in (None, 'parent', 'ext'):
+			raise ValueError("invalid group: %r" % by)
+		criteria.setdefault('collections', False)
+		where, args = self._where(criteria.get('pattern'), criteria.get('min_size'),
+								  criteria.get('max_size'), criteria.get('since'),
+								  criteria.get('until'), criteria.get('collections'),
+								  criteria.get('under'))
+		if by is None:
+			sql = 'SELECT NULL, COUNT(*), COALESCE(SUM(size), 0) FROM entries' + where
+		else:
+			sql = 'SELECT %s, COUNT(*), SUM(size) FROM entries%s GROUP BY %s ORDER BY %s' % (
+				by, where, by, by)
+		return [tuple(row) for row in self.db.execute(sql, args)]
+
+	def close(self):
+		self.db.close()
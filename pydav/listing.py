@@ -0,0 +1,192 @@
+""" Listing Module
+
+	Columnar PROPFIND results
+"""
+import array
+import urllib
+import urlparse
+import threading
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple
+from StringIO import StringIO
+from lxml import etree
+from dates import http_date_to_epoch
+from workers import ConnectionPool, TaskPool
+
+try:
+	array.array('q')
+	_INT64 = 'q'
+except ValueError:#python 2: 'l' is 64 bits on LP64 platforms
+	_INT64 = 'l'
+
+DEFAULT_PROPERTIES = ['resourcetype', 'getcontentlength', 'getlastmodified', 'getetag']
+
+_NAN = float('nan')
+
+def _qualified(name):
+	if name.startswith('{'):
+		return name
+	return '{DAV:}' + name
+
+class Listing(object):
+	""" Columnar listing of a collection: one entry per resource, stored as
+		parallel arrays instead of one ResourceProperties object per entry.
+
+		* hrefs: list of hrefs
+		* sizes: int64 array of "getcontentlength", -1 when unknown (collections)
+		* mtimes: float array of "getlastmodified" as epoch timestamps, NaN when unknown
+		* collections: array of booleans, true for collections
+		* etags: list of "getetag", None when unknown
+		* extra: dict mapping each extra property name to a list of raw values
+
+		Once converted with to_numpy(), every column is a NumPy array and can
+		be filtered and sorted in a vectorized way:
+
+			big = listing.hrefs[listing.sizes > 2**30]
+	"""
+	def __init__(self, extra=()):
+		self.hrefs = []
+		self.sizes = array.array(_INT64)
+		self.mtimes = array.array('d')
+		self.collections = array.array('b')
+		self.etags = []
+		self.extra = dict((name, []) for name in extra)
+
+	def __len__(self):
+		return len(self.hrefs)
+
+	def __iter__(self):
+		""" Iterate over the entries as (href, size, mtime, is_collection, etag) tuples
+		"""
+		return iter(zip(self.hrefs, self.sizes, self.mtimes,
+						[bool(c) for c in self.collections], self.etags))
+
+	@classmethod
+	def parse(cls, xml, extra=()):
+		""" Build a listing from a raw PROPFIND multistatus body. The XML is
+			parsed incrementally and each response element is discarded once
+			read, so no intermediate tree of the whole answer is kept.
+
+			:param xml: raw XML answer
+			:type  xml: String
+
+			:param extra: Names of additional properties to collect, DAV: names or "{namespace}name"
+			:type  extra: List
+		"""
+		listing = cls(extra)
+		extra_tags = dict((_qualified(name), name) for name in extra)
+		for event, response in etree.iterparse(StringIO(xml), events=('end',),
+											   tag='{DAV:}response'):
+			size, mtime, collection, etag = -1, _NAN, False, None
+			values = {}
+			for propstat in response.iterchildren('{DAV:}propstat'):
+				status = propstat.findtext('{DAV:}status') or ''
+				if ' 200 ' not in status:
+					continue
+				prop = propstat.find('{DAV:}prop')
+				if prop is None:
+					continue
+				for node in prop:
+					tag = node.tag
+					if tag == '{DAV:}getcontentlength':
+						size = int(node.text or -1)
+					elif tag == '{DAV:}getlastmodified':
+						mtime = http_date_to_epoch(node.text or '')
+					elif tag == '{DAV:}resourcetype':
+						collection = node.find('{DAV:}collection') is not None
+					elif tag == '{DAV:}getetag':
+						etag = node.text
+					if tag in extra_tags:
+						values[extra_tags[tag]] = node.text
+			listing.hrefs.append(response.findtext('{DAV:}href'))
+			listing.sizes.append(size)
+			listing.mtimes.append(mtime)
+			listing.collections.append(collection)
+			listing.etags.append(etag)
+			for name, column in listing.extra.iteritems():
+				column.append(values.get(name))
+
+			response.clear()
+			while response.getprevious() is not None:
+				del response.getparent()[0]
+		return listing
+
+	def to_numpy(self):
+		""" Convert every column to a NumPy array, in place. Requires NumPy.
+			Returns the listing itself.
+		"""
+		import numpy
+		self.hrefs = numpy.array(self.hrefs, dtype=object)
+		if len(self.sizes) and self.sizes.itemsize == 8:
+			self.sizes = numpy.frombuffer(self.sizes, dtype=numpy.int64).copy()
+		else:
+			self.sizes = numpy.array(self.sizes.tolist(), dtype=numpy.int64)
+		self.mtimes = numpy.array(self.mtimes.tolist(), dtype=numpy.float64)
+		self.collections = numpy.array(self.collections.tolist(), dtype=bool)
+		self.etags = numpy.array(self.etags, dtype=object)
+		for name in self.extra:
+			self.extra[name] = numpy.array(self.extra[name], dtype=object)
+		return self
+
+class Entry(namedtuple('Entry', ['path', 'size', 'mtime', 'collection'])):
+	""" A resource found by list_collection() or walk(): unquoted absolute path
+		(ending with a slash for collections), size, modification time
+		(epoch) and collection flag
+	"""
+	__slots__ = ()
+
+def href_path(href):
+	""" Unquoted path of an href
+	"""
+	return urllib.unquote(urlparse.urlsplit(href).path)
+
+def list_collection(connection, path, depth=1):
+	""" List a remote path (unquoted)
+
+		Returns a tuple: the Entry of the path itself (None if it does not
+		exist) and the Entry objects of its members.
+	"""
+	quoted = urllib.quote(path)
+	resp, content = connection.send_propfind(quoted, DEFAULT_PROPERTIES, depth, raw=True)
+	if resp.status == 404:
+		return None, []
+	if resp.status < 200 or resp.status >= 300:
+		raise httplib2.HttpLib2Error([resp, content])
+	listing = Listing.parse(content)
+	itself, members = None, []
+	for href, size, mtime, collection, etag in listing:
+		member = href_path(href)
+		if collection and not member.endswith('/'):
+			member += '/'
+		entry = Entry(member, size, mtime, collection)
+		if member.rstrip('/') == path.rstrip('/'):
+			itself = entry
+		else:
+			members.append(entry)
+	return itself, members
+
+def walk(connection, path, workers=4):
+	""" List a remote subtree with concurrent depth 1 PROPFIND requests
+
+		Returns the list of Entry below path, None if path does not exist.
+	"""
+	pool = ConnectionPool(connection)
+	tasks = TaskPool(workers)
+	root = path if path.endswith('/') else path + '/'
+	found = []
+	lock = threading.Lock()
+	missing = []
+	def visit(collection):
+		itself, members = list_collection(pool.get(), collection)
+		if itself is None and collection == root:
+			missing.append(True)
+		with lock:
+			found.extend(members)
+		for entry in members:
+			if entry.collection:
+				tasks.submit(visit, entry.path)
+	tasks.submit(visit, root)
+	tasks.join()
+	if missing:
+		return None
+	return sorted(found, key=lambda entry: entry.path)
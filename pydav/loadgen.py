@@ -0,0 +1,325 @@
+""" Loadgen Module
+
+	Synthetic load on a WebDAV server: a workload profile (operation mix,
+	file sizes, tree shape, concurrency, duration) driven by many worker
+	threads, with the throughput and latency percentiles of each method
+"""
+import os
+import json
+import time
+import random
+import urllib
+import threading
+from collections import namedtuple
+from connection import Connection
+from workers import ConnectionPool, TaskPool
+
+METHODS = ('PROPFIND', 'GET', 'HEAD', 'PUT', 'MKCOL', 'DELETE')
+
+class WorkloadProfile(object):
+	""" What a LoadGenerator sends
+	"""
+	def __init__(self, mix=None, sizes=None, depth=2, fanout=3, files=5, concurrency=8,
+				 duration=10.0, requests=None, root='pydav-load/', seed=None):
+		""" Set up the object
+
+			:param mix: Relative weight of each method among PROPFIND (depth 1 on a collection), GET, HEAD, PUT (new or existing file), MKCOL and DELETE (of a file). 50% PROPFIND, 30% GET, 15% PUT and 5% MKCOL by default
+			:type  mix: Dict
+
+			:param sizes: (size in bytes, weight) pairs the file sizes are drawn from. 1KB, 64KB and 1MB files by default
+			:type  sizes: List
+
+			:param depth: Depth of the initial tree of collections. 2 by default
+			:type  depth: Integer
+
+			:param fanout: Sub collections of each collection of the initial tree. 3 by default
+			:type  fanout: Integer
+
+			:param files: Files in each collection of the initial tree. 5 by default
+			:type  files: Integer
+
+			:param concurrency: Number of workers, each with its own connection. 8 by default
+			:type  concurrency: Integer
+
+			:param duration: Length of the run in seconds. 10 by default
+			:type  duration: Float
+
+			:param requests: Stop after this number of requests instead, if given
+			:type  requests: Integer
+
+			:param root: Collection the tree is built in, relative to the base path. Created if needed
+			:type  root: String
+
+			:param seed: Random seed, for repeatable runs
+			:type  seed: Integer
+		"""
+		self.mix = dict(mix or {'PROPFIND': 50, 'GET': 30, 'PUT': 15, 'MKCOL': 5})
+		for method, weight in self.mix.items():
+			if method not in METHODS:
+				raise ValueError("unsupported method: %r" % method)
+			if weight < 0:
+				raise ValueError("negative weight for %s" % method)
+		if not sum(self.mix.values()):
+			raise ValueError("empty operation mix")
+		self.sizes = list(sizes or [(1024, 50), (65536, 35), (1048576, 15)])
+		self.depth = depth
+		self.fanout = fanout
+		self.files = files
+		self.concurrency = max(concurrency, 1)
+		self.duration = duration
+		self.requests = requests
+		self.root = root if root.endswith('/') else root + '/'
+		self.seed = seed
+
+	@classmethod
+	def load(cls, path):
+		""" Read a profile from a JSON file holding the arguments of the constructor
+		"""
+		profile_fd = open(path, 'r')
+		values = json.load(profile_fd)
+		profile_fd.close()
+		if 'sizes' in values:
+			values['sizes'] = [tuple(pair) for pair in values['sizes']]
+		return cls(**dict((str(name), value) for name, value in values.items()))
+
+def _choice(rng, weighted):
+	""" Draw from (value, weight) pairs
+	"""
+	point = rng.random() * sum(weight for value, weight in weighted)
+	for value, weight in weighted:
+		point -= weight
+		if point < 0:
+			return value
+	return weighted[-1][0]
+
+def percentile(values, ratio):
+	""" Nearest rank percentile of sorted values, None when empty
+
+		:param values: Sorted values
+		:type  values: List
+
+		:param ratio: Between 0 and 1
+		:type  ratio: Float
+	"""
+	if not values:
+		return None
+	index = int(ratio * len(values) + 0.5) - 1
+	return values[min(max(index, 0), len(values) - 1)]
+
+class MethodStats(namedtuple('MethodStats', ['method', 'count', 'errors', 'rate', 'bytes',
+											 'p50', 'p95', 'p99', 'mean', 'max'])):
+	""" Measures of one method in a LoadReport: requests sent, failed ones
+		(status of 400 and more, or no answer), requests per second, body
+		bytes sent and received, and latencies of the successful requests
+		in seconds
+	"""
+	__slots__ = ()
+
+class LoadReport(object):
+	""" Outcome of a LoadGenerator run
+	"""
+	def __init__(self, elapsed, samples, errors, sizes):
+		self.elapsed = elapsed
+		self.stats = {}
+		for method in sorted(set(samples) | set(errors)):
+			latencies = sorted(samples.get(method, []))
+			count = len(latencies) + errors.get(method, 0)
+			self.stats[method] = MethodStats(
+				method, count, errors.get(method, 0),
+				count / elapsed if elapsed else 0.0, sizes.get(method, 0),
+				percentile(latencies, 0.50), percentile(latencies, 0.95), percentile(latencies, 0.99),
+				sum(latencies) / len(latencies) if latencies else None, latencies[-1] if latencies else None)
+
+	@property
+	def requests(self):
+		return sum(stats.count for stats in self.stats.values())
+
+	@property
+	def errors(self):
+		return sum(stats.errors for stats in self.stats.values())
+
+	def summary(self):
+		""" Report as a text table, latencies in milliseconds
+		"""
+		def ms(value):
+			return '%8.1f' % (value * 1000) if value is not None else '       -'
+		lines = ['%-9s %7s %6s %8s %8s %8s %8s %8s' % ('method', 'count', 'errors', 'req/s',
+														'p50', 'p95', 'p99', 'max')]
+		for method, stats in sorted(self.stats.items()):
+			lines.append('%-9s %7d %6d %8.1f %s %s %s %s' % (method, stats.count, stats.errors, stats.rate,
+															 ms(stats.p50), ms(stats.p95), ms(stats.p99),
+															 ms(stats.max)))
+		lines.append('%d requests in %.1f s: %.1f req/s' % (self.requests, self.elapsed,
+															self.requests / self.elapsed if self.elapsed else 0.0))
+		return '\n'.join(lines)
+
+class LoadGenerator(object):
+	""" Drive a WorkloadProfile against a server.
+
+		prepare() builds the tree of collections and files the operations
+		pick their targets from; run() then sends requests from
+		profile.concurrency workers until the duration elapsed (or the
+		request count is reached) and returns a LoadReport. New files and
+		collections join the targets as they are created. Latencies are
+		measured around the Connection calls: the time to send the request
+		and read the whole answer.
+	"""
+	def __init__(self, settings, profile):
+		""" Set up the object
+
+			:param settings: Connection settings, as for Client
+			:type  settings: Dict
+
+			:param profile: Workload to run
+			:type  profile: WorkloadProfile
+		"""
+		self.connection = Connection(settings)
+		self.pool = ConnectionPool(self.connection)
+		self.profile = profile
+		self.collections = []
+		self.files = []
+		self._lock = threading.Lock()
+		self._created = 0
+		self._payload = None
+
+	def _data(self, rng, size):
+		# slices of one random buffer: generating data must not slow the load down
+		if self._payload is None or len(self._payload) < size * 2:
+			self._payload = os.urandom(max(size * 2, 65536))
+		start = rng.randint(0, len(self._payload) - size)
+		return self._payload[start:start + size]
+
+	def _name(self, prefix):
+		with self._lock:
+			self._created += 1
+			return '%s%d-%d' % (prefix, self._created, int(time.time() * 1000) % 100000)
+
+	def prepare(self):
+		""" Create the initial tree: profile.depth levels of profile.fanout
+			collections, with profile.files files in each
+		"""
+		profile = self.profile
+		rng = random.Random(profile.seed)
+		self.collections = [profile.root]
+		level = [profile.root]
+		for depth in range(profile.depth):
+			level = [parent + 'c%d/' % index for parent in level for index in range(profile.fanout)]
+			self.collections.extend(level)
+		files = []
+		for collection in self.collections:
+			files.extend((collection + 'f%d' % index, _choice(rng, profile.sizes)) for index in range(profile.files))
+
+		def mkcol(collection):
+			resp, content = self.pool.get().send_mkcol(urllib.quote(collection))
+			if resp.status not in (201, 405):#405: exists already
+				raise ValueError('MKCOL %s: %s' % (collection, resp.status))
+		mkcol(profile.root)
+		for depth in range(1, profile.depth + 1):
+			TaskPool(profile.concurrency).map(mkcol, [c for c in self.collections if c.count('/') ==
+													 profile.root.count('/') + depth])
+
+		def put(item):
+			path, size = item
+			resp, content = self.pool.get().send_put(urllib.quote(path), self._data(rng, size))
+			if resp.status >= 300:
+				raise ValueError('PUT %s: %s' % (path, resp.status))
+		TaskPool(profile.concurrency).map(put, files)
+		self.files = [path for path, size in files]
+
+	def _operation(self, rng, method, connection):
+		""" Send one request. Returns the status and the body bytes moved.
+		"""
+		with self._lock:
+			collection = rng.choice(self.collections)
+			path = rng.choice(self.files) if self.files else None
+		if method in ('GET', 'HEAD', 'DELETE') and path is None:
+			method, path = 'PUT', None
+		if method == 'PROPFIND':
+			resp, content = connection.send_propfind(urllib.quote(collection), ['resourcetype', 'getcontentlength',
+																				 'getetag'], 1, raw=True)
+			return method, resp.status, len(content)
+		if method == 'GET':
+			resp, content = connection.send_get(urllib.quote(path))
+			return method, resp.status, len(content)
+		if method == 'HEAD':
+			return method, connection.send_head(urllib.quote(path)).status, 0
+		if method == 'PUT':
+			if path is None or rng.random() < 0.5:
+				path = collection + self._name('new')
+				new = True
+			else:
+				new = False
+			data = self._data(rng, _choice(rng, self.profile.sizes))
+			resp, content = connection.send_put(urllib.quote(path), data)
+			if new and resp.status < 300:
+				with self._lock:
+					self.files.append(path)
+			return method, resp.status, len(data)
+		if method == 'MKCOL':
+			path = collection + self._name('col') + '/'
+			resp, content = connection.send_mkcol(urllib.quote(path))
+			if resp.status < 300:
+				with self._lock:
+					self.collections.append(path)
+			return method, resp.status, 0
+		with self._lock:
+			if path in self.files:
+				self.files.remove(path)
+		resp, content = connection.send_delete(urllib.quote(path))
+		return method, resp.status, 0
+
+	def run(self):
+		""" Send the load
+
+			Returns a LoadReport.
+		"""
+		profile = self.profile
+		if not self.collections:
+			self.prepare()
+		mix = sorted(profile.mix.items())
+		samples, errors, sizes = {}, {}, {}
+		remaining = [profile.requests]
+		start = time.time()
+		deadline = start + profile.duration
+
+		def worker(index):
+			rng = random.Random(None if profile.seed is None else profile.seed + index + 1)
+			connection = self.pool.get()
+			mine, failed, moved = {}, {}, {}
+			while time.time() < deadline:
+				if remaining[0] is not None:
+					with self._lock:
+						if remaining[0] <= 0:
+							break
+						remaining[0] -= 1
+				method = _choice(rng, mix)
+				began = time.time()
+				try:
+					method, status, size = self._operation(rng, method, connection)
+				except Exception:
+					failed[method] = failed.get(method, 0) + 1
+					self.pool.reset()
+					connection = self.pool.get()
+					continue
+				elapsed = time.time() - began
+				if status >= 400:
+					failed[method] = failed.get(method, 0) + 1
+				else:
+					mine.setdefault(method, []).append(elapsed)
+					moved[method] = moved.get(method, 0) + size
+			with self._lock:
+				for method, values in mine.items():
+					samples.setdefault(method, []).extend(values)
+				for method, count in failed.items():
+					errors[method] = errors.get(method, 0) + count
+				for method, size in moved.items():
+					sizes[method] = sizes.get(method, 0) + size
+
+		TaskPool(profile.concurrency).map(worker, range(profile.concurrency))
+		return LoadReport(time.time() - start, samples, errors, sizes)
+
+	def cleanup(self):
+		""" Delete the tree
+		"""
+		self.connection.send_delete(urllib.quote(self.profile.root))
+		self.collections, self.files = [], []
@@ -0,0 +1,220 @@
+""" Lock Module
+
+	Lock manager: acquisition, background refresh and automatic If headers
+"""
+import time
+import atexit
+import urlparse
+import threading
+import httplib2#fimxe: this is imported only for exceptions
+
+class LockError(httplib2.HttpLib2Error): pass
+
+class HeldLock(object):
+	""" A lock held by a LockManager
+	"""
+	def __init__(self, path, token, timeout, depth):
+		self.path = path
+		self.token = token
+		self.timeout = timeout
+		self.depth = depth
+		self.refreshed = time.time()
+		self.refreshes = 0
+
+	def due(self, ratio):
+		""" Time at which the lock must be refreshed, None if it never expires
+		"""
+		if self.timeout is None:
+			return None
+		return self.refreshed + self.timeout * ratio
+
+	def covers(self, path):
+		""" Whether a write to path falls under this lock
+		"""
+		if path == self.path:
+			return True
+		if self.depth == 'infinity':
+			return path.startswith(self.path.rstrip('/') + '/')
+		return False
+
+class LockManager(object):
+	""" Acquire WebDAV locks and keep them alive.
+
+		Once attached to a Connection, every write request (PUT, PATCH,
+		DELETE, MKCOL, PROPPATCH, COPY, MOVE) to a path covered by a held lock
+		gets the matching "If" header. A background thread refreshes each
+		lock when refresh_ratio of its timeout has elapsed, so that long write
+		sessions never lose their locks. release_all() is called on exit.
+	"""
+	def __init__(self, connection, timeout=600, refresh_ratio=0.75, on_lost=None):
+		""" Set up the object and attach it to the connection
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param timeout: Requested lock timeout in seconds. 600 by default
+			:type  timeout: Integer
+
+			:param refresh_ratio: Fraction of the timeout after which a lock is refreshed. 0.75 by default
+			:type  refresh_ratio: Float
+
+			:param on_lost: Called with the path of a lock that could not be refreshed
+			:type  on_lost: Callable
+		"""
+		self.connection = connection
+		self.timeout = timeout
+		self.refresh_ratio = refresh_ratio
+		self.on_lost = on_lost
+		self.locks = connection.locks
+		self.lost = []
+		self._cond = threading.Condition()
+		self._thread = None
+		self._stopped = False
+		# the refresh thread needs its own http object
+		self._refresher = connection.clone()
+		self._refresher.lock_manager = None
+		connection.lock_manager = self
+		atexit.register(self.close)
+
+	def _path(self, uri):
+		return urlparse.urlparse(uri).path
+
+	def acquire(self, path, timeout=None, maxdepth=0):
+		""" Lock a resource. Re-acquiring a held lock reuses it.
+
+			:param path: Path (without host) to the resource. Must already be quoted
+			:type  path: String
+
+			:param timeout: Requested timeout in seconds. Defaults to the manager timeout
+			:type  timeout: Integer
+
+			:param maxdepth: 0 for the resource only, -1 for a collection and its whole content
+			:type  maxdepth: Integer
+
+			Returns the LockToken.
+		"""
+		key = self._path(self.connection.get_uri(path))
+		with self._cond:
+			held = self.locks.get(key)
+			if held is not None:
+				return held.token
+		if timeout is None:
+			timeout = self.timeout
+		resp, content, token = self.connection.send_lock(path, timeout, maxdepth=maxdepth)
+		if token is None:
+			raise LockError([resp, content])
+		if token.timeout is None and 'timeout' in resp:
+			value = resp['timeout'].strip()
+			if value.lower().startswith('second-'):
+				token.timeout = int(value[7:])
+		with self._cond:
+			self.locks[key] = HeldLock(key, token, token.timeout, token.depth)
+			self._start()
+			self._cond.notify()
+		return token
+
+	def release(self, path):
+		""" Release a held lock
+
+			:param path: Path (without host) to the resource. Must already be quoted
+			:type  path: String
+
+			Returns the UNLOCK response, None if no lock was held on path.
+		"""
+		key = self._path(self.connection.get_uri(path))
+		with self._cond:
+			held = self.locks.pop(key, None)
+		if held is None:
+			return None
+		resp, content = self.connection.send_unlock(path, held.token)
+		return resp
+
+	def release_all(self):
+		""" Release every held lock
+		"""
+		with self._cond:
+			held = self.locks.values()
+			self.locks.clear()
+		for lock in held:
+			try:
+				self._refresher.send_unlock(lock.path, lock.token)
+			except Exception:
+				pass
+
+	def close(self):
+		""" Stop refreshing and release every lock
+		"""
+		with self._cond:
+			self._stopped = True
+			self._cond.notify()
+		self.release_all()
+		if self.connection.lock_manager is self:
+			self.connection.lock_manager = None
+
+	def tokens_for(self, path):
+		""" Tokens of the held locks covering an absolute path
+		"""
+		with self._cond:
+			return [lock.token for lock in self.locks.values() if lock.covers(path)]
+
+	def if_header(self, uri, destination=None):
+		""" Build the If header for a write to uri (and destination, for
+			COPY and MOVE). Returns None when no held lock applies.
+
+			:param uri: Full uri of the request
+			:type  uri: String
+
+			:param destination: Full uri of the Destination header, if any
+			:type  destination: String
+		"""
+		lists = []
+		for target in (uri, destination):
+			if target is None:
+				continue
+			tokens = self.tokens_for(self._path(target))
+			if tokens:
+				lists.append('<%s> %s' % (target, ' '.join('(<%s>)' % t.bare for t in tokens)))
+		return ' '.join(lists) or None
+
+	def _start(self):
+		if self._thread is None or not self._thread.is_alive():
+			self._thread = threading.Thread(target=self._run)
+			self._thread.daemon = True
+			self._thread.start()
+
+	def _run(self):
+		while True:
+			with self._cond:
+				if self._stopped:
+					return
+				now = time.time()
+				dues = [(lock.due(self.refresh_ratio), lock) for lock in self.locks.values()
+						if lock.timeout is not None]
+				due = [lock for when, lock in dues if when <= now]
+				if not due:
+					waits = [when - now for when, lock in dues]
+					self._cond.wait(min(waits) if waits else None)
+					continue
+			for lock in due:
+				self._refresh(lock)
+
+	def _refresh(self, lock):
+		try:
+			resp, content, token = self._refresher.send_lock(lock.path, lock.timeout,
+															 refresh_token=lock.token)
+		except Exception:
+			token = None
+		with self._cond:
+			if self.locks.get(lock.path) is not lock:#released meanwhile
+				return
+			if token is None:
+				del self.locks[lock.path]
+				self.lost.append(lock.path)
+			else:
+				lock.refreshed = time.time()
+				lock.refreshes += 1
+				if token.timeout is not None:
+					lock.timeout = token.timeout
+				return
+		if self.on_lost is not None:
+			self.on_lost(lock.path)
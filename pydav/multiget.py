@@ -0,0 +1,163 @@
+""" Multiget Module
+
+	Bulk download of many small resources with CardDAV/CalDAV multiget
+	REPORTs
+"""
+import urllib
+import urlparse
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple
+from xml.sax.saxutils import escape
+from answer import Answer
+from workers import ConnectionPool, TaskPool
+
+CARDDAV = 'urn:ietf:params:xml:ns:carddav'
+CALDAV = 'urn:ietf:params:xml:ns:caldav'
+
+# report and data property of each kind of collection, and the DAV
+# compliance class announcing it
+KINDS = {
+	'addressbook': (CARDDAV, 'addressbook-multiget', 'address-data', 'addressbook'),
+	'calendar': (CALDAV, 'calendar-multiget', 'calendar-data', 'calendar-access'),
+}
+
+# answers of servers that do not know the report
+_UNSUPPORTED = (400, 403, 405, 415, 422, 501)
+
+class FetchedResource(namedtuple('FetchedResource', ['href', 'status', 'etag', 'data'])):
+	""" One resource fetched by MultiGet. href is the requested href, status
+		the HTTP status code of the resource and data its content, None
+		unless status is 200.
+	"""
+	__slots__ = ()
+
+def _key(href):
+	return urllib.unquote(urlparse.urlsplit(href).path)
+
+def _status(line):
+	try:
+		return int(line.split()[1])
+	except (AttributeError, IndexError, ValueError):
+		return None
+
+def guess_kind(connection):
+	""" Kind of multiget the server announces in its DAV header: "addressbook",
+		"calendar" or None
+	"""
+	for kind, (ns, report, data, dav_class) in sorted(KINDS.items()):
+		if dav_class in getattr(connection, 'dav', ()):
+			return kind
+	return None
+
+class MultiGet(object):
+	""" Fetch many resources of a collection with few requests.
+
+		hrefs are sent by batches of batch hrefs in "addressbook-multiget"
+		or "calendar-multiget" REPORTs, several batches at once. Each 207
+		answer is parsed incrementally (Answer.iterresponses), one response
+		at a time. Resources missing from the answers, and all of them when
+		the server has no multiget report, are fetched with concurrent GETs.
+	"""
+	def __init__(self, connection, kind=None, batch=100, workers=4):
+		""" Set up the object
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param kind: "addressbook" or "calendar". Guessed from the DAV header of the server by default
+			:type  kind: String
+
+			:param batch: Number of hrefs per REPORT. 100 by default
+			:type  batch: Integer
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+		"""
+		if kind is None:
+			kind = guess_kind(connection)
+		elif kind not in KINDS:
+			raise ValueError("unknown multiget kind: %r" % kind)
+		self.connection = connection
+		self.pool = ConnectionPool(connection)
+		self.kind = kind
+		self.batch = max(batch, 1)
+		self.workers = workers
+		self.supported = kind is not None and 'REPORT' in connection.methods
+		# statistics
+		self.reports = 0
+		self.gets = 0
+
+	def _body(self, hrefs):
+		ns, report, data, dav_class = KINDS[self.kind]
+		return '<C:%s xmlns:D="DAV:" xmlns:C="%s"><D:prop><D:getetag/><C:%s/></D:prop>%s</C:%s>' % (
+			report, ns, data, ''.join('<D:href>%s</D:href>' % escape(href) for href in hrefs), report)
+
+	def _report(self, collection, hrefs):
+		""" Fetch a batch with a multiget REPORT. Returns the FetchedResource
+			found in the answer, None if the server does not support it.
+		"""
+		ns, report, data, dav_class = KINDS[self.kind]
+		# no Depth header: the hrefs are named in the body (RFC 4791 7.9, RFC 6352 8.7)
+		resp, content = self.pool.get().send_report(collection, self._body(hrefs), -1, raw=True)
+		if resp.status in _UNSUPPORTED:
+			self.supported = False
+			return None
+		if resp.status != 207:
+			raise httplib2.HttpLib2Error([resp, content])
+		requested = dict((_key(href), href) for href in hrefs)
+		found = {}
+		for response in Answer.iterresponses(content):
+			href = requested.get(_key(response.findtext('{DAV:}href') or ''))
+			if href is None:
+				continue
+			status = _status(response.findtext('{DAV:}status'))
+			etag = value = None
+			for propstat in response.iterfind('{DAV:}propstat'):
+				if _status(propstat.findtext('{DAV:}status')) != 200:
+					continue
+				node = propstat.find('{DAV:}prop/{%s}%s' % (ns, data))
+				if node is not None:
+					value, status = (node.text or '').encode('utf-8'), 200
+				etag = propstat.findtext('{DAV:}prop/{DAV:}getetag') or etag
+			if status == 200 and value is None:
+				status = None#no data: fetched again with a GET
+			if status is not None:
+				found[href] = FetchedResource(href, status, etag, value)
+		return found
+
+	def _get(self, href):
+		resp, content = self.pool.get().send_get(href)
+		if resp.status == 200:
+			return FetchedResource(href, 200, resp.get('etag'), content)
+		return FetchedResource(href, resp.status, None, None)
+
+	def fetch(self, collection, hrefs):
+		""" Fetch resources of a collection
+
+			:param collection: Path (without host) to the collection. Must already be quoted
+			:type  collection: String
+
+			:param hrefs: hrefs (absolute quoted paths, as found in PROPFIND answers) of the resources
+			:type  hrefs: List
+
+			Returns the list of FetchedResource, in the order of hrefs.
+		"""
+		hrefs = list(hrefs)
+		results = {}
+		missing = []
+		if self.supported:
+			batches = [hrefs[index:index + self.batch] for index in range(0, len(hrefs), self.batch)]
+			def run(batch):
+				if self.supported:
+					return True, self._report(collection, batch) or {}
+				return False, {}
+			for batch, (sent, found) in zip(batches, TaskPool(self.workers).map(run, batches)):
+				self.reports += sent
+				results.update(found)
+				missing.extend(href for href in batch if href not in found)
+		else:
+			missing = hrefs
+		self.gets += len(missing)
+		for fetched in TaskPool(self.workers).map(self._get, missing):
+			results[fetched.href] = fetched
+		return [results[href] for href in hrefs]
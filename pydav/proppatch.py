@@ -0,0 +1,105 @@
+""" Proppatch Module
+
+	Property updates of many resources at once
+"""
+from collections import namedtuple
+from answer import Answer, build_propertyupdate
+from workers import ConnectionPool, TaskPool
+
+class PropPatchResult(namedtuple('PropPatchResult', ['href', 'status', 'properties'])):
+	""" Outcome of the PROPPATCH of one resource. status is the HTTP status
+		code of the request, properties maps each property name (as given)
+		to the status code reported for it in the 207 answer; it is empty
+		when the request itself failed.
+	"""
+	__slots__ = ()
+
+	@property
+	def ok(self):
+		return 200 <= self.status < 300 and all(200 <= s < 300 for s in self.properties.values())
+
+def _status(line):
+	try:
+		return int(line.split()[1])
+	except (AttributeError, IndexError, ValueError):
+		return None
+
+def _qualified(name):
+	return name if name.startswith('{') else '{DAV:}' + name
+
+class BulkPropPatch(object):
+	""" Set and remove properties of many resources, one PROPPATCH per
+		resource, sent concurrently.
+
+		Property names are either in the DAV: namespace ("displayname") or
+		qualified ("{http://owncloud.org/ns}favorite"); the given prefixes
+		are used for their namespaces in the request bodies.
+	"""
+	def __init__(self, connection, workers=4, namespaces=None):
+		""" Set up the object
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param workers: Number of concurrent requests. 4 by default
+			:type  workers: Integer
+
+			:param namespaces: Prefix -> namespace of the prefixes to use in the requests
+			:type  namespaces: Dict
+		"""
+		self.connection = connection
+		self.pool = ConnectionPool(connection)
+		self.workers = workers
+		self.namespaces = namespaces
+		# the bodies of resources with the same changes are the same
+		self._bodies = {}
+
+	def _body(self, changes):
+		key = tuple(sorted(changes.items()))
+		body = self._bodies.get(key)
+		if body is None:
+			if len(self._bodies) >= 1024:
+				self._bodies.clear()
+			body = self._bodies[key] = build_propertyupdate(changes, self.namespaces)
+		return body
+
+	def _send(self, href, changes):
+		resp, content = self.pool.get().send_proppatch(href, self._body(changes), raw=True)
+		properties = {}
+		if resp.status == 207:
+			names = dict((_qualified(name), name) for name in changes)
+			for response in Answer.iterresponses(content):
+				for propstat in response.iterfind('{DAV:}propstat'):
+					status = _status(propstat.findtext('{DAV:}status'))
+					for node in propstat.iterfind('{DAV:}prop/*'):
+						if node.tag in names:
+							properties[names[node.tag]] = status
+		elif 200 <= resp.status < 300:
+			properties = dict((name, resp.status) for name in changes)
+		return PropPatchResult(href, resp.status, properties)
+
+	def run(self, updates):
+		""" Update the properties
+
+			:param updates: (href, changes) tuples. hrefs are quoted paths; changes map property names to their new value, None to remove the property
+			:type  updates: List
+
+			Returns the list of PropPatchResult, in the same order.
+		"""
+		return TaskPool(self.workers).map(lambda update: self._send(*update), list(updates))
+
+	@staticmethod
+	def summary(results):
+		""" Aggregate results by property
+
+			:param results: Results returned by run()
+			:type  results: List
+
+			Returns a dict mapping each property name to a dict of status code -> number of resources.
+		"""
+		counts = {}
+		for result in results:
+			for name, status in result.properties.items():
+				by_status = counts.setdefault(name, {})
+				by_status[status] = by_status.get(status, 0) + 1
+		return counts
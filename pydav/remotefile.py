@@ -0,0 +1,448 @@
+""" RemoteFile Module
+"""
+import os
+import sys
+import threading
+import httplib2#fimxe: this is imported only for exceptions
+from collections import OrderedDict
+
+class RemoteFile(object):
+	""" Read only file-like object on top of a remote resource.
+
+		Data is fetched with "Range" GET requests, one block (blocksize bytes)
+		at a time, and kept in a fixed size block cache with LRU eviction.
+		Adjacent missing blocks are always coalesced into a single request.
+		When reads are sequential, the read-ahead window grows (doubling)
+		up to "readahead" blocks so that streaming a file costs few requests
+		while random accesses only fetch what they need.
+	"""
+	def __init__(self, connection, path, blocksize=65536, cacheblocks=64,
+				 readahead=16, size=None):
+		""" Set up the object. No request is sent until the first read.
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param path: The path (without host) to the resource. Must already be quoted
+			:type  path: String
+
+			:param blocksize: Size of the cached blocks in bytes. 64kB by default
+			:type  blocksize: Integer
+
+			:param cacheblocks: Maximum number of blocks kept in memory. 64 by default
+			:type  cacheblocks: Integer
+
+			:param readahead: Maximum number of blocks to read ahead for sequential reads. 16 by default, 0 disables it
+			:type  readahead: Integer
+
+			:param size: Size of the resource, if already known. Saves a HEAD request
+			:type  size: Integer
+		"""
+		self.connection = connection
+		self.path = path
+		self.blocksize = blocksize
+		self.cacheblocks = max(cacheblocks, 1)
+		self.readahead = readahead
+		self.blocks = OrderedDict()
+		self.requests = 0
+		self.closed = False
+		self._size = size
+		self._pos = 0
+		self._next_block = None
+		self._window = 0
+
+	@property
+	def size(self):
+		if self._size is None:
+			resp = self.connection.send_head(self.path)
+			if resp.status < 200 or resp.status >= 300:
+				raise httplib2.HttpLib2Error([resp, ''])
+			self._size = int(resp['content-length'])
+		return self._size
+
+	def _check_closed(self):
+		if self.closed:
+			raise ValueError("I/O operation on closed file")
+
+	def seekable(self):
+		return True
+
+	def readable(self):
+		return True
+
+	def writable(self):
+		return False
+
+	def tell(self):
+		self._check_closed()
+		return self._pos
+
+	def seek(self, offset, whence=os.SEEK_SET):
+		""" Move the file cursor. Does not send any request.
+
+			:param offset: Offset, relative to whence
+			:type  offset: Integer
+
+			:param whence: os.SEEK_SET, os.SEEK_CUR or os.SEEK_END
+			:type  whence: Integer
+		"""
+		self._check_closed()
+		if whence == os.SEEK_SET:
+			pos = offset
+		elif whence == os.SEEK_CUR:
+			pos = self._pos + offset
+		elif whence == os.SEEK_END:
+			pos = self.size + offset
+		else:
+			raise ValueError("invalid whence (%r)" % whence)
+		if pos < 0:
+			raise IOError("negative seek position %d" % pos)
+		self._pos = pos
+		return self._pos
+
+	def read(self, size=-1):
+		""" Read up to size bytes from the current position. Reads until the
+			end of the resource if size is negative.
+
+			:param size: Number of bytes to read
+			:type  size: Integer
+		"""
+		self._check_closed()
+		end = self.size if size is None or size < 0 else min(self._pos + size, self.size)
+		if end <= self._pos:
+			return ''
+
+		first = self._pos // self.blocksize
+		last = (end - 1) // self.blocksize
+		blocks = self._get_blocks(first, last)
+
+		start = self._pos - first * self.blocksize
+		data = ''.join(blocks)[start:start + end - self._pos]
+		self._pos = end
+		return data
+
+	def readinto(self, buf):
+		""" Read into a pre-allocated, writable bytes-like object
+
+			:param buf: Destination buffer. Up to len(buf) bytes are read
+			:type  buf: bytearray
+		"""
+		data = self.read(len(buf))
+		buf[:len(data)] = data
+		return len(data)
+
+	def readall(self):
+		return self.read()
+
+	def _get_blocks(self, first, last):
+		# Sequential access detection: grow the window while reads keep
+		# starting where the previous one stopped, reset it otherwise.
+		if self._next_block is not None and first in (self._next_block - 1, self._next_block):
+			self._window = min(max(self._window * 2, 1), self.readahead)
+		else:
+			self._window = 0
+		self._next_block = last + 1
+
+		# only read ahead on a miss, so that a streaming reader sends one
+		# request per window instead of one per block
+		wanted = range(first, last + 1)
+		if self._window and [i for i in wanted if i not in self.blocks]:
+			lastblock = (self.size - 1) // self.blocksize
+			wanted = range(first, min(last + self._window, lastblock) + 1)
+		found = {}
+		missing = []
+		for index in wanted:
+			if index in self.blocks:
+				self.blocks[index] = found[index] = self.blocks.pop(index)
+			else:
+				missing.append(index)
+
+		# coalesce adjacent misses into one request each
+		run = []
+		for index in missing:
+			if run and index != run[-1] + 1:
+				found.update(self._fetch(run[0], run[-1]))
+				run = []
+			run.append(index)
+		if run:
+			found.update(self._fetch(run[0], run[-1]))
+
+		for index in missing:
+			self.blocks[index] = found[index]
+		while len(self.blocks) > self.cacheblocks:
+			self.blocks.popitem(last=False)
+		return [found[index] for index in range(first, last + 1)]
+
+	def _fetch(self, first, last):
+		begin = first * self.blocksize
+		end = min((last + 1) * self.blocksize, self.size) - 1
+		headers = {'Range': 'bytes=%d-%d' % (begin, end)}
+		resp, content = self.connection.send_get(self.path, headers=headers)
+		self.requests += 1
+		if resp.status == 200:
+			#no range support on the server side: we got the whole resource
+			content = content[begin:end + 1]
+		elif resp.status != 206:
+			raise httplib2.HttpLib2Error([resp, content])
+
+		fetched = {}
+		for index in range(first, last + 1):
+			offset = (index - first) * self.blocksize
+			fetched[index] = content[offset:offset + self.blocksize]
+		return fetched
+
+	def close(self):
+		self.blocks.clear()
+		self.closed = True
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __iter__(self):
+		while True:
+			chunk = self.read(self.blocksize)
+			if not chunk:
+				return
+			yield chunk
+
+class WritableRemoteFile(object):
+	""" Write only file-like object on top of a remote resource.
+
+		write() and seek() calls are buffered locally as a sorted list of
+		dirty regions; overlapping and adjacent writes are merged. Regions
+		are sent as PATCH requests with an "X-Update-Range" header when the
+		server supports SabreDAV partial updates, or as "Content-Range" PUT
+		requests otherwise, so that only the modified bytes go over the
+		network.
+
+		Dirty data is flushed when it grows over max_dirty bytes, at the
+		latest flush_interval seconds after the oldest unflushed write(),
+		and on close(). Timed flushes run in a timer thread, on a clone of
+		the connection; their errors are raised by the next call.
+	"""
+	def __init__(self, connection, path, mode='r+', max_dirty=4194304,
+				 flush_interval=None, size=None):
+		""" Set up the object
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param path: The path (without host) to the resource. Must already be quoted
+			:type  path: String
+
+			:param mode: 'w' truncates (or creates) the resource, 'a' appends to it, 'r+' updates it in place
+			:type  mode: String
+
+			:param max_dirty: Amount of buffered bytes triggering a flush. 4MB by default
+			:type  max_dirty: Integer
+
+			:param flush_interval: Maximum age in seconds of buffered data before it is flushed. Disabled by default
+			:type  flush_interval: Float
+
+			:param size: Size of the resource, if already known. Saves a HEAD request
+			:type  size: Integer
+		"""
+		if mode not in ('w', 'a', 'r+'):
+			raise ValueError("invalid mode: %r" % mode)
+		self.connection = connection
+		self.path = path
+		self.mode = mode
+		self.max_dirty = max_dirty
+		self.flush_interval = flush_interval
+		self.dirty = []
+		self.dirty_bytes = 0
+		self.requests = 0
+		self.closed = False
+		self._lock = threading.RLock()
+		self._timer = None
+		self._background = None
+		self._error = None
+
+		if mode == 'w':
+			resp, content = self.connection.send_put(self.path, '')
+			self._check(resp, content)
+			self.size = 0
+		elif size is not None:
+			self.size = size
+		else:
+			resp = self.connection.send_head(self.path)
+			self._check(resp, '')
+			self.size = int(resp['content-length'])
+		self._pos = self.size if mode == 'a' else 0
+
+	def _check(self, resp, content):
+		if resp.status < 200 or resp.status >= 300:
+			raise httplib2.HttpLib2Error([resp, content])
+
+	def _check_closed(self):
+		if self.closed:
+			raise ValueError("I/O operation on closed file")
+		if self._error is not None:#of a timed flush
+			error, self._error = self._error, None
+			raise error[0], error[1], error[2]
+
+	def seekable(self):
+		return True
+
+	def readable(self):
+		return False
+
+	def writable(self):
+		return True
+
+	def tell(self):
+		self._check_closed()
+		return self._pos
+
+	def seek(self, offset, whence=os.SEEK_SET):
+		""" Move the file cursor. Does not send any request.
+
+			:param offset: Offset, relative to whence
+			:type  offset: Integer
+
+			:param whence: os.SEEK_SET, os.SEEK_CUR or os.SEEK_END
+			:type  whence: Integer
+		"""
+		self._check_closed()
+		if whence == os.SEEK_SET:
+			pos = offset
+		elif whence == os.SEEK_CUR:
+			pos = self._pos + offset
+		elif whence == os.SEEK_END:
+			pos = self._end() + offset
+		else:
+			raise ValueError("invalid whence (%r)" % whence)
+		if pos < 0:
+			raise IOError("negative seek position %d" % pos)
+		self._pos = pos
+		return self._pos
+
+	def _end(self):
+		if self.dirty:
+			return max(self.size, self.dirty[-1][0] + len(self.dirty[-1][1]))
+		return self.size
+
+	def write(self, data):
+		""" Buffer data at the current position. May trigger a flush.
+
+			:param data: Data to write
+			:type  data: String
+		"""
+		with self._lock:
+			self._check_closed()
+			if not data:
+				return 0
+			if self.mode == 'a':
+				self._pos = self._end()
+			self._merge(self._pos, data)
+			self._pos += len(data)
+
+			if self.dirty_bytes >= self.max_dirty:
+				self.flush()
+			elif self.flush_interval is not None and self._timer is None:
+				self._timer = threading.Timer(self.flush_interval, self._flush_due)
+				self._timer.daemon = True
+				self._timer.start()
+			return len(data)
+
+	def writelines(self, lines):
+		for line in lines:
+			self.write(line)
+
+	def _merge(self, begin, data):
+		end = begin + len(data)
+		if self.dirty:
+			# fast path for sequential writes: the last region is updated or
+			# extended in place
+			offset, region = self.dirty[-1]
+			if offset <= begin <= offset + len(region):
+				before = len(region)
+				region[begin - offset:end - offset] = data
+				self.dirty_bytes += len(region) - before
+				return
+			if begin > offset + len(region):
+				self.dirty.append((begin, bytearray(data)))
+				self.dirty_bytes += len(data)
+				return
+		merged = bytearray(data)
+		kept = []
+		for offset, region in self.dirty:
+			region_end = offset + len(region)
+			if region_end < begin or offset > end:
+				kept.append((offset, region))
+				continue
+			self.dirty_bytes -= len(region)
+			# overlapping or adjacent: the new data wins on the overlap
+			if offset < begin:
+				merged = region[:begin - offset] + merged
+				begin = offset
+			if region_end > end:
+				merged = merged + region[end - offset:]
+				end = region_end
+		kept.append((begin, merged))
+		kept.sort(key=lambda item: item[0])
+		self.dirty = kept
+		self.dirty_bytes += len(merged)
+
+	def flush(self):
+		""" Send every dirty region to the server
+		"""
+		with self._lock:
+			self._check_closed()
+			self._send(self.connection)
+
+	def _flush_due(self):
+		with self._lock:
+			self._timer = None
+			if self.closed or not self.dirty:
+				return
+			# the caller may be using the connection for other requests
+			if self._background is None:
+				self._background = self.connection.clone()
+			try:
+				self._send(self._background)
+			except Exception:
+				self._error = sys.exc_info()
+
+	def _send(self, connection):
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		newsize = self._end()
+		# regions are forgotten as soon as they are sent: after a failure,
+		# the next flush only sends the others
+		while self.dirty:
+			offset, region = self.dirty[0]
+			body = str(region)
+			if 'PATCH' in connection.methods:
+				end = offset + len(body) - 1
+				headers = {'X-Update-Range': 'bytes=%d-%d' % (offset, end)}
+				resp, content = connection.send_patch(self.path, body, headers)
+			else:
+				resp, content = connection.send_put_partial(self.path, body,
+															offset, newsize)
+			self.requests += 1
+			self._check(resp, content)
+			self.dirty.pop(0)
+			self.dirty_bytes -= len(region)
+			self.size = max(self.size, offset + len(region))
+
+	def close(self):
+		""" Flush the buffered data and close the file
+		"""
+		with self._lock:
+			if self.closed:
+				return
+			try:
+				self.flush()
+			finally:
+				self.closed = True
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
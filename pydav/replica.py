@@ -0,0 +1,400 @@
+""" Replica Module
+
+	Several WebDAV servers holding the same content: reads go to the
+	fastest healthy one, writes go to all of them
+"""
+import os
+import copy
+import time
+import Queue
+import urllib
+import threading
+import httplib2#fimxe: this is imported only for exceptions
+from collections import deque
+from client import Client
+from checksum import Checksums
+from loadgen import percentile
+
+class QuorumError(httplib2.HttpLib2Error):
+	""" A write acknowledged by fewer replicas than the quorum. successes
+		lists the names of the replicas that applied it, failures maps the
+		others to their error.
+	"""
+	def __init__(self, successes, failures, quorum):
+		httplib2.HttpLib2Error.__init__(self, '%d of %d replicas, quorum is %d' % (
+			len(successes), len(successes) + len(failures), quorum))
+		self.successes = successes
+		self.failures = failures
+
+def _definitive(error):
+	""" Whether an error is the answer of a working server (a status below
+		500, a 404 for instance): other replicas would answer the same
+	"""
+	if isinstance(error, httplib2.HttpLib2Error) and error.args and isinstance(error.args[0], list):
+		resp = error.args[0][0]
+		return getattr(resp, 'status', 500) < 500
+	return False
+
+class Replica(object):
+	""" One server of a ReplicatedClient and its health: EWMAs of the
+		latency of its answers and of its error rate, and the latencies of
+		its last answers (for the hedging threshold). After a failure it is
+		left out of the reads for a backoff delay, doubled on each
+		consecutive failure.
+
+		Client objects are not thread safe, and a hedged request may still
+		run when the next one starts: each request takes an idle clone of
+		the client (acquire) and gives it back when done (release).
+	"""
+	def __init__(self, name, client, alpha=0.2, window=100, backoff=1.0, max_backoff=60.0):
+		self.name = name
+		self.client = client
+		self.alpha = alpha
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.latency = None
+		self.errors = 0.0
+		self.samples = deque(maxlen=window)
+		self.failures = 0
+		self.down_until = 0.0
+		# statistics
+		self.requests = 0
+		self.wins = 0
+		self._idle = [client]
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		with self._lock:
+			self.requests += 1
+			if self._idle:
+				return self._idle.pop()
+		other = copy.copy(self.client)
+		other.connection = self.client.connection.clone()
+		return other
+
+	def release(self, client, broken=False):
+		""" Give a client back, or drop it when a failed request left its
+			connection in an unknown state
+		"""
+		if broken:
+			return
+		with self._lock:
+			self._idle.append(client)
+
+	def success(self, latency):
+		with self._lock:
+			self.latency = latency if self.latency is None else \
+				self.alpha * latency + (1 - self.alpha) * self.latency
+			self.errors = (1 - self.alpha) * self.errors
+			self.samples.append(latency)
+			self.failures = 0
+			self.down_until = 0.0
+
+	def failure(self):
+		with self._lock:
+			self.errors = self.alpha + (1 - self.alpha) * self.errors
+			self.failures += 1
+			self.down_until = time.time() + min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+
+	def healthy(self, now=None):
+		return (now or time.time()) >= self.down_until
+
+	def score(self):
+		""" Expected cost of a read: the latency EWMA inflated by the error
+			rate. Replicas never measured score 0, so that they get tried.
+		"""
+		return (self.latency or 0.0) * (1 + 10 * self.errors)
+
+	def hedge_delay(self, ratio, default, min_samples):
+		""" Time to wait for an answer before hedging: the ratio percentile
+			of the recent latencies, default while there are fewer than
+			min_samples of them
+		"""
+		with self._lock:
+			samples = sorted(self.samples)
+		if len(samples) < min_samples:
+			return default
+		return percentile(samples, ratio)
+
+class ReplicatedClient(object):
+	""" Facade over several replicas (one Client each) of the same
+		content, at the same paths.
+
+		getFile, ls and getProperties go to the healthy replica with the
+		best score (see Replica.score). When it has not answered after its
+		hedging threshold (a percentile of its recent latencies) the request
+		is sent to the next one as well and the first answer wins. On a
+		failure (no answer, or a 5xx status) the request fails over to the
+		next replica; any other error status is returned as is. Replicas
+		which just failed are only tried when all of them did.
+
+		sendFile, mkdir, rm and setProperties are sent to every replica at
+		once and return when quorum of them succeeded, raising QuorumError
+		when that is no longer possible. Requests to the slower replicas go
+		on in the background.
+	"""
+	def __init__(self, replicas, quorum=None, alpha=0.2, hedge_percentile=0.95, hedge_delay=1.0,
+				 min_samples=10, backoff=1.0, max_backoff=60.0):
+		""" Set up the object
+
+			:param replicas: Replica name -> Client, or Client settings
+			:type  replicas: Dict
+
+			:param quorum: Number of replicas a write must succeed on. A majority by default
+			:type  quorum: Integer
+
+			:param alpha: Weight of the last measure in the latency and error rate EWMAs. 0.2 by default
+			:type  alpha: Float
+
+			:param hedge_percentile: Percentile of the latencies of a replica after which a read is hedged. 0.95 by default, None disables hedging
+			:type  hedge_percentile: Float
+
+			:param hedge_delay: Hedging threshold in seconds of the replicas with fewer than min_samples latencies. 1 by default
+			:type  hedge_delay: Float
+
+			:param min_samples: Number of latencies needed to use the percentile. 10 by default
+			:type  min_samples: Integer
+
+			:param backoff: Seconds a replica is left out after a failure, doubled on each consecutive one up to max_backoff. 1 by default
+			:type  backoff: Float
+		"""
+		self.replicas = {}
+		for name, replica in sorted(replicas.items()):
+			if not isinstance(replica, Client):
+				replica = Client(dict(replica))
+			self.replicas[name] = Replica(name, replica, alpha, backoff=backoff, max_backoff=max_backoff)
+		if not self.replicas:
+			raise ValueError('no replica')
+		self.quorum = quorum or len(self.replicas) // 2 + 1
+		if self.quorum > len(self.replicas):
+			raise ValueError('quorum %d with %d replicas' % (self.quorum, len(self.replicas)))
+		self.hedge_percentile = hedge_percentile
+		self.hedge_delay = hedge_delay
+		self.min_samples = min_samples
+		# statistics
+		self.hedges = 0
+		self.failovers = 0
+
+	def ranked(self):
+		""" Replicas in the order reads try them: healthy ones by score,
+			then the others by end of backoff
+		"""
+		now = time.time()
+		replicas = sorted(self.replicas.values(), key=lambda replica: replica.name)
+		healthy = sorted([replica for replica in replicas if replica.healthy(now)], key=Replica.score)
+		down = sorted([replica for replica in replicas if not replica.healthy(now)],
+					  key=lambda replica: replica.down_until)
+		return healthy + down
+
+	def _read(self, call, discard=None):
+		""" Run call(client, attempt) on the best replica, hedged and failed
+			over as described in the class. discard(attempt) is called for
+			each attempt whose result is not used, once it is over.
+		"""
+		ranked = self.ranked()
+		results = Queue.Queue()
+		lock = threading.Lock()
+		state = {'done': False}
+
+		def attempt(replica, index):
+			client = replica.acquire()
+			start = time.time()
+			try:
+				outcome = (replica, index, True, call(client, index))
+			except Exception, error:
+				outcome = (replica, index, False, error)
+			elapsed = time.time() - start
+			if outcome[2] or _definitive(outcome[3]):
+				replica.release(client)
+				replica.success(elapsed)
+			else:
+				replica.release(client, broken=True)
+				replica.failure()
+			with lock:
+				late = state['done']
+				if not late:
+					results.put(outcome)
+			if late and discard is not None:
+				discard(index)
+
+		launched = []
+		def launch():
+			replica = ranked[len(launched)]
+			launched.append(replica)
+			thread = threading.Thread(target=attempt, args=(replica, len(launched) - 1))
+			thread.daemon = True
+			thread.start()
+
+		def finish():
+			with lock:
+				state['done'] = True
+			while not results.empty():
+				index = results.get()[1]
+				if discard is not None:
+					discard(index)
+
+		launch()
+		started = time.time()
+		pending, hedging = 1, self.hedge_percentile is not None and len(ranked) > 1
+		last_error = None
+		while True:
+			timeout = None
+			if hedging:
+				delay = ranked[0].hedge_delay(self.hedge_percentile, self.hedge_delay, self.min_samples)
+				timeout = max(started + delay - time.time(), 0)
+			try:
+				replica, index, ok, value = results.get(True, timeout)
+			except Queue.Empty:
+				hedging = False
+				self.hedges += 1
+				launch()
+				pending += 1
+				continue
+			pending -= 1
+			hedging = False
+			if ok:
+				replica.wins += 1
+				finish()
+				return value
+			if _definitive(value):
+				finish()
+				raise value
+			if discard is not None:
+				discard(index)
+			last_error = value
+			if pending:
+				continue
+			if len(launched) == len(ranked):
+				finish()
+				raise last_error
+			self.failovers += 1
+			launch()
+			pending += 1
+
+	def getFile(self, path, local_file_name, extra_headers={}):
+		""" Download a file from the best replica. Each attempt writes to its
+			own temporary file, the winner is renamed to local_file_name.
+
+			:param path: the path of the resource minus the host section
+			:type  path: String
+
+			:param local_file_name: Local file where the resource will be saved
+			:type  local_file_name: String
+
+			Returns the Checksums of the downloaded body, as Client.getFile.
+		"""
+		def part(index):
+			return '%s.replica%d' % (local_file_name, index)
+
+		def fetch(client, index):
+			if client.cache is not None:
+				return index, client.getFile(path, part(index), extra_headers)
+			resp, data = client.connection.send_get(urllib.quote(path), headers=extra_headers)
+			if resp.status < 200 or resp.status >= 300:
+				raise httplib2.HttpLib2Error([resp, data])
+			checksums = Checksums(client._checksums)
+			client._writeChecked(resp, data, part(index), checksums)
+			return index, checksums
+
+		def discard(index):
+			if os.path.exists(part(index)):
+				os.remove(part(index))
+
+		index, checksums = self._read(fetch, discard)
+		if os.path.exists(local_file_name):
+			os.remove(local_file_name)
+		os.rename(part(index), local_file_name)
+		return checksums
+
+	def ls(self, path, maxdepth=1):
+		""" Client.ls on the best replica
+		"""
+		return self._read(lambda client, index: client.ls(path, maxdepth))
+
+	def getProperties(self, path, maxdepth=0, properties=[]):
+		""" Client.getProperties on the best replica
+		"""
+		return self._read(lambda client, index: client.getProperties(path, maxdepth, properties))
+
+	def _write(self, call):
+		""" Run call(client) on every replica at once, return the result of
+			the first one to succeed when quorum of them did
+		"""
+		results = Queue.Queue()
+
+		def attempt(replica):
+			client = replica.acquire()
+			start = time.time()
+			try:
+				outcome = (replica, True, call(client))
+			except Exception, error:
+				outcome = (replica, False, error)
+			elapsed = time.time() - start
+			if outcome[1] or _definitive(outcome[2]):
+				replica.release(client)
+				replica.success(elapsed)
+			else:
+				replica.release(client, broken=True)
+				replica.failure()
+			results.put(outcome)
+
+		for replica in self.replicas.values():
+			thread = threading.Thread(target=attempt, args=(replica,))
+			thread.daemon = True
+			thread.start()
+		successes, failures, first = [], {}, None
+		while True:
+			replica, ok, value = results.get()
+			if ok:
+				if not successes:
+					first = value
+				successes.append(replica.name)
+				if len(successes) >= self.quorum:
+					return first
+			else:
+				failures[replica.name] = value
+				if len(failures) > len(self.replicas) - self.quorum:
+					raise QuorumError(successes, failures, self.quorum)
+
+	def sendFile(self, path, local_file_path, extra_headers={}):
+		""" Client.sendFile on every replica
+		"""
+		def send(client):
+			resp, contents = client.sendFile(path, local_file_path, extra_headers=extra_headers)
+			if resp.status < 200 or resp.status >= 300:
+				raise httplib2.HttpLib2Error([resp, contents])
+			return resp, contents
+		return self._write(send)
+
+	def mkdir(self, path):
+		""" Create a collection on every replica
+		"""
+		def mkcol(client):
+			resp, content = client.connection.send_mkcol(urllib.quote(path))
+			if resp.status not in (200, 201, 405):#405: exists already
+				raise httplib2.HttpLib2Error([resp, content])
+		self._write(mkcol)
+
+	def rm(self, path):
+		""" Delete a resource from every replica. A replica which does not
+			have it counts as a success.
+		"""
+		def delete(client):
+			resp, content = client.connection.send_delete(urllib.quote(path))
+			if resp.status >= 300 and resp.status != 404:
+				raise httplib2.HttpLib2Error([resp, content])
+			return resp, content
+		return self._write(delete)
+
+	def setProperties(self, properties):
+		""" Client.setProperties on every replica. The request body is built
+			once: building it resets the edits recorded by properties.
+		"""
+		path = urllib.quote(properties.href)
+		body = properties.buildProppatch()
+		def proppatch(client):
+			resp, prop = client.connection.send_proppatch(path, body)
+			if resp.status < 200 or resp.status >= 300:
+				raise httplib2.HttpLib2Error([resp, prop])
+			return prop
+		return self._write(proppatch)
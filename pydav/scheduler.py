@@ -0,0 +1,458 @@
+""" Scheduler Module
+
+	Queue of uploads and downloads run by a pool of worker threads
+"""
+import os
+import sys
+import time
+import heapq
+import urllib
+import urlparse
+import threading
+import itertools
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple, deque
+from workers import ConnectionPool
+from transfer import _open_get
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# sort key of the jobs of unknown size: after all the others
+_UNKNOWN = float('inf')
+
+class ProgressEvent(namedtuple('ProgressEvent', ['job', 'transferred', 'total', 'rate', 'finished', 'jobs'])):
+	""" Aggregate progress of a TransferScheduler. job is the TransferJob
+		that moved, transferred the bytes sent or received by all the jobs,
+		total the sum of the known job sizes, rate the recent throughput in
+		bytes per second, finished the number of ended jobs (done, failed or
+		cancelled) and jobs the number of jobs.
+	"""
+	__slots__ = ()
+
+class TransferJob(object):
+	""" An upload or a download of a TransferScheduler
+	"""
+	def __init__(self, scheduler, kind, client, path, local_path, size):
+		self.scheduler = scheduler
+		self.kind = kind
+		self.client = client
+		self.path = path
+		self.local_path = local_path
+		self.size = size
+		self.host = urlparse.urlsplit(client.connection.get_uri('')).netloc
+		self.state = QUEUED
+		self.transferred = 0
+		self.error = None
+		self.resp = None
+		# state requested for a running job: PAUSED or CANCELLED
+		self._stop = None
+		self._entry = None
+		self._ended = threading.Event()
+
+	@property
+	def remaining(self):
+		if self.size is None:
+			return _UNKNOWN
+		return max(self.size - self.transferred, 0)
+
+	def cancel(self):
+		""" Cancel the job. A running job stops at its next chunk.
+		"""
+		self.scheduler._request(self, CANCELLED)
+
+	def pause(self):
+		""" Pause the job. A running job stops at its next chunk, and
+			continues where it stopped once resumed.
+		"""
+		self.scheduler._request(self, PAUSED)
+
+	def resume(self):
+		""" Queue a paused job again
+		"""
+		self.scheduler._request(self, QUEUED)
+
+	def wait(self, timeout=None):
+		""" Wait until the job is done, failed or cancelled. Returns whether it ended.
+		"""
+		return self._ended.wait(timeout)
+
+	def __repr__(self):
+		return '<TransferJob %s %s %s %s/%s>' % (self.kind, self.path, self.state,
+												 self.transferred, self.size)
+
+class _Interrupted(Exception): pass
+
+class _JobReader(object):
+	""" File-like PUT body reading a local file and reporting each read to
+		the scheduler, which interrupts it when the job is paused or
+		cancelled
+	"""
+	def __init__(self, scheduler, job, local_file_fd):
+		self.scheduler = scheduler
+		self.job = job
+		self.local_file_fd = local_file_fd
+
+	def read(self, size=-1):
+		if self.job._stop is not None:
+			raise _Interrupted()
+		data = self.local_file_fd.read(min(size, self.scheduler.chunksize) if size > 0 else self.scheduler.chunksize)
+		self.scheduler._progress(self.job, len(data))
+		return data
+
+class TransferScheduler(object):
+	""" Run many uploads and downloads on a pool of worker threads.
+
+		Jobs are started shortest first: the one with the fewest bytes
+		left, jobs of unknown size last, so that small files are never
+		stuck behind huge ones. At most per_host jobs run at once against
+		the same server. Bodies are streamed chunksize bytes at a time; each
+		chunk updates the progress, sent to the callback as ProgressEvent at
+		most every interval seconds (and whenever a job ends), and is the
+		point where a paused or cancelled job stops. A paused download goes
+		on with a Range request. Uploads are sent as chunksize partial
+		updates when the server supports them (PATCH), so that a paused one
+		goes on where it stopped; otherwise they are streamed in a single PUT,
+		sent again from the start after a pause.
+	"""
+	def __init__(self, workers=4, per_host=2, chunksize=1048576, callback=None, interval=0.5):
+		""" Set up the object. Threads are started with the first job.
+
+			:param workers: Number of concurrent transfers. 4 by default
+			:type  workers: Integer
+
+			:param per_host: Maximum number of concurrent transfers with one server. 2 by default
+			:type  per_host: Integer
+
+			:param chunksize: Bytes read or written at once. 1MB by default
+			:type  chunksize: Integer
+
+			:param callback: Called with ProgressEvent objects, from the worker threads
+			:type  callback: Callable
+
+			:param interval: Minimum number of seconds between two progress events of running jobs. 0.5 by default
+			:type  interval: Float
+		"""
+		self.workers = max(workers, 1)
+		self.per_host = max(per_host, 1)
+		self.chunksize = chunksize
+		self.callback = callback
+		self.interval = interval
+		self.jobs = []
+		self.transferred = 0
+		self.total = 0
+		self.finished = 0
+		self._queue = []
+		self._seq = itertools.count()
+		self._running = {}
+		self._pools = {}
+		self._threads = []
+		self._closed = False
+		self._cond = threading.Condition()
+		# (time, bytes moved) samples of the last seconds, for the rate
+		self._moved = 0
+		self._samples = deque([(time.time(), 0)])
+		self._notified = 0
+
+	def upload(self, client, path, local_file_path):
+		""" Queue the upload of a local file
+
+			:param client: Client of the server
+			:type  client: Client
+
+			:param path: Remote path, as for Client.sendFile
+			:type  path: String
+
+			:param local_file_path: Path of the local file
+			:type  local_file_path: String
+
+			Returns the TransferJob.
+		"""
+		return self._add(TransferJob(self, 'upload', client, path, local_file_path,
+									 os.stat(local_file_path).st_size))
+
+	def download(self, client, path, local_file_name, size=None):
+		""" Queue the download of a resource
+
+			:param client: Client of the server
+			:type  client: Client
+
+			:param path: Remote path, as for Client.getFile
+			:type  path: String
+
+			:param local_file_name: Path of the local file
+			:type  local_file_name: String
+
+			:param size: Size of the resource, if known (from a listing for instance). Jobs of unknown size are started last
+			:type  size: Integer
+
+			Returns the TransferJob.
+		"""
+		return self._add(TransferJob(self, 'download', client, path, local_file_name, size))
+
+	def _add(self, job):
+		with self._cond:
+			if self._closed:
+				raise ValueError('the scheduler is closed')
+			self.jobs.append(job)
+			if job.size is not None:
+				self.total += job.size
+			self._push(job)
+			if not self._threads:
+				for i in range(self.workers):
+					thread = threading.Thread(target=self._run)
+					thread.daemon = True
+					thread.start()
+					self._threads.append(thread)
+		return job
+
+	def _push(self, job):
+		job.state = QUEUED
+		job._entry = [job.remaining, next(self._seq), job]
+		heapq.heappush(self._queue, job._entry)
+		self._cond.notify_all()
+
+	def _next(self):
+		""" Pop the shortest queued job whose server has a free slot
+		"""
+		skipped = []
+		job = None
+		while self._queue:
+			entry = heapq.heappop(self._queue)
+			if entry[2] is None:#cancelled or paused
+				continue
+			if self._running.get(entry[2].host, 0) < self.per_host:
+				job = entry[2]
+				break
+			skipped.append(entry)
+		for entry in skipped:
+			heapq.heappush(self._queue, entry)
+		return job
+
+	def _request(self, job, state):
+		with self._cond:
+			if job.state == RUNNING:
+				if state != QUEUED:
+					job._stop = state
+				elif job._stop == PAUSED:#resumed before the pause took effect
+					job._stop = None
+				return
+			if job.state not in (QUEUED, PAUSED):
+				return
+			if state == QUEUED:
+				if job.state == PAUSED:
+					self._push(job)
+				return
+			if job._entry is not None:
+				job._entry[2] = None
+				job._entry = None
+			job.state = state
+			if state == CANCELLED:
+				self._forget(job)
+				self._end(job)
+		if state == CANCELLED:
+			self._notify(job, True)
+
+	def _forget(self, job):
+		self.transferred -= job.transferred
+		if job.size is not None:
+			self.total -= job.size
+
+	def _end(self, job):
+		self.finished += 1
+		job._ended.set()
+		self._cond.notify_all()
+
+	def _run(self):
+		while True:
+			with self._cond:
+				job = self._next()
+				while job is None:
+					if self._closed:
+						return
+					self._cond.wait()
+					job = self._next()
+				job._entry = None
+				job._stop = None
+				job.state = RUNNING
+				self._running[job.host] = self._running.get(job.host, 0) + 1
+			try:
+				if job.kind == 'upload':
+					self._upload(job)
+				else:
+					self._download(job)
+			except _Interrupted:
+				state, error = job._stop, None
+				self._pool(job.client).reset()
+			except Exception:
+				state, error = FAILED, sys.exc_info()[1]
+				self._pool(job.client).reset()
+			else:
+				state, error = DONE, None
+			with self._cond:
+				self._running[job.host] -= 1
+				job.error = error
+				if state == PAUSED and job._stop == CANCELLED:
+					state = CANCELLED
+				job._stop = None
+				job.state = state
+				if state == CANCELLED:
+					self._forget(job)
+				if state in (DONE, FAILED, CANCELLED):
+					self._end(job)
+				self._cond.notify_all()
+			self._notify(job, True)
+
+	def _pool(self, client):
+		with self._cond:
+			pool = self._pools.get(id(client))
+			if pool is None:
+				pool = self._pools[id(client)] = ConnectionPool(client.connection)
+			return pool
+
+	def _progress(self, job, count):
+		with self._cond:
+			job.transferred += count
+			self.transferred += count
+			self._moved += count
+		self._notify(job)
+
+	def _restart(self, job):
+		""" The transfer of a job starts over: forget its bytes
+		"""
+		with self._cond:
+			self.transferred -= job.transferred
+			job.transferred = 0
+
+	def rate(self):
+		""" Throughput of the last seconds, in bytes per second
+		"""
+		with self._cond:
+			now = time.time()
+			self._samples.append((now, self._moved))
+			while len(self._samples) > 2 and self._samples[1][0] < now - 5:
+				self._samples.popleft()
+			start, moved = self._samples[0]
+			return (self._moved - moved) / (now - start) if now > start else 0.0
+
+	def _notify(self, job, force=False):
+		if self.callback is None:
+			return
+		now = time.time()
+		if not force and now - self._notified < self.interval:
+			return
+		self._notified = now
+		rate = self.rate()
+		self.callback(ProgressEvent(job, self.transferred, self.total, rate, self.finished, len(self.jobs)))
+
+	def _upload(self, job):
+		connection = self._pool(job.client).get()
+		path = urllib.quote(job.path)
+		local_file_fd = open(job.local_path, 'rb')
+		try:
+			if 'PATCH' in connection.methods and job.size > 0:
+				# chunk by chunk, so that a paused upload goes on where it stopped
+				local_file_fd.seek(job.transferred)
+				while job.transferred < job.size:
+					if job._stop is not None:
+						raise _Interrupted()
+					data = local_file_fd.read(self.chunksize)
+					resp, contents = connection.send_put_partial(path, data, job.transferred, job.size)
+					if resp.status < 200 or resp.status >= 300:
+						raise httplib2.HttpLib2Error([resp, contents])
+					self._progress(job, len(data))
+			else:
+				# one streamed PUT, sent again from the start after a pause
+				self._restart(job)
+				# a streamed body can not be sent again after a challenge:
+				# get it answered first
+				if connection.auth.username and connection.auth.scheme is None:
+					connection.send_head(path)
+				resp, contents = connection.send_put(path, _JobReader(self, job, local_file_fd),
+													 headers={'Content-Length': str(job.size)})
+				if resp.status < 200 or resp.status >= 300:
+					raise httplib2.HttpLib2Error([resp, contents])
+		finally:
+			local_file_fd.close()
+		job.resp = resp
+
+	def _download(self, job):
+		connection = self._pool(job.client).get()
+		headers = {}
+		if job.transferred:
+			headers['Range'] = 'bytes=%d-' % job.transferred
+		conn, resp = _open_get(connection, urllib.quote(job.path), headers)
+		try:
+			if resp.status == 200 and job.transferred:#range ignored
+				self._restart(job)
+			elif resp.status not in (200, 206):
+				raise httplib2.HttpLib2Error([httplib2.Response(resp), resp.read()])
+			if job.size is None and resp.getheader('content-length') is not None:
+				with self._cond:
+					job.size = job.transferred + int(resp.getheader('content-length'))
+					self.total += job.size
+			local_file_fd = open(job.local_path, 'ab' if job.transferred else 'wb')
+			try:
+				while True:
+					if job._stop is not None:
+						raise _Interrupted()
+					data = resp.read(self.chunksize)
+					if not data:
+						break
+					local_file_fd.write(data)
+					self._progress(job, len(data))
+			finally:
+				local_file_fd.close()
+			job.resp = httplib2.Response(resp)
+		finally:
+			conn.close()
+
+	def pause(self):
+		""" Pause every queued or running job
+		"""
+		for job in list(self.jobs):
+			job.pause()
+
+	def resume(self):
+		""" Resume every paused job
+		"""
+		for job in list(self.jobs):
+			job.resume()
+
+	def cancel(self):
+		""" Cancel every job that did not end yet
+		"""
+		for job in list(self.jobs):
+			job.cancel()
+
+	def wait(self, timeout=None):
+		""" Wait until no job is queued or running (paused jobs are left as
+			they are)
+
+			Returns whether that happened before the timeout.
+		"""
+		deadline = None if timeout is None else time.time() + timeout
+		with self._cond:
+			while any(job.state in (QUEUED, RUNNING) for job in self.jobs):
+				if deadline is not None:
+					if time.time() >= deadline:
+						return False
+					self._cond.wait(deadline - time.time())
+				else:
+					self._cond.wait()
+		return True
+
+	def close(self):
+		""" Cancel the jobs left and stop the threads
+		"""
+		self.cancel()
+		with self._cond:
+			self._closed = True
+			self._cond.notify_all()
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
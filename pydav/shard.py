@@ -0,0 +1,311 @@
+""" Shard Module
+
+	Several WebDAV servers presented as one namespace, files placed by
+	consistent hashing
+"""
+import bisect
+import urllib
+import hashlib
+import urlparse
+import posixpath
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple
+from client import Client
+from listing import walk, href_path
+from transfer import Transfer
+from workers import ConnectionPool, TaskPool
+
+def _hash(key):
+	return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+def _key(path):
+	""" Namespace key of a path: no leading or trailing slash
+	"""
+	return path.strip('/')
+
+class HashRing(object):
+	""" Consistent hash ring. Each node owns vnodes points of a 64 bits
+		circle and a key goes to the owner of the first point after its
+		hash: adding a node only takes keys from the others (about one
+		share of them), and removing one only gives its keys away.
+	"""
+	def __init__(self, nodes=(), vnodes=128):
+		""" Set up the object
+
+			:param nodes: Node names
+			:type  nodes: List
+
+			:param vnodes: Points per node. 128 by default: more points, more even shares
+			:type  vnodes: Integer
+		"""
+		self.vnodes = vnodes
+		self.nodes = set()
+		self._points = []
+		self._owners = []
+		for node in nodes:
+			self.add(node)
+
+	def _rebuild(self, points):
+		points.sort()
+		self._points = [point for point, node in points]
+		self._owners = [node for point, node in points]
+
+	def add(self, node):
+		if node in self.nodes:
+			return
+		self.nodes.add(node)
+		points = zip(self._points, self._owners)
+		points.extend((_hash('%s#%d' % (node, index)), node) for index in range(self.vnodes))
+		self._rebuild(points)
+
+	def remove(self, node):
+		self.nodes.discard(node)
+		self._rebuild([(point, owner) for point, owner in zip(self._points, self._owners) if owner != node])
+
+	def get(self, key):
+		""" Node owning a key, None when the ring is empty
+		"""
+		if not self._points:
+			return None
+		index = bisect.bisect(self._points, _hash(key))
+		return self._owners[index % len(self._points)]
+
+class Move(namedtuple('Move', ['path', 'source', 'destination'])):
+	""" A file a rebalance moves: namespace path, and names of the backend
+		holding it and of the one it belongs to
+	"""
+	__slots__ = ()
+
+class ShardedClient(object):
+	""" Facade over several backends (one Client each) holding one
+		namespace between them.
+
+		A file goes to the backend its path hashes to on a HashRing, unless
+		it is below a directory pinned to a backend. Collections exist on
+		every backend (mkdir creates them everywhere), so that any file can
+		be stored under them; ls lists a collection on all backends at once
+		and merges the answers. Paths are relative to the base path of each
+		backend, as for Client.
+
+		When a backend is added, rebalance() moves to it the files it now
+		owns, and only them, server to server (Transfer).
+	"""
+	def __init__(self, backends, pins=None, vnodes=128, workers=4):
+		""" Set up the object
+
+			:param backends: Backend name -> Client, or Client settings
+			:type  backends: Dict
+
+			:param pins: Directory -> backend name. Everything below a pinned directory goes to its backend
+			:type  pins: Dict
+
+			:param vnodes: Points per backend on the ring. 128 by default
+			:type  vnodes: Integer
+
+			:param workers: Number of concurrent requests of ls, mkdir and rebalance. 4 by default
+			:type  workers: Integer
+		"""
+		self.backends = {}
+		self.ring = HashRing(vnodes=vnodes)
+		self.pins = {}
+		self.workers = workers
+		for name, backend in sorted(backends.items()):
+			self._add(name, backend)
+		for directory, name in (pins or {}).items():
+			self.pin(directory, name)
+
+	def _add(self, name, backend):
+		if not isinstance(backend, Client):
+			backend = Client(dict(backend))
+		self.backends[name] = backend
+		self.ring.add(name)
+
+	def pin(self, directory, name):
+		""" Keep everything below a directory on one backend. Files already
+			stored elsewhere are moved by rebalance().
+		"""
+		if name not in self.backends:
+			raise KeyError(name)
+		self.pins[_key(directory)] = name
+
+	def backend(self, path):
+		""" Name of the backend a path belongs to
+		"""
+		key = _key(path)
+		pinned = None
+		for directory, name in self.pins.items():
+			if key == directory or key.startswith(directory + '/') or not directory:
+				if pinned is None or len(directory) > len(pinned[0]):
+					pinned = (directory, name)
+		if pinned is not None:
+			return pinned[1]
+		return self.ring.get(key)
+
+	def client(self, path):
+		""" Client of the backend a path belongs to
+		"""
+		return self.backends[self.backend(path)]
+
+	def _collection_backends(self, path):
+		""" Backends that may hold members of a collection: its pinned
+			backend if any, all of them otherwise
+		"""
+		key = _key(path)
+		for directory, name in self.pins.items():
+			if key == directory or key.startswith(directory + '/') or not directory:
+				return [self.backend(path)]
+		return sorted(self.backends)
+
+	def mkdir(self, path):
+		""" Create a collection on every backend that may hold its members
+		"""
+		def mkcol(name):
+			resp, content = self.backends[name].connection.send_mkcol(urllib.quote(path))
+			if resp.status not in (200, 201, 405):#405: exists already
+				raise httplib2.HttpLib2Error([resp, content])
+		TaskPool(self.workers).map(mkcol, self._collection_backends(path))
+
+	def sendFile(self, path, local_file_path, *args, **kwargs):
+		""" Client.sendFile on the backend of the path
+		"""
+		return self.client(path).sendFile(path, local_file_path, *args, **kwargs)
+
+	def getFile(self, path, local_file_name, *args, **kwargs):
+		""" Client.getFile on the backend of the path
+		"""
+		return self.client(path).getFile(path, local_file_name, *args, **kwargs)
+
+	def open(self, path, mode='r', **options):
+		""" Client.open on the backend of the path
+		"""
+		return self.client(path).open(path, mode, **options)
+
+	def rm(self, path):
+		""" Delete a file from its backend
+		"""
+		return self.client(path).connection.send_delete(urllib.quote(path))
+
+	def rmdir(self, path):
+		""" Delete a collection, and everything below it, on every backend
+		"""
+		TaskPool(self.workers).map(lambda name: self.backends[name].connection.send_delete(urllib.quote(path)),
+								   self._collection_backends(path))
+
+	def _base(self, name):
+		return urllib.unquote(urlparse.urlsplit(self.backends[name].connection.get_uri('')).path)
+
+	def ls(self, path, maxdepth=1):
+		""" List a collection on every backend, concurrently
+
+			Returns a dict mapping namespace paths (relative, unquoted,
+			ending with a slash for collections) to the ResourceProperties of
+			the backend holding them. Collections, present everywhere, come
+			from the first backend by name.
+		"""
+		names = self._collection_backends(path)
+		def list_backend(name):
+			try:
+				return self.backends[name].ls(path, maxdepth)
+			except httplib2.HttpLib2Error, error:
+				if error.args and isinstance(error.args[0], list) and error.args[0][0].status == 404:
+					return {}
+				raise
+		merged = {}
+		for name, found in zip(names, TaskPool(self.workers).map(list_backend, names)):
+			base = self._base(name)
+			for href, prop in found.items():
+				member = href_path(href)
+				if member.startswith(base):
+					member = member[len(base):]
+				merged.setdefault(member.lstrip('/'), prop)
+		return merged
+
+	def addBackend(self, name, backend, rebalance=True):
+		""" Add a backend, and move to it the files it now owns
+
+			:param name: Backend name
+			:type  name: String
+
+			:param backend: Client or Client settings
+			:type  backend: Client
+
+			:param rebalance: Run rebalance() now. True by default
+
+			Returns the list of Move done.
+		"""
+		if name in self.backends:
+			raise ValueError('backend %r exists already' % name)
+		self._add(name, backend)
+		return self.rebalance() if rebalance else []
+
+	def removeBackend(self, name):
+		""" Move the files of a backend to the others and forget it
+
+			Returns the list of Move done.
+		"""
+		if name not in self.backends:
+			raise KeyError(name)
+		if name in self.pins.values():
+			raise ValueError('backend %r has pinned directories' % name)
+		self.ring.remove(name)
+		moves = self.rebalance()
+		del self.backends[name]
+		return moves
+
+	def plan(self):
+		""" List the files stored on another backend than the one they
+			belong to, with one walk of each backend
+
+			Returns a tuple: list of Move, and dict mapping backend names to
+			the set of collections (namespace paths) they hold.
+		"""
+		names = sorted(self.backends)
+		walked = TaskPool(self.workers).map(
+			lambda name: walk(self.backends[name].connection, self._base(name), self.workers) or [], names)
+		moves, collections = [], {}
+		for name, entries in zip(names, walked):
+			base = self._base(name)
+			collections[name] = set()
+			for entry in entries:
+				member = entry.path[len(base):] if entry.path.startswith(base) else entry.path.lstrip('/')
+				if entry.collection:
+					collections[name].add(member)
+					continue
+				owner = self.backend(member)
+				if owner != name:
+					moves.append(Move(member, name, owner))
+		return moves, collections
+
+	def rebalance(self):
+		""" Move every misplaced file to its backend: a server to server
+			copy, then a delete of the source. Only the files whose owner
+			changed are moved. Collections missing on a backend (a new one)
+			are created first.
+
+			Returns the list of Move done.
+		"""
+		moves, collections = self.plan()
+		wanted = set()
+		for found in collections.values():
+			wanted.update(found)
+		for move in moves:#parents of files below a pinned directory
+			parent = posixpath.dirname(move.path)
+			while parent:
+				wanted.add(parent + '/')
+				parent = posixpath.dirname(parent)
+		for name, found in sorted(collections.items()):
+			missing = [path for path in wanted - found if name in self._collection_backends(path)]
+			connection = self.backends[name].connection
+			for path in sorted(missing, key=lambda path: (path.count('/'), path)):
+				connection.send_mkcol(urllib.quote(path))
+
+		groups = {}
+		for move in moves:
+			groups.setdefault((move.source, move.destination), []).append(move)
+		for (source, destination), group in sorted(groups.items()):
+			source = self.backends[source].connection
+			transfer = Transfer(source, self.backends[destination].connection, workers=self.workers)
+			transfer.copy_many([(urllib.quote(move.path), urllib.quote(move.path)) for move in group])
+			pool = ConnectionPool(source)
+			TaskPool(self.workers).map(lambda move: pool.get().send_delete(urllib.quote(move.path)), group)
+		return moves
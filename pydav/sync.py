@@ -0,0 +1,179 @@
+""" Sync Module
+
+	Incremental change feed on top of the RFC 6578 "sync-collection" REPORT
+"""
+import sqlite3
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+class Change(namedtuple('Change', ['kind', 'href', 'properties'])):
+	""" A change reported by a ChangeFeed. kind is one of "added", "changed"
+		or "removed". properties is the ResourceProperties object returned by
+		the server, None for removed members.
+	"""
+	__slots__ = ()
+
+class SyncState(object):
+	""" Persistent state of a ChangeFeed, stored in a SQLite database: the
+		last sync-token and the set of known member hrefs. The latter is what
+		allows telling "added" from "changed" members. Both are updated in a
+		single transaction per page of results, so an interrupted sync simply
+		replays its last page.
+	"""
+	def __init__(self, dbpath=':memory:'):
+		""" Open (and create if needed) the state database
+
+			:param dbpath: Path to the SQLite database. In memory by default
+			:type  dbpath: String
+		"""
+		self.db = sqlite3.connect(dbpath, check_same_thread=False)
+		self.db.execute('CREATE TABLE IF NOT EXISTS sync_meta (key TEXT PRIMARY KEY, value TEXT)')
+		self.db.execute('CREATE TABLE IF NOT EXISTS sync_members (href TEXT PRIMARY KEY)')
+		self.db.commit()
+
+	@property
+	def token(self):
+		row = self.db.execute('SELECT value FROM sync_meta WHERE key = ?', ('token',)).fetchone()
+		return row[0] if row else None
+
+	def known(self, href):
+		return self.db.execute('SELECT 1 FROM sync_members WHERE href = ?', (href,)).fetchone() is not None
+
+	def members(self):
+		return [row[0] for row in self.db.execute('SELECT href FROM sync_members')]
+
+	def commit(self, token, added, removed):
+		""" Record a fully processed page of results
+
+			:param token: New sync-token
+			:type  token: String
+
+			:param added: hrefs of the new members
+			:type  added: List
+
+			:param removed: hrefs of the removed members
+			:type  removed: List
+		"""
+		self.db.executemany('INSERT OR IGNORE INTO sync_members (href) VALUES (?)',
+							[(href,) for href in added])
+		self.db.executemany('DELETE FROM sync_members WHERE href = ?',
+							[(href,) for href in removed])
+		self.db.execute('INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)',
+						('token', token))
+		self.db.commit()
+
+	def reset(self):
+		self.db.execute('DELETE FROM sync_meta')
+		self.db.commit()
+
+	def close(self):
+		self.db.close()
+
+class InvalidSyncToken(httplib2.HttpLib2Error): pass
+
+class ChangeFeed(object):
+	""" Iterate over the changes of a collection since the last sync.
+
+		The first run (no token yet) reports every member as "added". The
+		following ones only transfer and report what changed in between, by
+		pages of "limit" results when a limit is given. If the server
+		forgets the token, a full resync is done and members not seen anymore
+		are reported as "removed".
+	"""
+	def __init__(self, connection, path, state=None, level=1, limit=None,
+				 properties=['getetag']):
+		""" Set up the object
+
+			:param connection: Connection to the server
+			:type  connection: Connection
+
+			:param path: Path (without host) to the collection to watch. Must already be quoted
+			:type  path: String
+
+			:param state: SyncState or path of its database. Defaults to a volatile in-memory state
+			:type  state: SyncState or String
+
+			:param level: 1 for the immediate members only, -1 for the whole subtree
+			:type  level: Integer
+
+			:param limit: Maximum number of results per page. Unlimited by default
+			:type  limit: Integer
+
+			:param properties: DAV: properties to get for changed members
+			:type  properties: List
+		"""
+		if path and path[-1] != '/':
+			path += '/'
+		if not isinstance(state, SyncState):
+			state = SyncState(state or ':memory:')
+		self.connection = connection
+		self.path = path
+		self.state = state
+		self.level = level
+		self.limit = limit
+		self.properties = properties
+
+	def _build_body(self, token):
+		body = '<D:sync-collection xmlns:D="DAV:">'
+		body += '<D:sync-token>%s</D:sync-token>' % escape(token or '')
+		body += '<D:sync-level>%s</D:sync-level>' % ('infinite' if self.level < 0 else '1')
+		if self.limit:
+			body += '<D:limit><D:nresults>%d</D:nresults></D:limit>' % self.limit
+		body += '<D:prop>'
+		for prop in self.properties:
+			body += '<D:' + prop + '/>'
+		body += '</D:prop></D:sync-collection>'
+		return body
+
+	def _report(self, token):
+		resp, answer = self.connection.send_report(self.path, self._build_body(token))
+		if resp.status == 207:
+			return answer
+		if token and resp.status in (403, 409) and 'valid-sync-token' in answer:
+			raise InvalidSyncToken([resp, answer])
+		raise httplib2.HttpLib2Error([resp, answer])
+
+	def changes(self):
+		""" Generator of Change objects since the last sync. The state is
+			saved after each page, once all its changes have been consumed.
+		"""
+		token = self.state.token
+		try:
+			for change in self._pages(token, None):
+				yield change
+		except InvalidSyncToken:
+			self.state.reset()
+			seen = set()
+			for change in self._pages(None, seen):
+				yield change
+			gone = [href for href in self.state.members() if href not in seen]
+			for href in gone:
+				yield Change('removed', href, None)
+			self.state.commit(self.state.token, [], gone)
+
+	def _pages(self, token, seen):
+		while True:
+			answer = self._report(token)
+			added, removed, truncated = [], [], False
+			changes = []
+			for prop in answer.props:
+				status = prop.status or ''
+				if ' 507 ' in status:
+					truncated = True
+				elif ' 404 ' in status and not len(prop):
+					removed.append(prop.href)
+					changes.append(Change('removed', prop.href, None))
+				elif not self.state.known(prop.href):
+					added.append(prop.href)
+					changes.append(Change('added', prop.href, prop))
+				else:
+					changes.append(Change('changed', prop.href, prop))
+				if seen is not None:
+					seen.add(prop.href)
+			for change in changes:
+				yield change
+			token = answer.sync_token
+			self.state.commit(token, added, removed)
+			if not truncated:
+				return
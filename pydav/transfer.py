@@ -0,0 +1,313 @@
+""" Transfer Module
+
+	Server to server streaming copies
+"""
+import sys
+import Queue
+import socket
+import httplib
+import urlparse
+import threading
+import httplib2#fimxe: this is imported only for exceptions
+from collections import namedtuple
+from workers import ConnectionPool, TaskPool
+from transport import open_connection
+from connection import MethodNotAvailable
+
+class TransferError(httplib2.HttpLib2Error): pass
+
+class TransferResult(namedtuple('TransferResult', ['source', 'destination', 'size', 'mode'])):
+	""" Outcome of a copy. mode is "parallel" (ranged chunks sent
+		concurrently), "stream" (ranged GETs, or a single GET if the source
+		ignores ranges, piped into a single PUT) or "memory" (file of at most
+		chunksize bytes: the body went through memory in one piece).
+	"""
+	__slots__ = ()
+
+class ChunkPipe(object):
+	""" Read only file-like object fed with chunks by another thread
+		through a bounded queue. Used as a PUT body, it lets httplib send the
+		data as it arrives while at most maxchunks chunks are held in memory.
+
+		The data can only be read once: reading again after the end was
+		reached means the http layer is sending the body a second time (after
+		an authentication challenge or on a new connection), which raises
+		TransferError instead of sending an empty body.
+	"""
+	def __init__(self, maxchunks):
+		self.queue = Queue.Queue(maxchunks)
+		self.buffer = ''
+		self.offset = 0
+		self.eof = False
+		self.drained = False
+		self.error = None
+
+	def feed(self, chunk):
+		self.queue.put(chunk)
+
+	def finish(self, error=None):
+		""" Signal the end of the data, or the error that interrupted it
+		"""
+		self.error = error
+		self.queue.put(None)
+
+	def read(self, size=-1):
+		parts = []
+		while size != 0:
+			if self.offset >= len(self.buffer):
+				if self.eof:
+					break
+				chunk = self.queue.get()
+				if chunk is None:
+					self.eof = True
+					if self.error is not None:
+						raise self.error[0], self.error[1], self.error[2]
+					break
+				self.buffer, self.offset = chunk, 0
+				continue
+			end = len(self.buffer) if size < 0 else min(self.offset + size, len(self.buffer))
+			parts.append(self.buffer[self.offset:end])
+			if size > 0:
+				size -= end - self.offset
+			self.offset = end
+		if not parts and size != 0:
+			if self.drained:
+				raise TransferError('a streamed body can not be sent twice')
+			self.drained = True
+		return ''.join(parts)
+
+def _open_get(connection, path, headers):
+	""" Send a GET request and return its response before the body is read,
+		so that the body can be streamed (httplib2 reads whole bodies).
+		The TLS, proxy and timeout settings are the ones of the connection
+		transport, and authentication goes through its Authenticator.
+
+		Returns the httplib connection and response.
+	"""
+	parsed = urlparse.urlsplit(connection.get_uri(path))
+	target = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+	for first in (True, False):
+		sent = connection.auth.headers('GET', target)
+		conn = open_connection(connection.httpcon, parsed.scheme, parsed.hostname,
+							   parsed.port or (443 if parsed.scheme == 'https' else 80))
+		try:
+			conn.request('GET', target, headers=dict(sent, **headers))
+			resp = conn.getresponse(buffering=True)
+		except socket.gaierror:
+			conn.close()
+			raise httplib2.ServerNotFoundError("Unable to find the server at %s" % parsed.hostname)
+		except (socket.error, httplib.HTTPException):
+			conn.close()
+			raise
+		if connection.auth.response(httplib2.Response(resp), sent, first) and first:
+			conn.close()
+			continue
+		return conn, resp
+
+class Transfer(object):
+	""" Copy resources from one server (Connection) to another without any
+		local scratch space.
+
+		The source is read with Range GETs of chunksize bytes. When the
+		destination supports partial updates, chunks are sent concurrently as
+		partial PUT/PATCH requests; otherwise they are piped into a single
+		streaming PUT through a bounded buffer of buffered_chunks chunks.
+		When the source does not announce range support or the size, a first
+		Range GET tells; if it ignores ranges, its GET body is streamed into
+		the PUT. Only files of at most chunksize bytes are held in memory.
+		Several files are copied at once by copy_many().
+	"""
+	def __init__(self, source, destination, chunksize=4194304, buffered_chunks=4,
+				 workers=4, parallel_chunks=4, partial=None):
+		""" Set up the object
+
+			:param source: Connection to read from
+			:type  source: Connection
+
+			:param destination: Connection to write to
+			:type  destination: Connection
+
+			:param chunksize: Size of the ranged requests. 4MB by default
+			:type  chunksize: Integer
+
+			:param buffered_chunks: Maximum number of chunks buffered per streamed file. 4 by default
+			:type  buffered_chunks: Integer
+
+			:param workers: Number of files in flight in copy_many. 4 by default
+			:type  workers: Integer
+
+			:param parallel_chunks: Number of chunks in flight per file in parallel mode. 4 by default, 1 disables parallel mode
+			:type  parallel_chunks: Integer
+
+			:param partial: Whether the destination accepts partial updates. Guessed from its PATCH support by default
+			:type  partial: Boolean
+		"""
+		self.source = ConnectionPool(source)
+		self.destination = ConnectionPool(destination)
+		self.chunksize = chunksize
+		self.buffered_chunks = max(buffered_chunks, 1)
+		self.workers = workers
+		self.parallel_chunks = parallel_chunks
+		if partial is None:
+			partial = 'PATCH' in destination.methods
+		self.partial = partial
+
+	def _check(self, resp, content):
+		if resp.status < 200 or resp.status >= 300:
+			raise httplib2.HttpLib2Error([resp, content])
+
+	def _get_range(self, connection, path, begin, end):
+		resp, content = connection.send_get(path, headers={'Range': 'bytes=%d-%d' % (begin, end)})
+		if resp.status != 206:
+			raise httplib2.HttpLib2Error([resp, content])
+		return content
+
+	def copy(self, source_path, destination_path):
+		""" Copy one resource
+
+			:param source_path: Path (without host) on the source server. Must already be quoted
+			:type  source_path: String
+
+			:param destination_path: Path (without host) on the destination server. Must already be quoted
+			:type  destination_path: String
+
+			Returns a TransferResult.
+		"""
+		source = self.source.get()
+		resp = source.send_head(source_path)
+		self._check(resp, '')
+		size = int(resp.get('content-length', -1))
+		ranges = resp.get('accept-ranges', '').lower() == 'bytes'
+
+		if 0 <= size <= self.chunksize:
+			resp, content = source.send_get(source_path)
+			self._check(resp, content)
+			return self._copy_memory(source_path, destination_path, content)
+		if size < 0 or not ranges:
+			return self._copy_probed(source_path, destination_path)
+		return self._copy_ranged(source_path, destination_path, size)
+
+	def _copy_memory(self, source_path, destination_path, content):
+		resp, contents = self.destination.get().send_put(destination_path, content)
+		self._check(resp, contents)
+		return TransferResult(source_path, destination_path, len(content), 'memory')
+
+	def _copy_ranged(self, source_path, destination_path, size, first=None):
+		if self.partial and self.parallel_chunks > 1:
+			self._copy_parallel(source_path, destination_path, size, first)
+			return TransferResult(source_path, destination_path, size, 'parallel')
+		source = self.source.connection.clone()
+		def chunks():
+			start = 0
+			if first is not None:
+				yield first
+				start = len(first)
+			for begin in range(start, size, self.chunksize):
+				end = min(begin + self.chunksize, size) - 1
+				yield self._get_range(source, source_path, begin, end)
+		self._copy_stream(destination_path, size, chunks())
+		return TransferResult(source_path, destination_path, size, 'stream')
+
+	def _copy_probed(self, source_path, destination_path):
+		""" Copy from a source whose HEAD answer announces no range support
+			or no size: its GET answer to a first chunk Range request tells
+			both, and is streamed if the ranges are ignored.
+		"""
+		conn, resp = _open_get(self.source.get(), source_path,
+							   {'Range': 'bytes=0-%d' % (self.chunksize - 1)})
+		try:
+			if resp.status == 206:
+				first = resp.read()
+				size = int(resp.getheader('content-range', '').rsplit('/', 1)[-1])
+				conn.close()
+				if size <= self.chunksize:
+					return self._copy_memory(source_path, destination_path, first)
+				return self._copy_ranged(source_path, destination_path, size, first)
+			if resp.status == 416:#empty resource
+				return self._copy_memory(source_path, destination_path, '')
+			if resp.status != 200:
+				raise httplib2.HttpLib2Error([httplib2.Response(resp), resp.read()])
+
+			# ranges are ignored: the whole body comes
+			length = resp.getheader('content-length')
+			if length is None:
+				content = resp.read(self.chunksize + 1)
+				if len(content) > self.chunksize:
+					raise TransferError('%s has no known size and is larger than %d bytes'
+										% (source_path, self.chunksize))
+				return self._copy_memory(source_path, destination_path, content)
+			size = int(length)
+			if size <= self.chunksize:
+				return self._copy_memory(source_path, destination_path, resp.read())
+			def chunks():
+				while True:
+					data = resp.read(self.chunksize)
+					if not data:
+						return
+					yield data
+			self._copy_stream(destination_path, size, chunks())
+			return TransferResult(source_path, destination_path, size, 'stream')
+		finally:
+			conn.close()
+
+	def _copy_stream(self, destination_path, size, chunks):
+		""" PUT the chunks, produced by another thread, as one streamed body
+		"""
+		pipe = ChunkPipe(self.buffered_chunks)
+		def produce():
+			try:
+				for chunk in chunks:
+					pipe.feed(chunk)
+			except Exception:
+				pipe.finish(sys.exc_info())
+			else:
+				pipe.finish()
+		destination = self.destination.get()
+		# the body can be sent only once: get any authentication challenge
+		# answered now, so that the Authenticator of the connection puts
+		# the credentials on the PUT at once, on a connection known to be
+		# alive. Without HEAD, the body is streamed anyway: a challenge then
+		# fails the copy (see ChunkPipe)
+		try:
+			destination.send_head(destination_path)
+		except MethodNotAvailable:
+			pass
+		producer = threading.Thread(target=produce)
+		producer.daemon = True
+		producer.start()
+		try:
+			resp, contents = destination.send_put(
+				destination_path, pipe, headers={'Content-Length': str(size)})
+		finally:
+			# unblock the producer if the upload stopped early
+			while producer.is_alive():
+				try:
+					pipe.queue.get(timeout=0.1)
+				except Queue.Empty:
+					pass
+		self._check(resp, contents)
+
+	def _copy_parallel(self, source_path, destination_path, size, first=None):
+		# the first chunk creates (or truncates) the destination
+		if first is None:
+			first = self._get_range(self.source.get(), source_path, 0, self.chunksize - 1)
+		resp, contents = self.destination.get().send_put(destination_path, first)
+		self._check(resp, contents)
+
+		def chunk(begin):
+			end = min(begin + self.chunksize, size) - 1
+			data = self._get_range(self.source.get(), source_path, begin, end)
+			resp, contents = self.destination.get().send_put_partial(destination_path, data,
+																	 begin, size)
+			self._check(resp, contents)
+		TaskPool(self.parallel_chunks).map(chunk, range(len(first), size, self.chunksize))
+
+	def copy_many(self, pairs):
+		""" Copy several resources concurrently
+
+			:param pairs: (source path, destination path) tuples. Paths must already be quoted
+			:type  pairs: List
+
+			Returns the list of TransferResult, in the same order.
+		"""
+		return TaskPool(self.workers).map(lambda pair: self.copy(*pair), list(pairs))
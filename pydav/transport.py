@@ -0,0 +1,231 @@
+""" Transport Module
+
+	The http layer used by Connection, and a lean httplib based backend
+"""
+import ssl
+import socket
+import httplib
+import urlparse
+import httplib2
+
+# seconds a request may wait for the server
+DEFAULT_TIMEOUT = 60
+
+class Transport(object):
+	""" Interface of the objects Connection sends its requests through.
+		httplib2.Http is used as is: any object with the same request()
+		method is a transport. Authentication is not the business of the
+		transport: Connection answers the challenges (see auth.Authenticator)
+		and sends the Authorization headers itself.
+
+		A transport is used by one thread at a time, unless it is
+		multiplexed: Connection.clone() then shares it instead of calling
+		clone().
+	"""
+	multiplexed = False
+
+	def request(self, uri, method='GET', body=None, headers=None):
+		""" Send a request and read the whole response
+
+			:param uri: Full uri of the resource
+			:type  uri: String
+
+			:param method: HTTP method
+			:type  method: String
+
+			:param body: Request body. A file-like object is streamed if a Content-Length header is given
+			:type  body: String or file
+
+			:param headers: Request headers
+			:type  headers: Dict
+
+			Returns the httplib2.Response and the body.
+		"""
+		raise NotImplementedError
+
+	def clone(self):
+		""" Get an unconnected transport with the same settings, for another thread
+		"""
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+class HttplibTransport(Transport):
+	""" Minimal transport on a single persistent httplib connection.
+
+		No cache, no redirects and no compression. The parts of the request
+		that never change (uri prefix, Host, User-Agent and Accept-Encoding
+		headers) are computed once. A request failing on a reused connection is sent once more on
+		a new one, as the server may have closed it while idle.
+	"""
+	def __init__(self, host, timeout=DEFAULT_TIMEOUT, ca_certs=None,
+				 disable_ssl_certificate_validation=False):
+		""" Set up the object. Nothing is connected until the first request.
+
+			:param host: Server url ("http://host:port"). Only the scheme, host and port are used
+			:type  host: String
+
+			:param timeout: Socket timeout in seconds, 60 by default. None waits forever
+			:type  timeout: Float
+
+			:param ca_certs: File of the CA certificates used to check the server. System ones by default
+			:type  ca_certs: String
+
+			:param disable_ssl_certificate_validation: Do not check the server certificate. False by default
+			:type  disable_ssl_certificate_validation: Boolean
+		"""
+		parsed = urlparse.urlparse(host)
+		self.host = host
+		self.scheme = parsed.scheme or 'http'
+		self.hostname = parsed.hostname
+		self.port = parsed.port or (443 if self.scheme == 'https' else 80)
+		self.authority = parsed.netloc.rsplit('@', 1)[-1]
+		self.timeout = timeout
+		self.ca_certs = ca_certs
+		self.disable_ssl_certificate_validation = disable_ssl_certificate_validation
+		self._prefix = '%s://%s' % (self.scheme, self.authority)
+		self._template = [('Host', self.authority), ('User-Agent', 'pydav'),
+						  ('Accept-Encoding', 'identity')]
+		self._names = set(name.lower() for name, value in self._template)
+		self._conn = None
+		# statistics
+		self.connections = 0
+		self.requests = 0
+
+	def clone(self):
+		return self.__class__(self.host, self.timeout, self.ca_certs,
+							  self.disable_ssl_certificate_validation)
+
+	def _connect(self):
+		try:
+			if self.scheme == 'https':
+				context = ssl.create_default_context(cafile=self.ca_certs)
+				if self.disable_ssl_certificate_validation:
+					context.check_hostname = False
+					context.verify_mode = ssl.CERT_NONE
+				conn = httplib.HTTPSConnection(self.hostname, self.port, timeout=self.timeout,
+											   context=context)
+			else:
+				conn = httplib.HTTPConnection(self.hostname, self.port, timeout=self.timeout)
+			conn.connect()
+		except socket.gaierror:
+			raise httplib2.ServerNotFoundError("Unable to find the server at %s" % self.hostname)
+		conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.connections += 1
+		return conn
+
+	def _send(self, method, path, body, headers):
+		streamed = hasattr(body, 'read')
+		for attempt in (0, 1):
+			fresh = self._conn is None
+			if fresh:
+				self._conn = self._connect()
+			conn = self._conn
+			try:
+				conn.putrequest(method, path, skip_host=True, skip_accept_encoding=True)
+				if headers:
+					given = set(name.lower() for name in headers)
+					for name, value in self._template:
+						if name.lower() not in given:
+							conn.putheader(name, value)
+					for name, value in headers.iteritems():
+						conn.putheader(name, value)
+				else:
+					given = ()
+					for name, value in self._template:
+						conn.putheader(name, value)
+				if body is None:
+					body = ''
+				if not streamed and 'content-length' not in given and (body or method not in ('GET', 'HEAD')):
+					conn.putheader('Content-Length', str(len(body)))
+				conn.endheaders(body or None)
+				# buffered reads: the default reads the headers one byte per recv()
+				resp = conn.getresponse(buffering=True)
+				content = resp.read()
+			except (socket.error, httplib.HTTPException):
+				conn.close()
+				self._conn = None
+				if fresh or streamed or attempt:
+					raise
+				continue
+			if resp.will_close:
+				conn.close()
+				self._conn = None
+			self.requests += 1
+			return httplib2.Response(resp), content
+
+	def request(self, uri, method='GET', body=None, headers=None, **ignored):
+		if uri.startswith(self._prefix) and uri[len(self._prefix):len(self._prefix) + 1] in ('', '/'):
+			path = uri[len(self._prefix):] or '/'
+		else:
+			parsed = urlparse.urlsplit(uri)
+			if parsed.netloc.rsplit('@', 1)[-1] != self.authority:
+				raise ValueError("%s is not on %s" % (uri, self._prefix))
+			path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+		return self._send(method, path, body, headers)
+
+	def close(self):
+		if self._conn is not None:
+			self._conn.close()
+			self._conn = None
+
+def make_transport(settings):
+	""" Build the transport selected by the connection settings:
+		"transport" is "httplib2" (default), "httplib", "http2" or a
+		transport object. A true "http2" setting selects "http2" too.
+		"timeout" is the socket timeout in seconds, 60 by default (None
+		for none). httplib2 keeps its own default.
+
+		:param settings: Connection settings
+		:type  settings: Dict
+	"""
+	name = settings.get('transport') or ('http2' if settings.get('http2') else 'httplib2')
+	if not isinstance(name, basestring):
+		return name
+	timeout = settings.get('timeout', DEFAULT_TIMEOUT)
+	if name == 'httplib2':
+		return httplib2.Http(timeout=settings.get('timeout'))
+	if name == 'httplib':
+		return HttplibTransport(settings['host'], timeout)
+	if name == 'http2':
+		from http2 import H2Transport#optional: requires the h2 package
+		return H2Transport(settings['host'], settings.get('http2MaxStreams', 100), timeout=timeout)
+	raise ValueError("unknown transport: %r" % name)
+
+def open_connection(transport, scheme, hostname, port):
+	""" Get an unconnected httplib connection with the TLS, proxy and
+		timeout settings of a transport, for the requests it can not send
+		itself (responses whose body is streamed rather than read whole)
+
+		:param transport: Transport whose settings are used
+		:type  transport: Transport
+
+		:param scheme: "http" or "https"
+		:type  scheme: String
+	"""
+	timeout = getattr(transport, 'timeout', None) or DEFAULT_TIMEOUT
+	proxy_info = getattr(transport, 'proxy_info', None)
+	if hasattr(transport, '_get_proxy_info'):#httplib2.Http: environment and no_proxy
+		proxy_info = transport._get_proxy_info(scheme, '%s:%s' % (hostname, port))
+	elif callable(proxy_info):
+		proxy_info = proxy_info(scheme)
+	if scheme == 'https':
+		return httplib2.HTTPSConnectionWithTimeout(
+			hostname, port, timeout=timeout, proxy_info=proxy_info,
+			ca_certs=getattr(transport, 'ca_certs', None),
+			disable_ssl_certificate_validation=getattr(transport, 'disable_ssl_certificate_validation', False))
+	return httplib2.HTTPConnectionWithTimeout(hostname, port, timeout=timeout, proxy_info=proxy_info)
+
+def clone_transport(transport):
+	""" Get a transport usable by another thread: the same one if it is
+		multiplexed, a new one with the same settings otherwise
+
+		:param transport: Transport to clone
+		:type  transport: Transport
+	"""
+	if getattr(transport, 'multiplexed', False):
+		return transport
+	if hasattr(transport, 'clone'):
+		return transport.clone()
+	return transport.__class__(timeout=getattr(transport, 'timeout', None))
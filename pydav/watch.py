@@ -0,0 +1,148 @@
+""" Watch Module
+
+	Change detection by polling, pruned with collection tags
+"""
+import time
+import urllib
+import urlparse
+from collections import namedtuple
+from index import walk_changed
+
+class WatchEvent(namedtuple('WatchEvent', ['kind', 'path', 'collection'])):
+	""" A change seen by a Watcher. kind is "created", "modified" or
+		"deleted", path the unquoted absolute path of the resource and
+		collection True for collections.
+	"""
+	__slots__ = ()
+
+class Watcher(object):
+	""" Poll a remote tree and report what changed since the previous poll.
+
+		A snapshot maps every known path to its tag: "getctag" (or
+		"getetag") for collections, "getetag" (or size and modification
+		time) for files. A poll asks for the tag of the root only; a
+		collection is listed again only when its tag changed, and only the
+		collections below it whose tag changed are descended into. The cost
+		of a poll thus grows with the amount of change, not with the size of
+		the tree. The walk is the one of MetadataIndex (see
+		index.walk_changed), which relies on the server changing the tag of
+		a collection whenever something changes below it.
+
+		Modified collections are not reported, only their changed members.
+	"""
+	def __init__(self, client, root='', callback=None, initial=False):
+		""" Set up the object. Nothing is fetched until the first poll.
+
+			:param client: Client used to list the remote tree
+			:type  client: Client
+
+			:param root: Path of the watched subtree, relative to the client base path
+			:type  root: String
+
+			:param callback: Called with each WatchEvent
+			:type  callback: Callable
+
+			:param initial: Report every resource as created on the first poll. False by default: the first poll only takes the snapshot
+			:type  initial: Boolean
+		"""
+		self.client = client
+		self.root = root
+		self.callback = callback
+		self.initial = initial
+		# path -> (tag, collection), and collection path -> member paths
+		self.snapshot = {}
+		self.members = {}
+		self.polls = 0
+		self._stopped = False
+		# statistics of the last poll
+		self.requests = 0
+
+	def _abspath(self, path):
+		uri = self.client.connection.get_uri(urllib.quote(path))
+		path = urllib.unquote(urlparse.urlparse(uri).path)
+		return path if path.endswith('/') else path + '/'
+
+	def _known(self, path):
+		known = self.snapshot.get(path)
+		return known[0] if known is not None else None
+
+	def _removed(self, path, events, snapshot, members):
+		""" Forget a path and everything below it, reported deepest first
+		"""
+		for child in sorted(self.members.get(path, ()), reverse=True):
+			self._removed(child, events, snapshot, members)
+		if path in self.members:
+			members[path] = None
+		snapshot[path] = None
+		events.append(WatchEvent('deleted', path, self.snapshot[path][1]))
+
+	def poll(self):
+		""" Look for changes
+
+			Returns the list of WatchEvent, after passing each of them to the callback.
+		"""
+		report = self.polls > 0 or self.initial
+		events = []
+		root = self._abspath(self.root)
+		self.requests = 1
+		# changes are applied once the whole walk succeeded, so that an
+		# interrupted poll is done again from the same snapshot
+		snapshot, members = {}, {}
+		for itself, listed in walk_changed(self.client, root, self._known):
+			self.requests += 1
+			seen = set()
+			for member in listed:
+				seen.add(member.path)
+				known = self.snapshot.get(member.path)
+				if member.collection:
+					if known is None:
+						events.append(WatchEvent('created', member.path, True))
+					continue
+				tag = member.etag or (member.size, member.mtime)
+				if known is None:
+					events.append(WatchEvent('created', member.path, False))
+				elif known[0] != tag:
+					events.append(WatchEvent('modified', member.path, False))
+				snapshot[member.path] = (tag, False)
+			for child in self.members.get(itself.path, set()) - seen:
+				self._removed(child, events, snapshot, members)
+			members[itself.path] = seen
+			snapshot[itself.path] = (itself.tag, True)
+		for path, value in snapshot.items():
+			if value is None:
+				self.snapshot.pop(path, None)
+			else:
+				self.snapshot[path] = value
+		for path, value in members.items():
+			if value is None:
+				self.members.pop(path, None)
+			else:
+				self.members[path] = value
+		self.polls += 1
+		if not report:
+			return []
+		if self.callback is not None:
+			for event in events:
+				self.callback(event)
+		return events
+
+	def watch(self, interval=60):
+		""" Poll forever (until stop() is called), every interval seconds
+
+			:param interval: Seconds between two polls. 60 by default
+			:type  interval: Float
+
+			Returns a generator of WatchEvent.
+		"""
+		self._stopped = False
+		while not self._stopped:
+			started = time.time()
+			for event in self.poll():
+				yield event
+			if not self._stopped:
+				time.sleep(max(interval - (time.time() - started), 0))
+
+	def stop(self):
+		""" Make watch() return after the current poll
+		"""
+		self._stopped = True
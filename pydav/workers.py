@@ -0,0 +1,102 @@
+""" Workers Module
+
+	Small thread pool helpers shared by the concurrent operations
+"""
+import sys
+import threading
+import Queue
+
+class ConnectionPool(object):
+	""" Hand out one Connection clone per thread
+	"""
+	def __init__(self, connection):
+		""" Set up the object
+
+			:param connection: Connection to clone
+			:type  connection: Connection
+		"""
+		self.connection = connection
+		self._local = threading.local()
+
+	def get(self):
+		""" Get the connection of the calling thread
+		"""
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			connection = self._local.connection = self.connection.clone()
+		return connection
+
+	def reset(self):
+		""" Drop the connection of the calling thread, after an interrupted
+			request left it in an unknown state
+		"""
+		self._local.connection = None
+
+class TaskPool(object):
+	""" Fixed size pool of worker threads running submitted callables.
+		Tasks may submit new tasks (to walk a tree for instance). join()
+		waits until every task is done and re-raises the first error.
+	"""
+	def __init__(self, workers=4):
+		""" Set up the object. Threads are started on the first submit.
+
+			:param workers: Number of threads
+			:type  workers: Integer
+		"""
+		self.workers = max(workers, 1)
+		self.queue = Queue.Queue()
+		self.error = None
+		self._threads = []
+		self._lock = threading.Lock()
+
+	def submit(self, func, *args):
+		""" Queue func(*args) for execution
+		"""
+		if not self._threads:
+			for i in range(self.workers):
+				thread = threading.Thread(target=self._run)
+				thread.daemon = True
+				thread.start()
+				self._threads.append(thread)
+		self.queue.put((func, args))
+
+	def _run(self):
+		while True:
+			task = self.queue.get()
+			if task is None:
+				self.queue.task_done()
+				return
+			func, args = task
+			try:
+				if self.error is None:#stop working after the first failure
+					func(*args)
+			except Exception:
+				with self._lock:
+					if self.error is None:
+						self.error = sys.exc_info()
+			finally:
+				self.queue.task_done()
+
+	def join(self):
+		""" Wait for every task and stop the threads. Re-raises the first error.
+		"""
+		self.queue.join()
+		for thread in self._threads:
+			self.queue.put(None)
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+		if self.error is not None:
+			error, self.error = self.error, None
+			raise error[0], error[1], error[2]
+
+	def map(self, func, items):
+		""" Run func on every item and return the results, in order
+		"""
+		results = [None] * len(items)
+		def task(index, item):
+			results[index] = func(item)
+		for index, item in enumerate(items):
+			self.submit(task, index, item)
+		self.join()
+		return results
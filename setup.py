@@ -8,5 +8,6 @@ setup(name = "pydav",
 	author = "Jean-Tiare LE BIGOT, Becky Lewis",
 	author_email = "admin@jtlebi.fr",
 	url = "",
-        packages = ['pydav']
+        packages = ['pydav'],
+	scripts = ['scripts/pydav']
 	)
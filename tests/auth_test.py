@@ -0,0 +1,121 @@
+import hashlib
+import unittest
+import pydav.auth
+import pydav.connection
+from pydav.workers import ConnectionPool, TaskPool
+from davserver import DavServer, DavHandler
+from transport_test import AuthHandler
+
+def md5(text):
+    return hashlib.md5(text).hexdigest()
+
+class DigestHandler(DavHandler):
+    """ Requires Digest credentials wibble:fish. server.nonce is the
+        current nonce: older ones are answered as stale.
+    """
+    def handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline:
+            self.close_connection = 1
+            return
+        if not self.parse_request():
+            return
+        params = pydav.auth.parse_challenges(self.headers.get('authorization', '')).get('digest')
+        if params is None or not self._valid(params):
+            self._record()
+            self._body()
+            stale = ', stale=true' if params and params.get('nonce') != self.server.nonce else ''
+            self._reply(401, headers={'WWW-Authenticate': 'Digest realm="test", qop="auth", '
+                                      'nonce="%s", opaque="xyz"%s' % (self.server.nonce, stale)})
+            self.wfile.flush()
+            return
+        getattr(self, 'do_' + self.command)()
+        self.wfile.flush()
+
+    def _valid(self, params):
+        if params.get('nonce') != self.server.nonce or params.get('opaque') != 'xyz':
+            return False
+        ha1 = md5('wibble:test:fish')
+        ha2 = md5('%s:%s' % (self.command, params['uri']))
+        expected = md5(':'.join((ha1, params['nonce'], params['nc'], params['cnonce'], 'auth', ha2)))
+        return params['uri'] == self.path and params['response'] == expected
+
+class CookieHandler(AuthHandler):
+    """ Basic credentials, and a session cookie set on the first
+        authenticated request
+    """
+    def _reply(self, status, body='', headers={}):
+        if status != 401 and 'oc123=session' not in self.headers.get('cookie', ''):
+            headers = dict(headers, **{'Set-Cookie': 'oc123=session; path=/; HttpOnly'})
+        DavHandler._reply(self, status, body, headers)
+
+class TestParse(unittest.TestCase):
+    def test_challenges(self):
+        challenges = pydav.auth.parse_challenges(
+            'Digest realm="a, b", qop="auth,auth-int", nonce="n\\"1", Basic realm=test')
+        self.assertEquals(challenges['digest'], {'realm': 'a, b', 'qop': 'auth,auth-int', 'nonce': 'n"1'})
+        self.assertEquals(challenges['basic'], {'realm': 'test'})
+
+    def test_cookies(self):
+        auth = pydav.auth.Authenticator('u', 'p')
+        auth._store_cookies('a=1; expires=Wed, 09 Jun 2021 10:18:14 GMT; path=/, b=2; HttpOnly')
+        self.assertEquals(auth.cookies, {'a': '1', 'b': '2'})
+        auth._store_cookies('a=deleted; expires=Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEquals(auth.cookies, {'b': '2'})
+
+class TestAuthentication(unittest.TestCase):
+    def _server(self, handler):
+        self.server = DavServer(handler=handler).start()
+        self.server.store.mkcol('/dir/')
+        self.server.store.put('/dir/a.txt', 'hello')
+        self.server.httpd.nonce = 'first'
+        return self.server
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _challenged(self):
+        return len([r for r in self.server.requests if 'authorization' not in r[2]])
+
+    def test_basic_once_for_all_clones(self):
+        connection = pydav.connection.Connection(self._server(AuthHandler).settings())
+        pool = ConnectionPool(connection)
+        contents = TaskPool(4).map(lambda index: pool.get().send_get('/dir/a.txt')[1], range(20))
+        self.assertEquals(contents, ['hello'] * 20)
+        # only the capability detection was challenged
+        self.assertEquals(self._challenged(), 1)
+        self.assertEquals((connection.auth.challenges, connection.auth.avoided), (1, 20))
+
+    def test_preemptive_basic(self):
+        connection = pydav.connection.Connection(self._server(AuthHandler).settings(auth='basic'))
+        connection.send_get('/dir/a.txt')
+        self.assertEquals(self._challenged(), 0)
+        self.assertEquals((connection.auth.challenges, connection.auth.avoided), (0, 2))
+
+    def test_digest_nonce_reuse(self):
+        connection = pydav.connection.Connection(self._server(DigestHandler).settings())
+        for index in range(3):
+            self.assertEquals(connection.clone().send_get('/dir/a.txt')[1], 'hello')
+        self.assertEquals(connection.auth.challenges, 1)
+        self.assertEquals(connection.auth._nc, 4)
+        # a new nonce: the server says the old one is stale, the request goes through
+        self.server.httpd.nonce = 'second'
+        self.assertEquals(connection.send_get('/dir/a.txt')[1], 'hello')
+        self.assertEquals(connection.auth.challenges, 2)
+        self.assertEquals(connection.auth.avoided, 3)
+
+    def test_wrong_password(self):
+        connection = pydav.connection.Connection(self._server(DigestHandler).settings())
+        connection.auth.password = 'wrong'
+        resp, content = connection.send_get('/dir/a.txt')
+        # the nonce was not stale: no second attempt
+        self.assertEquals(resp.status, 401)
+        self.assertEquals([r[0] for r in self.server.requests], ['OPTIONS', 'OPTIONS', 'GET'])
+
+    def test_session_cookie(self):
+        connection = pydav.connection.Connection(self._server(CookieHandler).settings())
+        connection.send_get('/dir/a.txt')
+        connection.send_get('/dir/a.txt')
+        self.assertEquals(connection.auth.cookies, {'oc123': 'session'})
+        cookies = [r[2].get('cookie') for r in self.server.requests]
+        self.assertEquals(cookies, [None, None, 'oc123=session', 'oc123=session'])
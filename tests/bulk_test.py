@@ -0,0 +1,83 @@
+import unittest
+import pydav.client
+from davserver import DavServer
+
+class TestBulkOperations(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        store = self.server.store
+        store.mkcol('/src/')
+        store.mkcol('/src/sub/')
+        store.mkcol('/dst/')
+        for name in ('a.csv', 'b.csv', 'c.txt'):
+            store.put('/src/' + name, name)
+        store.put('/src/sub/d.csv', 'd')
+        self.client = pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _sent(self, method):
+        return [r[1] for r in self.server.requests if r[0] == method]
+
+    def test_mv_sends_move(self):
+        self.client.mv('/src/c.txt', '/dst/c.txt')
+        self.assertEquals(self._sent('MOVE'), ['/src/c.txt'])
+        self.assertEquals(self.server.store.get('/src/c.txt'), None)
+        self.assertEquals(self.server.store.get('/dst/c.txt').data, 'c.txt')
+
+    def test_glob_copy(self):
+        results = self.client.copyMany(['src/*.csv', 'src/*/*.csv'], 'dst')
+        self.assertEquals(sorted((r.source, r.destination) for r in results),
+                          [('/src/a.csv', '/dst/a.csv'), ('/src/b.csv', '/dst/b.csv'),
+                           ('/src/sub/d.csv', '/dst/d.csv')])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEquals(self.server.store.get('/dst/d.csv').data, 'd')
+
+    def test_glob_move(self):
+        results = self.client.moveMany('src/*.csv', 'dst')
+        self.assertEquals(len(results), 2)
+        self.assertEquals(self.server.store.get('/src/a.csv'), None)
+        self.assertEquals(self.server.store.get('/dst/b.csv').data, 'b.csv')
+
+    def test_whole_collection_is_coalesced(self):
+        results = self.client.copyMany('src/*', 'new')
+        self.assertEquals([(r.source, r.destination) for r in results], [('/src/', '/new/')])
+        self.assertEquals(self._sent('COPY'), ['/src/'])
+        self.assertEquals(self.server.store.get('/new/sub/d.csv').data, 'd')
+
+    def test_no_coalescing_with_depth_zero(self):
+        results = self.client.copyMany('src/*', 'new', maxdepth=0)
+        self.assertEquals(sorted(self._sent('COPY')),
+                          ['/src/a.csv', '/src/b.csv', '/src/c.txt', '/src/sub/'])
+        self.assertEquals(self.server.store.get('/new/a.csv').data, 'a.csv')
+        self.assertEquals(self.server.store.get('/new/sub/d.csv'), None)
+        self.assertTrue(all(r.ok for r in results))
+
+    def test_move_is_not_coalesced(self):
+        results = self.client.moveMany('src/*', 'new')
+        self.assertEquals(sorted(self._sent('MOVE')),
+                          ['/src/a.csv', '/src/b.csv', '/src/c.txt', '/src/sub/'])
+        self.assertEquals(self._sent('MKCOL'), ['/new/'])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEquals(self.server.store.children('/src/'), [])
+        self.assertEquals(self.server.store.get('/new/a.csv').data, 'a.csv')
+        self.assertEquals(self.server.store.get('/new/sub/d.csv').data, 'd')
+
+    def test_missing_destination_parent(self):
+        self.assertRaises(Exception, self.client.copyMany, ['src/a.csv'], 'missing/new')
+        self.assertEquals(self._sent('COPY'), [])
+
+    def test_multistatus_failures(self):
+        self.server.httpd.fail_paths.add('/src/sub/d.csv')
+        results = self.client.copyMany([('src/sub', 'dst/sub')], None)
+        self.assertEquals(results[0].status, 207)
+        self.assertFalse(results[0].ok)
+        self.assertEquals(results[0].failures, [('/src/sub/d.csv', 'HTTP/1.1 423 Locked')])
+
+    def test_no_overwrite(self):
+        self.server.store.put('/dst/a.csv', 'old')
+        results = self.client.copyMany(['src/a.csv'], 'dst')
+        self.assertEquals(results[0].status, 412)
+        results = self.client.copyMany(['src/a.csv'], 'dst', allow_overwrite=True)
+        self.assertTrue(results[0].ok)
@@ -0,0 +1,85 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pydav.cache
+import pydav.client
+from davserver import DavServer
+
+class TestContentCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store_and_read(self):
+        cache = pydav.cache.ContentCache(self.directory, max_size=100)
+        cache.store('http://h/a', 'hello', '"e1"', None)
+        self.assertEquals(cache.read('http://h/a'), 'hello')
+        self.assertEquals(cache.lookup('http://h/a')['etag'], '"e1"')
+        self.assertEquals(cache.conditional_headers('http://h/a'),
+                          {'If-None-Match': '"e1"'})
+        self.assertEquals(cache.read('http://h/b'), None)
+
+    def test_lru_eviction(self):
+        cache = pydav.cache.ContentCache(self.directory, max_size=10)
+        cache.store('http://h/a', 'aaaa')
+        cache.store('http://h/b', 'bbbb')
+        cache.read('http://h/a')
+        cache.store('http://h/c', 'cccc')
+        self.assertEquals(cache.lookup('http://h/b'), None)
+        self.assertEquals(cache.read('http://h/a'), 'aaaa')
+        self.assertEquals(cache.size, 8)
+
+    def test_reload_from_disk(self):
+        cache = pydav.cache.ContentCache(self.directory, max_size=10)
+        cache.store('http://h/a', 'aaaa', '"e"', 'Mon, 01 Jan 2001 00:00:00 GMT')
+        cache = pydav.cache.ContentCache(self.directory, max_size=10)
+        self.assertEquals(cache.size, 4)
+        self.assertEquals(cache.read('http://h/a'), 'aaaa')
+
+class TestClientCache(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.server.store.put('/data.bin', 'some remote content')
+        self.directory = tempfile.mkdtemp()
+        self.client = pydav.client.Client(self.server.settings(
+            cacheDir=os.path.join(self.directory, 'cache')))
+        self.local = os.path.join(self.directory, 'data.bin')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _read_local(self):
+        local_fd = open(self.local, 'rb')
+        data = local_fd.read()
+        local_fd.close()
+        return data
+
+    def _gets(self):
+        return [r for r in self.server.requests if r[0] == 'GET']
+
+    def test_revalidation_serves_304_from_disk(self):
+        self.client.getFile('data.bin', self.local)
+        os.remove(self.local)
+        self.client.getFile('data.bin', self.local)
+        self.assertEquals(self._read_local(), 'some remote content')
+        gets = self._gets()
+        self.assertEquals(len(gets), 2)
+        self.assertEquals(gets[1][2]['if-none-match'],
+                          self.server.store.get('/data.bin').etag)
+
+    def test_changed_resource_is_downloaded(self):
+        self.client.getFile('data.bin', self.local)
+        self.server.store.put('/data.bin', 'new content')
+        self.client.getFile('data.bin', self.local)
+        self.assertEquals(self._read_local(), 'new content')
+
+    def test_known_etag_skips_request(self):
+        self.client.getFile('data.bin', self.local)
+        etag = self.client.ls('').get('/data.bin')['getetag']
+        self.client.getFile('data.bin', self.local, etag=etag)
+        self.assertEquals(len(self._gets()), 1)
+        self.assertEquals(self._read_local(), 'some remote content')
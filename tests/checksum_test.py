@@ -0,0 +1,106 @@
+import os
+import zlib
+import hashlib
+import tempfile
+import unittest
+import pydav.client
+from pydav.checksum import Checksums, ChecksumMismatch, parse_oc_checksum
+from davserver import DavServer
+
+class Response(dict):
+    status = 200
+
+class TestChecksums(unittest.TestCase):
+    def test_digests(self):
+        checksums = Checksums()
+        checksums.update('hello ')
+        checksums.update('world')
+        digests = checksums.digests()
+        self.assertEquals(digests['MD5'], hashlib.md5('hello world').hexdigest())
+        self.assertEquals(digests['SHA1'], hashlib.sha1('hello world').hexdigest())
+        self.assertEquals(digests['SHA256'], hashlib.sha256('hello world').hexdigest())
+        self.assertEquals(digests['ADLER32'], '%08x' % (zlib.adler32('hello world') & 0xffffffff))
+        self.assertEquals(checksums.size, 11)
+
+    def test_parse_oc_checksum(self):
+        self.assertEquals(parse_oc_checksum('SHA1:ABC md5:def'), {'SHA1': 'abc', 'MD5': 'def'})
+        self.assertEquals(parse_oc_checksum(None), {})
+
+    def test_verify(self):
+        checksums = Checksums(['MD5', 'SHA1'])
+        checksums.update('data')
+        resp = Response({'oc-checksum': 'SHA1:' + hashlib.sha1('data').hexdigest()})
+        self.assertEquals(checksums.verify(resp), ['SHA1'])
+        resp = Response({'etag': '"%s"' % hashlib.md5('data').hexdigest()})
+        self.assertEquals(checksums.verify(resp), [])
+        self.assertEquals(checksums.verify(resp, etag=True), ['MD5'])
+        resp = Response({'oc-checksum': 'SHA1:0000'})
+        self.assertRaises(ChecksumMismatch, checksums.verify, resp)
+
+    def test_unknown_algorithm(self):
+        self.assertRaises(ValueError, Checksums, ['CRC32'])
+
+class TestTransferChecksums(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer(partial_update=False).start()
+        self.directory = tempfile.mkdtemp()
+        self.local = os.path.join(self.directory, 'local')
+        local_fd = open(self.local, 'wb')
+        local_fd.write('0123456789' * 100)
+        local_fd.close()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _client(self, **settings):
+        return pydav.client.Client(self.server.settings(**settings))
+
+    def _sent(self, method):
+        return [r[2] for r in self.server.requests if r[0] == method]
+
+    def test_send_headers(self):
+        client = self._client(checksumHeader='SHA1', checksums=['MD5', 'SHA1'])
+        resp, contents = client.sendFile('/a', self.local)
+        self.assertEquals(resp.status, 201)
+        headers = self._sent('PUT')[0]
+        self.assertEquals(headers['oc-checksum'], 'SHA1:' + hashlib.sha1('0123456789' * 100).hexdigest())
+        self.assertTrue('content-md5' in headers)
+
+    def test_chunked_send(self):
+        client = self._client(checksumHeader='SHA1', checksums=['MD5', 'SHA1'], maxChunkSize=300)
+        checksums = Checksums(['MD5', 'SHA1'])
+        client.sendFile('/a', self.local, checksums=checksums)
+        puts = self._sent('PUT')
+        self.assertEquals(len(puts), 4)
+        self.assertEquals([('oc-checksum' in h) for h in puts], [False, False, False, True])
+        self.assertTrue(all('content-md5' in h for h in puts))
+        self.assertEquals(checksums.size, 1000)
+        self.assertEquals(self.server.store.get('/a').data, '0123456789' * 100)
+
+    def test_get_verifies_server_checksum(self):
+        client = self._client(checksumHeader='SHA1', checksums=['SHA1'])
+        client.sendFile('/a', self.local)
+        target = os.path.join(self.directory, 'copy')
+        checksums = client.getFile('/a', target)
+        self.assertEquals(checksums.hexdigest('SHA1'), hashlib.sha1('0123456789' * 100).hexdigest())
+        self.server.store.get('/a').data = 'corrupted'
+        self.assertRaises(ChecksumMismatch, client.getFile, '/a', target)
+        # the good copy is kept, and no temporary file is left
+        self.assertEquals(open(target).read(), '0123456789' * 100)
+        self.assertEquals(sorted(name for name in os.listdir(self.directory) if name.startswith('copy')), ['copy'])
+
+    def test_get_verifies_etag(self):
+        self.server.store.put('/b', 'content')
+        target = os.path.join(self.directory, 'copy')
+        client = self._client(checksumETag=True)
+        client.getFile('/b', target)
+        self.server.store.get('/b').etag = '"%s"' % hashlib.md5('other').hexdigest()
+        self.assertRaises(ChecksumMismatch, client.getFile, '/b', target)
+
+    def test_range_download(self):
+        client = self._client(checksumHeader='SHA1', checksums=['MD5', 'SHA1'], checksumETag=True)
+        client.sendFile('/a', self.local)
+        target = os.path.join(self.directory, 'part')
+        checksums = client.getFile('/a', target, extra_headers={'Range': 'bytes=0-9'})
+        self.assertEquals(open(target).read(), '0123456789')
+        self.assertEquals(checksums.size, 10)
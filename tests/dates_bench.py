@@ -0,0 +1,38 @@
+""" Parsing time of the WebDAV date properties: dateutil against the
+	dedicated parsers of pydav.dates, with and without memoization. The
+	entries mimic a large listing: `distinct` different timestamps over
+	`entries` "getlastmodified" and "creationdate" values.
+
+	Usage: PYTHONPATH=.:tests python tests/dates_bench.py [entries] [distinct]
+"""
+import sys
+import time
+import random
+import email.utils
+import dateutil.parser
+import pydav.dates
+
+def timed(function, values):
+	start = time.clock()
+	for value in values:
+		function(value)
+	return (time.clock() - start) / len(values) * 1e6
+
+def main():
+	entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+	distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+	stamps = [random.randint(0, 2 ** 31) for index in range(distinct)]
+	rfc1123 = [email.utils.formatdate(stamp, usegmt=True) for stamp in stamps]
+	iso8601 = [time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stamp)) for stamp in stamps]
+	for name, values in (('RFC 1123', rfc1123), ('ISO 8601', iso8601)):
+		values = [random.choice(values) for index in xrange(entries)]
+		# dateutil is too slow for the whole list
+		slow = timed(dateutil.parser.parse, values[:entries // 20])
+		fast = timed(pydav.dates.parse_rfc1123 if name == 'RFC 1123' else pydav.dates.parse_iso8601,
+					 values)
+		memoized = timed(pydav.dates.parse_date, values)
+		print '%s  dateutil %6.2f us   direct %5.2f us   memoized %5.2f us   (%d entries, %.1fs saved)' % (
+			name, slow, fast, memoized, entries, (slow - memoized) * entries / 1e6)
+
+if __name__ == '__main__':
+	main()
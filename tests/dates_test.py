@@ -0,0 +1,48 @@
+import sys
+import unittest
+import dateutil.parser
+import pydav.dates
+
+class TestDates(unittest.TestCase):
+    SAMPLES = [
+        'Wed, 02 Sep 2009 20:50:58 GMT',
+        'Sun, 06 Nov 1994 08:49:37 GMT',
+        '2009-09-02T20:50:58Z',
+        '1997-12-01T17:42:21-08:00',
+        '2012-02-29T23:59:59.123456+05:30',
+        '2012-02-29T23:59:59.5Z',
+        '2012-02-29T23:59:59',
+        'Sunday, 06-Nov-94 08:49:37 GMT',
+        'Sun Nov  6 08:49:37 1994',
+    ]
+
+    def test_same_as_dateutil(self):
+        for text in self.SAMPLES:
+            parsed = pydav.dates.parse_date(text)
+            expected = dateutil.parser.parse(text)
+            self.assertEquals(parsed, expected, text)
+            self.assertEquals(parsed.utcoffset(), expected.utcoffset(), text)
+
+    def test_memoized(self):
+        text = 'Mon, 03 Sep 2012 10:00:00 GMT'
+        self.assertTrue(pydav.dates.parse_date(text) is pydav.dates.parse_date(text))
+
+    def test_invalid(self):
+        self.assertEquals(pydav.dates.parse_rfc1123('Wed, 02 Xyz 2009 20:50:58 GMT'), None)
+        self.assertEquals(pydav.dates.parse_iso8601('2009-13-02T20:50:58Z'), None)
+        self.assertRaises(ValueError, pydav.dates.parse_date, 'not a date')
+        self.assertTrue(pydav.dates.http_date_to_epoch('not a date') != pydav.dates.http_date_to_epoch('not a date'))
+
+    def test_epoch(self):
+        self.assertEquals(pydav.dates.http_date_to_epoch('Thu, 01 Jan 1970 00:01:00 GMT'), 60.0)
+        self.assertEquals(pydav.dates.to_epoch(pydav.dates.parse_date('1970-01-01T02:00:00+01:00')), 3600.0)
+
+    def test_dateutil_not_imported(self):
+        saved = sys.modules.pop('dateutil.parser', None)
+        try:
+            pydav.dates.parse_date('Tue, 04 Sep 2012 10:00:00 GMT')
+            pydav.dates.parse_date('2012-09-04T10:00:00Z')
+            self.assertFalse('dateutil.parser' in sys.modules)
+        finally:
+            if saved is not None:
+                sys.modules['dateutil.parser'] = saved
@@ -0,0 +1,702 @@
+""" Minimal in-memory WebDAV stand-in server used by the test suite.
+
+	It speaks just enough WebDAV (and SabreDAV partial updates) to exercise
+	pydav against a real socket instead of mocks.
+"""
+import BaseHTTPServer
+import SocketServer
+import threading
+import hashlib
+import urllib
+import urlparse
+import email.utils
+import time
+import itertools
+import base64
+import uuid
+from lxml import etree
+
+_generation = itertools.count()
+
+class Resource(object):
+	""" One file or collection of the in-memory store
+	"""
+	def __init__(self, data=None, collection=False):
+		self.collection = collection
+		self.data = data or ''
+		self.ctime = time.time()
+		# dead properties: qualified name -> text
+		self.props = {}
+		self.touch()
+
+	def touch(self):
+		self.mtime = time.time()
+		# OC-Checksum of the last upload, if one was sent
+		self.checksum = None
+		if self.collection:
+			self.etag = '"%s"' % hashlib.md5(str(next(_generation))).hexdigest()
+		else:
+			self.etag = '"%s"' % hashlib.md5(self.data).hexdigest()
+
+class DavStore(object):
+	""" Path -> Resource mapping. Collection paths end with a '/'.
+	"""
+	def __init__(self):
+		self.lock = threading.RLock()
+		self.resources = {'/': Resource(collection=True)}
+		# sync-collection support: path -> (revision, deleted)
+		self.revision = 0
+		self.oldest_revision = 0
+		self.log = {}
+		# path -> [token, depth, expiry]
+		self.locks = {}
+
+	def parent(self, path):
+		stripped = path.rstrip('/')
+		return stripped[:stripped.rfind('/') + 1] or '/'
+
+	def get(self, path):
+		with self.lock:
+			return self.resources.get(path) or self.resources.get(path + '/')
+
+	def key(self, path):
+		with self.lock:
+			if path in self.resources:
+				return path
+			if path + '/' in self.resources:
+				return path + '/'
+			return None
+
+	def children(self, path):
+		with self.lock:
+			return sorted(p for p in self.resources
+						  if p != path and self.parent(p) == path)
+
+	def subtree(self, path):
+		with self.lock:
+			if not path.endswith('/'):
+				return [path] if path in self.resources else []
+			return sorted(p for p in self.resources if p.startswith(path))
+
+	def record(self, path, deleted=False):
+		self.revision += 1
+		self.log[path] = (self.revision, deleted)
+
+	def put(self, path, data):
+		with self.lock:
+			res = self.resources.get(path)
+			if res is None:
+				res = Resource(data)
+				self.resources[path] = res
+				self.changed(self.parent(path))
+			else:
+				res.data = data
+				res.touch()
+				self.changed(self.parent(path))
+			self.record(path)
+			return res
+
+	def mkcol(self, path):
+		with self.lock:
+			if not path.endswith('/'):
+				path += '/'
+			self.resources[path] = Resource(collection=True)
+			self.changed(self.parent(path))
+			self.record(path)
+
+	def delete(self, path):
+		with self.lock:
+			for p in self.subtree(path):
+				del self.resources[p]
+				self.record(p, deleted=True)
+			self.changed(self.parent(path))
+
+	def lock_for(self, path):
+		""" The unexpired lock covering path, if any
+		"""
+		with self.lock:
+			now = time.time()
+			for locked, (token, depth, expiry) in self.locks.items():
+				if expiry < now:
+					del self.locks[locked]
+					continue
+				if path.rstrip('/') == locked.rstrip('/') or (
+						depth == 'infinity' and path.startswith(locked.rstrip('/') + '/')):
+					return locked, token
+			return None
+
+	def forget_tokens(self):
+		""" Invalidate every sync-token handed out so far
+		"""
+		with self.lock:
+			self.oldest_revision = self.revision
+
+	def changed(self, path):
+		# collection etags change along with any descendant, like ownCloud does
+		while True:
+			res = self.resources.get(path)
+			if res is not None:
+				res.touch()
+			if path == '/':
+				return
+			path = self.parent(path)
+
+class DavHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	disable_nagle_algorithm = True
+	wbufsize = -1
+
+	def log_message(self, *args):
+		pass
+
+	@property
+	def store(self):
+		return self.server.store
+
+	def _path(self):
+		path = urllib.unquote(urlparse.urlparse(self.path).path)
+		return path or '/'
+
+	def _body(self):
+		length = int(self.headers.get('content-length') or 0)
+		return self.rfile.read(length) if length else ''
+
+	def _reply(self, status, body='', headers={}):
+		self.send_response(status)
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(body)
+
+	def _record(self):
+		self.server.requests.append((self.command, self.path, dict(self.headers)))
+
+	def _md5_ok(self, body):
+		""" Check the Content-MD5 of a request body. Replies 400 and returns
+			False on mismatch.
+		"""
+		md5 = self.headers.get('content-md5')
+		if md5 and base64.b64decode(md5) != hashlib.md5(body).digest():
+			self._reply(400)
+			return False
+		return True
+
+	def _unlocked(self, *paths):
+		""" Check that the If header holds the tokens of the locks covering
+			paths. Replies 423 and returns False otherwise.
+		"""
+		condition = self.headers.get('if', '')
+		for path in paths:
+			found = self.store.lock_for(path)
+			if found is not None and '<%s>' % found[1] not in condition:
+				self._reply(423)
+				return False
+		return True
+
+	def _conflict(self, path):
+		""" Answer 409 when the parent collection of path is missing, as
+			RFC 4918 requires for PUT, MKCOL, COPY and MOVE
+		"""
+		parent = self.store.resources.get(self.store.parent(path))
+		if parent is not None and parent.collection:
+			return False
+		self._reply(409)
+		return True
+
+	def do_OPTIONS(self):
+		self._record()
+		self._body()
+		dav = '1, 2'
+		if self.server.multiget:
+			dav += ', addressbook, calendar-access'
+		if self.server.partial_update:
+			dav += ', sabredav-partialupdate'
+		self._reply(200, headers={
+			'Allow': ', '.join(self.server.methods),
+			'DAV': dav,
+			'X-Sabre-Version': '1.8',
+		})
+
+	def _file_headers(self, res):
+		headers = {
+			'ETag': res.etag,
+			'Last-Modified': email.utils.formatdate(res.mtime, usegmt=True),
+			'Accept-Ranges': 'bytes',
+		}
+		if res.checksum:
+			headers['OC-Checksum'] = res.checksum
+		return headers
+
+	def do_HEAD(self):
+		self._record()
+		res = self.store.get(self._path())
+		if res is None:
+			return self._reply(404)
+		headers = self._file_headers(res)
+		self.send_response(200)
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.send_header('Content-Length', str(len(res.data)))
+		self.end_headers()
+
+	def do_GET(self):
+		self._record()
+		res = self.store.get(self._path())
+		if res is None:
+			return self._reply(404)
+		headers = self._file_headers(res)
+		inm = self.headers.get('if-none-match')
+		if inm is not None and inm == res.etag:
+			return self._reply(304, headers=headers)
+		ims = self.headers.get('if-modified-since')
+		if inm is None and ims is not None:
+			since = email.utils.mktime_tz(email.utils.parsedate_tz(ims))
+			if int(res.mtime) <= since:
+				return self._reply(304, headers=headers)
+		rng = self.headers.get('range')
+		if rng and rng.startswith('bytes='):
+			size = len(res.data)
+			first, last = rng[6:].split('-')
+			if first == '':
+				first, last = max(size - int(last), 0), size - 1
+			else:
+				first = int(first)
+				last = min(int(last), size - 1) if last else size - 1
+			if first >= size:
+				return self._reply(416, headers={'Content-Range': 'bytes */%d' % size})
+			headers['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+			return self._reply(206, res.data[first:last + 1], headers)
+		self._reply(200, res.data, headers)
+
+	def do_PUT(self):
+		self._record()
+		path = self._path()
+		body = self._body()
+		if not self._md5_ok(body) or not self._unlocked(path) or self._conflict(path):
+			return
+		crange = self.headers.get('content-range')
+		if crange:
+			spec, total = crange.split(' ', 1)[1].split('/')
+			first = int(spec.split('-')[0])
+			current = self.store.get(path)
+			data = current.data if current is not None else ''
+			data = data.ljust(first, '\0')
+			body = data[:first] + body + data[first + len(body):]
+		existed = self.store.get(path) is not None
+		checksum = self.headers.get('oc-checksum')
+		if checksum:
+			algorithm, digest = checksum.split(':', 1)
+			if hashlib.new(algorithm.lower(), body).hexdigest() != digest:
+				return self._reply(400)
+		res = self.store.put(path, body)
+		res.checksum = checksum
+		self._reply(204 if existed else 201, headers={'ETag': res.etag})
+
+	def do_PATCH(self):
+		self._record()
+		path = self._path()
+		body = self._body()
+		if not self._md5_ok(body) or not self._unlocked(path):
+			return
+		res = self.store.get(path)
+		if res is None:
+			return self._reply(404)
+		spec = self.headers.get('x-update-range', '')
+		if spec == 'append':
+			first = len(res.data)
+		else:
+			first = int(spec[6:].split('-')[0])
+		data = res.data.ljust(first, '\0')
+		res = self.store.put(path, data[:first] + body + data[first + len(body):])
+		self._reply(204, headers={'ETag': res.etag})
+
+	def do_DELETE(self):
+		self._record()
+		path = self._path()
+		key = self.store.key(path)
+		if key is None:
+			return self._reply(404)
+		if not self._unlocked(path):
+			return
+		self.store.delete(key)
+		self._reply(204)
+
+	def do_MKCOL(self):
+		self._record()
+		self._body()
+		path = self._path()
+		if not self._unlocked(path):
+			return
+		if self.store.get(path) is not None:
+			return self._reply(405)
+		if self._conflict(path):
+			return
+		self.store.mkcol(path)
+		self._reply(201)
+
+	def _copy(self, move):
+		self._record()
+		source = self.store.key(self._path())
+		if source is None:
+			return self._reply(404)
+		destination = urllib.unquote(urlparse.urlparse(self.headers['destination']).path)
+		if source.endswith('/') and not destination.endswith('/'):
+			destination += '/'
+		if not self._unlocked(*([destination, source] if move else [destination])) or self._conflict(destination):
+			return
+		overwrite = self.headers.get('overwrite', 'T') != 'F'
+		existed = self.store.get(destination) is not None
+		if existed and not overwrite:
+			return self._reply(412)
+		failed = []
+		with self.store.lock:
+			if existed:
+				self.store.delete(self.store.key(destination))
+			depth = self.headers.get('depth', 'infinity')
+			for path in self.store.subtree(source):
+				if depth == '0' and path != source:
+					continue
+				if path in self.server.fail_paths:
+					failed.append(path)
+					continue
+				target = destination + path[len(source):]
+				old = self.store.resources[path]
+				if old.collection:
+					self.store.mkcol(target)
+				else:
+					self.store.put(target, old.data)
+			if move:
+				for path in self.store.subtree(source):
+					if path not in failed and not self.store.resources[path].collection:
+						self.store.delete(path)
+				if not failed:
+					self.store.delete(source)
+		if failed:
+			multistatus = etree.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
+			for path in failed:
+				response = etree.SubElement(multistatus, '{DAV:}response')
+				etree.SubElement(response, '{DAV:}href').text = urllib.quote(path)
+				etree.SubElement(response, '{DAV:}status').text = 'HTTP/1.1 423 Locked'
+			return self._reply(207, etree.tostring(multistatus, xml_declaration=True, encoding='utf-8'),
+							   {'Content-Type': 'application/xml; charset=utf-8'})
+		self._reply(204 if existed else 201)
+
+	def do_COPY(self):
+		self._copy(False)
+
+	def do_MOVE(self):
+		self._copy(True)
+
+	def _propstat(self, path, res, names):
+		response = etree.Element('{DAV:}response')
+		etree.SubElement(response, '{DAV:}href').text = urllib.quote(path)
+		values = {
+			'{DAV:}getetag': res.etag,
+			'{DAV:}getlastmodified': email.utils.formatdate(res.mtime, usegmt=True),
+			'{DAV:}creationdate': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(res.ctime)),
+			'{DAV:}displayname': path.rstrip('/').split('/')[-1],
+		}
+		if not res.collection:
+			values['{DAV:}getcontentlength'] = str(len(res.data))
+			values['{DAV:}getcontenttype'] = 'application/octet-stream'
+		elif self.server.quota:
+			used = sum(len(self.store.resources[p].data) for p in self.store.subtree(path))
+			values['{DAV:}quota-used-bytes'] = str(used)
+			values['{DAV:}quota-available-bytes'] = str(10 ** 9)
+		values.update(res.props)
+		found = etree.SubElement(etree.SubElement(response, '{DAV:}propstat'), '{DAV:}prop')
+		missing = []
+		# RFC 4331: quota properties are never part of allprop
+		allprop = ['{DAV:}resourcetype'] + [n for n in sorted(values) if 'quota' not in n]
+		for name in names or allprop:
+			if name == '{DAV:}resourcetype':
+				node = etree.SubElement(found, name)
+				if res.collection:
+					etree.SubElement(node, '{DAV:}collection')
+			elif name in values:
+				etree.SubElement(found, name).text = values[name]
+			else:
+				missing.append(name)
+		etree.SubElement(found.getparent(), '{DAV:}status').text = 'HTTP/1.1 200 OK'
+		if missing:
+			propstat = etree.SubElement(response, '{DAV:}propstat')
+			prop = etree.SubElement(propstat, '{DAV:}prop')
+			for name in missing:
+				etree.SubElement(prop, name)
+			etree.SubElement(propstat, '{DAV:}status').text = 'HTTP/1.1 404 Not Found'
+		return response
+
+	LIVE = ('{DAV:}getetag', '{DAV:}getlastmodified', '{DAV:}creationdate', '{DAV:}resourcetype',
+			'{DAV:}getcontentlength', '{DAV:}lockdiscovery', '{DAV:}supportedlock')
+
+	def do_PROPPATCH(self):
+		""" Atomic: when a property can not be changed (live ones), none is
+			and the others are answered 424
+		"""
+		self._record()
+		path = self._path()
+		root = etree.XML(self._body())
+		key = self.store.key(path)
+		if key is None:
+			return self._reply(404)
+		if not self._unlocked(path):
+			return
+		changes = []
+		for action in root:
+			for node in action.iterfind('{DAV:}prop/*'):
+				value = node.text if action.tag == '{DAV:}set' else None
+				changes.append((node.tag, value))
+		statuses = dict((name, 403 if name in self.LIVE else 200) for name, value in changes)
+		if 403 in statuses.values():
+			statuses = dict((name, status if status == 403 else 424) for name, status in statuses.items())
+		else:
+			with self.store.lock:
+				props = self.store.resources[key].props
+				for name, value in changes:
+					if value is None:
+						props.pop(name, None)
+					else:
+						props[name] = value
+		multistatus = etree.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
+		response = etree.SubElement(multistatus, '{DAV:}response')
+		etree.SubElement(response, '{DAV:}href').text = urllib.quote(key)
+		for status in sorted(set(statuses.values())):
+			propstat = etree.SubElement(response, '{DAV:}propstat')
+			prop = etree.SubElement(propstat, '{DAV:}prop')
+			for name in sorted(n for n, s in statuses.items() if s == status):
+				etree.SubElement(prop, name)
+			etree.SubElement(propstat, '{DAV:}status').text = 'HTTP/1.1 %d %s' % (
+				status, BaseHTTPServer.BaseHTTPRequestHandler.responses.get(status, ('',))[0])
+		self._reply(207, etree.tostring(multistatus, xml_declaration=True, encoding='utf-8'),
+					{'Content-Type': 'application/xml; charset=utf-8'})
+
+	def do_PROPFIND(self):
+		self._record()
+		path = self._path()
+		body = self._body()
+		key = self.store.key(path)
+		if key is None:
+			return self._reply(404)
+		names = []
+		if body:
+			root = etree.XML(body)
+			prop = root.find('{DAV:}prop')
+			if prop is not None:
+				names = [child.tag for child in prop]
+		depth = self.headers.get('depth', 'infinity')
+		paths = [key]
+		if depth == '1' and key.endswith('/'):
+			paths += self.store.children(key)
+		elif depth == 'infinity':
+			paths = self.store.subtree(key)
+		multistatus = etree.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
+		with self.store.lock:
+			for p in paths:
+				multistatus.append(self._propstat(p, self.store.resources[p], names))
+		self._reply(207, etree.tostring(multistatus, xml_declaration=True, encoding='utf-8'),
+					{'Content-Type': 'application/xml; charset=utf-8'})
+
+	SYNC_PREFIX = 'http://pydav.test/sync/'
+
+	def do_REPORT(self):
+		self._record()
+		path = self._path()
+		root = etree.XML(self._body())
+		key = self.store.key(path)
+		if key is None:
+			return self._reply(404)
+		if root.tag == '{DAV:}sync-collection':
+			return self._sync_collection(key, root)
+		if root.tag in self.MULTIGET and self.server.multiget:
+			return self._multiget(root, self.MULTIGET[root.tag])
+		self._reply(501)
+
+	MULTIGET = {
+		'{urn:ietf:params:xml:ns:carddav}addressbook-multiget': '{urn:ietf:params:xml:ns:carddav}address-data',
+		'{urn:ietf:params:xml:ns:caldav}calendar-multiget': '{urn:ietf:params:xml:ns:caldav}calendar-data',
+	}
+
+	def _multiget(self, root, data):
+		multistatus = etree.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
+		with self.store.lock:
+			for href in root.iterfind('{DAV:}href'):
+				path = urllib.unquote(urlparse.urlparse(href.text).path)
+				res = self.store.resources.get(path)
+				response = etree.SubElement(multistatus, '{DAV:}response')
+				etree.SubElement(response, '{DAV:}href').text = href.text
+				if res is None or res.collection:
+					etree.SubElement(response, '{DAV:}status').text = 'HTTP/1.1 404 Not Found'
+					continue
+				propstat = etree.SubElement(response, '{DAV:}propstat')
+				prop = etree.SubElement(propstat, '{DAV:}prop')
+				etree.SubElement(prop, '{DAV:}getetag').text = res.etag
+				etree.SubElement(prop, data).text = res.data.decode('utf-8')
+				etree.SubElement(propstat, '{DAV:}status').text = 'HTTP/1.1 200 OK'
+		self._reply(207, etree.tostring(multistatus, xml_declaration=True, encoding='utf-8'),
+					{'Content-Type': 'application/xml; charset=utf-8'})
+
+	def _sync_collection(self, key, root):
+		token = root.findtext('{DAV:}sync-token') or ''
+		infinite = root.findtext('{DAV:}sync-level') == 'infinite'
+		limit = root.findtext('{DAV:}limit/{DAV:}nresults')
+		prop = root.find('{DAV:}prop')
+		names = [child.tag for child in prop] if prop is not None else []
+
+		def in_scope(p):
+			if p == key or not p.startswith(key):
+				return False
+			return infinite or self.store.parent(p) == key
+
+		with self.store.lock:
+			if token:
+				if not token.startswith(self.SYNC_PREFIX):
+					return self._invalid_token()
+				since = int(token[len(self.SYNC_PREFIX):])
+				if since < self.store.oldest_revision or since > self.store.revision:
+					return self._invalid_token()
+				entries = [(rev, p, deleted) for p, (rev, deleted) in self.store.log.items()
+						   if rev > since and in_scope(p)]
+			else:
+				entries = [(self.store.log.get(p, (0, False))[0], p, False)
+						   for p in self.store.resources if in_scope(p)]
+			entries.sort()
+			truncated = limit is not None and len(entries) > int(limit)
+			if truncated:
+				entries = entries[:int(limit)]
+				revision = entries[-1][0] if entries else self.store.revision
+			else:
+				revision = self.store.revision
+
+			multistatus = etree.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
+			for rev, p, deleted in entries:
+				if deleted:
+					response = etree.SubElement(multistatus, '{DAV:}response')
+					etree.SubElement(response, '{DAV:}href').text = urllib.quote(p)
+					etree.SubElement(response, '{DAV:}status').text = 'HTTP/1.1 404 Not Found'
+				else:
+					multistatus.append(self._propstat(p, self.store.resources[p], names))
+			if truncated:
+				response = etree.SubElement(multistatus, '{DAV:}response')
+				etree.SubElement(response, '{DAV:}href').text = urllib.quote(key)
+				etree.SubElement(response, '{DAV:}status').text = 'HTTP/1.1 507 Insufficient Storage'
+			etree.SubElement(multistatus, '{DAV:}sync-token').text = self.SYNC_PREFIX + str(revision)
+		self._reply(207, etree.tostring(multistatus, xml_declaration=True, encoding='utf-8'),
+					{'Content-Type': 'application/xml; charset=utf-8'})
+
+	def do_LOCK(self):
+		self._record()
+		body = self._body()
+		path = self._path()
+		timeout = self.headers.get('timeout', 'Second-3600').split(',')[0].strip()
+		seconds = int(timeout[7:]) if timeout.lower().startswith('second-') else 3600
+		with self.store.lock:
+			if not body:
+				# refresh of a held lock, named by the If header
+				found = self.store.lock_for(path)
+				if found is None or '<%s>' % found[1] not in self.headers.get('if', ''):
+					return self._reply(412)
+				locked, token = found
+				lock = self.store.locks[locked]
+				lock[2] = time.time() + seconds
+				depth = lock[1]
+				headers = {}
+			else:
+				if self.store.lock_for(path) is not None:
+					return self._reply(423)
+				depth = self.headers.get('depth', 'infinity').lower()
+				token = 'opaquelocktoken:%s' % uuid.uuid4()
+				if self.store.get(path) is None:
+					self.store.put(path, '')
+				self.store.locks[self.store.key(path)] = [token, depth, time.time() + seconds]
+				headers = {'Lock-Token': '<%s>' % token}
+		prop = etree.Element('{DAV:}prop', nsmap={'D': 'DAV:'})
+		active = etree.SubElement(etree.SubElement(prop, '{DAV:}lockdiscovery'), '{DAV:}activelock')
+		etree.SubElement(etree.SubElement(active, '{DAV:}locktype'), '{DAV:}write')
+		etree.SubElement(etree.SubElement(active, '{DAV:}lockscope'), '{DAV:}exclusive')
+		etree.SubElement(active, '{DAV:}depth').text = depth
+		etree.SubElement(active, '{DAV:}timeout').text = 'Second-%d' % seconds
+		etree.SubElement(etree.SubElement(active, '{DAV:}locktoken'), '{DAV:}href').text = token
+		headers['Content-Type'] = 'application/xml; charset=utf-8'
+		self._reply(200, etree.tostring(prop, xml_declaration=True, encoding='utf-8'), headers)
+
+	def do_UNLOCK(self):
+		self._record()
+		self._body()
+		token = self.headers.get('lock-token', '').strip().lstrip('<').rstrip('>')
+		with self.store.lock:
+			for locked, lock in self.store.locks.items():
+				if lock[0] == token:
+					del self.store.locks[locked]
+					return self._reply(204)
+		self._reply(409)
+
+	def _invalid_token(self):
+		error = etree.Element('{DAV:}error', nsmap={'D': 'DAV:'})
+		etree.SubElement(error, '{DAV:}valid-sync-token')
+		self._reply(403, etree.tostring(error, xml_declaration=True, encoding='utf-8'),
+					{'Content-Type': 'application/xml; charset=utf-8'})
+
+class ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class DavServer(object):
+	""" Run a DavHandler server on a random local port in a background thread
+
+		Usage:
+			server = DavServer().start()
+			... Connection(server.settings()) ...
+			server.stop()
+	"""
+	METHODS = ['OPTIONS', 'GET', 'HEAD', 'PUT', 'DELETE', 'MKCOL', 'COPY',
+			   'MOVE', 'PROPFIND', 'PROPPATCH', 'LOCK', 'UNLOCK', 'REPORT']
+
+	def __init__(self, partial_update=True, quota=False, handler=DavHandler, multiget=True):
+		self.httpd = ThreadedServer(('127.0.0.1', 0), handler)
+		self.httpd.store = DavStore()
+		self.httpd.requests = []
+		self.httpd.partial_update = partial_update
+		self.httpd.quota = quota
+		# CardDAV/CalDAV multiget REPORTs
+		self.httpd.multiget = multiget
+		# COPY and MOVE fail on these paths with a 207 answer
+		self.httpd.fail_paths = set()
+		self.httpd.methods = list(self.METHODS)
+		if partial_update:
+			self.httpd.methods.append('PATCH')
+		self.thread = None
+
+	@property
+	def store(self):
+		return self.httpd.store
+
+	@property
+	def requests(self):
+		return self.httpd.requests
+
+	@property
+	def port(self):
+		return self.httpd.server_address[1]
+
+	def settings(self, **extra):
+		settings = {'host': 'http://127.0.0.1:%d' % self.port,
+					'path': '/',
+					'username': 'wibble',
+					'password': 'fish',
+					'realm': '',
+					'port': self.port}
+		settings.update(extra)
+		return settings
+
+	def start(self):
+		self.thread = threading.Thread(target=self.httpd.serve_forever,
+									   kwargs={'poll_interval': 0.05})
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
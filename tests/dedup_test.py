@@ -0,0 +1,142 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import unittest
+import pydav.client
+from pydav.dedup import UploadCache
+from davserver import DavServer
+
+class TestUploadCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local = os.path.join(self.directory, 'local')
+        self._write('content')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, data, mtime=None):
+        local_fd = open(self.local, 'wb')
+        local_fd.write(data)
+        local_fd.close()
+        if mtime is not None:
+            os.utime(self.local, (mtime, mtime))
+
+    def test_digest_cached(self):
+        cache = UploadCache()
+        self.assertEquals(cache.digest(self.local), hashlib.md5('content').hexdigest())
+        self.assertEquals(cache.digest(self.local), hashlib.md5('content').hexdigest())
+        self.assertEquals(cache.hashed, 1)
+        self._write('changed', time.time() + 10)
+        self.assertEquals(cache.digest(self.local), hashlib.md5('changed').hexdigest())
+        self.assertEquals(cache.hashed, 2)
+
+    def test_persistent(self):
+        dbpath = os.path.join(self.directory, 'dedup.db')
+        cache = UploadCache(dbpath)
+        cache.digest(self.local)
+        cache.record('http://host/a', 'digest', '"etag"')
+        cache.close()
+        cache = UploadCache(dbpath)
+        cache.digest(self.local)
+        self.assertEquals(cache.hashed, 0)
+        self.assertEquals(cache.remote('http://host/a'), ('digest', '"etag"'))
+
+    def test_unchanged(self):
+        cache = UploadCache()
+        digest = hashlib.md5('content').hexdigest()
+        self.assertEquals(cache.candidate('http://host/a', self.local), None)
+        self.assertEquals(cache.hashed, 0)
+        cache.record('http://host/a', digest, '"1"')
+        self.assertEquals(cache.candidate('http://host/a', self.local), digest)
+        self.assertTrue(cache.unchanged('http://host/a', digest, '"1"'))
+        self.assertFalse(cache.unchanged('http://host/a', digest, '"2"'))
+        self.assertTrue(cache.unchanged('http://host/a', digest, '"2"', 'MD5:' + digest))
+        self.assertTrue(cache.unchanged('http://host/b', digest, '"%s"' % digest, md5_etags=True))
+
+class TestDedupUploads(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.directory = tempfile.mkdtemp()
+        self.server.store.mkcol('/dir/')
+        self.files = []
+        for index in range(4):
+            local = os.path.join(self.directory, 'f%d' % index)
+            local_fd = open(local, 'wb')
+            local_fd.write('data %d' % index)
+            local_fd.close()
+            self.files.append(('dir/f%d' % index, local))
+        self.dbpath = os.path.join(self.directory, 'dedup.db')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _client(self, **settings):
+        return pydav.client.Client(self.server.settings(uploadCache=self.dbpath, **settings))
+
+    def _puts(self):
+        return [r for r in self.server.requests if r[0] == 'PUT']
+
+    def test_send_file_skipped(self):
+        path, local = self.files[0]
+        resp, contents = self._client().sendFile(path, local)
+        self.assertEquals(resp.status, 201)
+        client = self._client()#no state kept by the caller
+        resp, contents = client.sendFile(path, local)
+        self.assertEquals(resp.status, 200)
+        self.assertEquals(len(self._puts()), 1)
+        self.assertEquals(client.dedup.skipped, 1)
+        self.assertEquals(client.dedup.hashed, 0)
+
+    def test_remote_changed(self):
+        path, local = self.files[0]
+        client = self._client()
+        client.sendFile(path, local)
+        self.server.store.put('/' + path, 'changed by someone else')
+        client.sendFile(path, local)
+        self.assertEquals(len(self._puts()), 2)
+        self.assertEquals(self.server.store.get('/' + path).data, 'data 0')
+
+    def test_local_changed(self):
+        path, local = self.files[0]
+        client = self._client()
+        client.sendFile(path, local)
+        local_fd = open(local, 'wb')
+        local_fd.write('new data')
+        local_fd.close()
+        os.utime(local, (time.time() + 10, time.time() + 10))
+        client.sendFile(path, local)
+        self.assertEquals(len(self._puts()), 2)
+        self.assertEquals(self.server.store.get('/' + path).data, 'new data')
+
+    def test_md5_etags(self):
+        path, local = self.files[0]
+        self.server.store.put('/' + path, 'data 0')
+        resp, contents = self._client(checksumETag=True).sendFile(path, local)
+        self.assertEquals(resp.status, 200)
+        self.assertEquals(self._puts(), [])
+
+    def test_send_files(self):
+        client = self._client()
+        results = client.sendFiles(self.files)
+        self.assertEquals([r.status for r in results], [201] * 4)
+        self.assertFalse(any(r.skipped for r in results))
+        self.server.store.put('/dir/f1', 'changed')
+        client = self._client()
+        before = len(self.server.requests)
+        results = client.sendFiles(self.files)
+        self.assertEquals([r.skipped for r in results], [True, False, True, True])
+        self.assertEquals(results[0].path, 'dir/f0')
+        methods = [r[0] for r in self.server.requests[before:]]
+        self.assertEquals(sorted(methods), ['PROPFIND', 'PUT'])
+        self.assertEquals(self.server.store.get('/dir/f1').data, 'data 1')
+
+    def test_disabled(self):
+        client = pydav.client.Client(self.server.settings())
+        path, local = self.files[0]
+        client.sendFile(path, local)
+        client.sendFile(path, local)
+        self.assertEquals(len(self._puts()), 2)
@@ -0,0 +1,78 @@
+import unittest
+import urllib
+import pydav.client
+from davserver import DavServer, DavHandler
+
+class BareSelfHandler(DavHandler):
+    """ Names the listed collection itself without its trailing slash and
+        with "~" unquoted, unlike the listing of its parent
+    """
+    def _propstat(self, path, res, names):
+        response = DavHandler._propstat(self, path, res, names)
+        if path == self.store.key(self._path()):
+            response.find('{DAV:}href').text = urllib.quote(path.rstrip('/'), safe='/~')
+        return response
+
+class TestDiskUsage(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self._populate(self.server)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _populate(self, server):
+        store = server.store
+        for path in ('/r/', '/r/a/', '/r/a/x/', '/r/b/', '/r/empty/'):
+            store.mkcol(path)
+        store.put('/r/top', '1' * 1)
+        store.put('/r/a/f', '2' * 20)
+        store.put('/r/a/x/g', '3' * 300)
+        store.put('/r/b/h', '4' * 4000)
+
+    def _client(self, **kwargs):
+        return pydav.client.Client(self.server.settings(**kwargs))
+
+    def test_walk(self):
+        usage = self._client().du('r', depth=1, workers=3)
+        self.assertEquals(usage.source, 'walk')
+        self.assertEquals(usage.total, 4321)
+        self.assertEquals(usage.files, 4)
+        self.assertEquals(usage.breakdown(), [('/r/', 4321), ('/r/a/', 320),
+                                              ('/r/b/', 4000), ('/r/empty/', 0)])
+
+    def test_walk_depth(self):
+        client = self._client()
+        self.assertEquals(client.du('r', depth=0).sizes, {'/r/': 4321})
+        self.assertEquals(client.du('r', depth=2).sizes['/r/a/x/'], 300)
+
+    def test_quota(self):
+        self.server.stop()
+        self.server = DavServer(quota=True).start()
+        self._populate(self.server)
+        usage = self._client().du('r', depth=1)
+        self.assertEquals(usage.source, 'quota')
+        self.assertEquals(usage.total, 4321)
+        self.assertEquals(usage.available, 10 ** 9)
+        self.assertEquals(usage.sizes['/r/a/'], 320)
+        propfinds = [r for r in self.server.requests if r[0] == 'PROPFIND']
+        self.assertEquals(len(propfinds), 2)
+
+    def test_quota_disabled(self):
+        self.server.stop()
+        self.server = DavServer(quota=True).start()
+        self._populate(self.server)
+        usage = self._client().du('r', use_quota=False)
+        self.assertEquals((usage.source, usage.total), ('walk', 4321))
+
+    def test_href_quoting(self):
+        self.server.stop()
+        self.server = DavServer(handler=BareSelfHandler).start()
+        self._populate(self.server)
+        self.server.store.mkcol('/r/~u/')
+        self.server.store.put('/r/~u/i', '5' * 50000)
+        usage = self._client().du('r/~u', depth=1)
+        self.assertEquals((usage.total, usage.files), (50000, 1))
+        usage = self._client().du('r', depth=1)
+        self.assertEquals((usage.total, usage.files), (54321, 5))
+        self.assertEquals(usage.sizes['/r/%7Eu/'], 50000)
@@ -0,0 +1,135 @@
+""" HTTP/2 flavour of the stand-in WebDAV server.
+
+	Every HTTP/2 request is replayed as an HTTP/1.1 request through
+	DavHandler, so both servers share the same WebDAV behaviour. Requests
+	of a connection are processed concurrently, one thread per stream.
+"""
+import time
+import socket
+import httplib
+import threading
+import SocketServer
+from cStringIO import StringIO
+import h2.config
+import h2.events
+import h2.exceptions
+import h2.settings
+import h2.connection
+from davserver import DavHandler, DavServer
+
+class _Bridge(DavHandler):
+	""" Run one raw HTTP/1.1 request through DavHandler, in memory
+	"""
+	def __init__(self, raw, server):
+		self.rfile = StringIO(raw)
+		self.wfile = StringIO()
+		self.server = server
+		self.client_address = ('127.0.0.1', 0)
+		self.handle_one_request()
+
+class _Socket(object):
+	def __init__(self, data):
+		self.data = data
+
+	def makefile(self, *args):
+		return StringIO(self.data)
+
+class H2Handler(SocketServer.BaseRequestHandler):
+	""" Serve one HTTP/2 (prior knowledge) connection
+	"""
+	def handle(self):
+		self.cond = threading.Condition()
+		self.conn = h2.connection.H2Connection(h2.config.H2Configuration(
+			client_side=False, header_encoding=None))
+		self.conn.local_settings = h2.settings.Settings(
+			client=False,
+			initial_values={h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: self.server.h2_max_streams})
+		self.conn.initiate_connection()
+		self.request.sendall(self.conn.data_to_send())
+		streams = {}
+		while True:
+			try:
+				data = self.request.recv(65536)
+			except socket.error:
+				data = ''
+			with self.cond:
+				if not data:
+					self.cond.notify_all()
+					return
+				for event in self.conn.receive_data(data):
+					if isinstance(event, h2.events.RequestReceived):
+						streams[event.stream_id] = (event.headers, [])
+					elif isinstance(event, h2.events.DataReceived):
+						streams[event.stream_id][1].append(event.data)
+						self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+					elif isinstance(event, h2.events.StreamEnded):
+						headers, body = streams.pop(event.stream_id)
+						worker = threading.Thread(target=self.respond,
+												  args=(event.stream_id, headers, ''.join(body)))
+						worker.daemon = True
+						worker.start()
+					elif isinstance(event, h2.events.ConnectionTerminated):
+						return
+				self.request.sendall(self.conn.data_to_send())
+				self.cond.notify_all()
+
+	def respond(self, stream_id, headers, body):
+		server = self.server
+		with self.cond:
+			server.h2_active += 1
+			server.h2_peak = max(server.h2_peak, server.h2_active)
+		if server.h2_delay:
+			time.sleep(server.h2_delay)
+		pseudo = dict((n, v) for n, v in headers if n.startswith(':'))
+		raw = '%s %s HTTP/1.1\r\n' % (pseudo[':method'], pseudo[':path'])
+		raw += ''.join('%s: %s\r\n' % (n, v) for n, v in headers if not n.startswith(':'))
+		if body and 'content-length' not in [n for n, v in headers]:
+			raw += 'Content-Length: %d\r\n' % len(body)
+		raw += '\r\n' + body
+		reply = httplib.HTTPResponse(_Socket(_Bridge(raw, server).wfile.getvalue()),
+									 method=pseudo[':method'])
+		reply.begin()
+		data = reply.read()
+		response = [(':status', str(reply.status))]
+		response += [(n, v) for n, v in reply.getheaders()
+					 if n not in ('connection', 'content-length', 'transfer-encoding')]
+		response.append(('content-length', str(len(data))))
+		with self.cond:
+			server.h2_active -= 1
+			try:
+				self._send(stream_id, response, data)
+			except h2.exceptions.StreamClosedError:
+				pass#reset by the client meanwhile
+
+	def _send(self, stream_id, response, data):
+		self.conn.send_headers(stream_id, response, end_stream=not data)
+		self.request.sendall(self.conn.data_to_send())
+		offset = 0
+		while offset < len(data):
+			window = min(self.conn.local_flow_control_window(stream_id),
+						 self.conn.max_outbound_frame_size)
+			if window <= 0:
+				self.cond.wait()
+				continue
+			end = offset + window >= len(data)
+			self.conn.send_data(stream_id, data[offset:offset + window], end_stream=end)
+			self.request.sendall(self.conn.data_to_send())
+			offset += window
+
+class H2DavServer(DavServer):
+	""" DavServer speaking HTTP/2 with prior knowledge over cleartext
+
+		:param max_streams: MAX_CONCURRENT_STREAMS setting sent to clients
+		:param delay: Seconds every request takes, to make concurrency observable
+	"""
+	def __init__(self, max_streams=100, delay=0, **options):
+		options.setdefault('handler', H2Handler)
+		DavServer.__init__(self, **options)
+		self.httpd.h2_max_streams = max_streams
+		self.httpd.h2_delay = delay
+		self.httpd.h2_active = 0
+		self.httpd.h2_peak = 0
+
+	def settings(self, **extra):
+		extra.setdefault('http2', True)
+		return DavServer.settings(self, **extra)
@@ -0,0 +1,50 @@
+""" Compare the httplib2 and HTTP/2 transports on many small PROPFIND
+	requests sent concurrently, each one taking `delay` seconds on the server.
+	httplib2 needs one connection per concurrent request: it is measured with
+	as many connections as threads, and capped to `connections` (the usual
+	per-host limit of servers and proxies).
+
+	Usage: PYTHONPATH=.:tests python tests/http2_bench.py [requests] [threads] [delay] [connections]
+"""
+import sys
+import time
+import pydav.connection
+from pydav.workers import ConnectionPool, TaskPool
+from davserver import DavHandler, DavServer
+from h2server import H2DavServer
+
+class SlowHandler(DavHandler):
+	delay = 0
+
+	def _record(self):
+		time.sleep(self.delay)
+		DavHandler._record(self)
+
+def run(server, requests, threads):
+	for index in range(requests):
+		server.store.put('/f%d' % index, 'x')
+	pool = ConnectionPool(pydav.connection.Connection(server.settings()))
+	start = time.time()
+	TaskPool(threads).map(lambda index: pool.get().send_propfind('/f%d' % index, ['getetag'], 0, raw=True),
+						  range(requests))
+	return time.time() - start
+
+def main():
+	requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+	delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+	connections = int(sys.argv[4]) if len(sys.argv) > 4 else 6
+	SlowHandler.delay = delay
+	for name, server, workers in (
+			('httplib2, %d connections' % threads, DavServer(handler=SlowHandler), threads),
+			('httplib2, %d connections' % connections, DavServer(handler=SlowHandler), connections),
+			('http2, 1 connection, %d streams' % threads, H2DavServer(delay=delay), threads)):
+		server.start()
+		try:
+			elapsed = run(server, requests, workers)
+		finally:
+			server.stop()
+		print '%-40s %7.3fs  %8.1f req/s' % (name, elapsed, requests / elapsed)
+
+if __name__ == '__main__':
+	main()
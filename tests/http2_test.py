@@ -0,0 +1,64 @@
+import socket
+import unittest
+import pydav.client
+from pydav.workers import TaskPool
+from h2server import H2DavServer
+
+class TestHttp2Transport(unittest.TestCase):
+    def setUp(self):
+        self.server = H2DavServer(max_streams=8, delay=0.05).start()
+        self.server.store.mkcol('/dir/')
+        for index in range(20):
+            self.server.store.put('/dir/%d.txt' % index, 'file %d' % index)
+        self.client = pydav.client.Client(self.server.settings())
+        self.transport = self.client.connection.httpcon
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def test_basic_requests(self):
+        self.assertTrue('PROPFIND' in self.client.connection.methods)
+        self.assertEquals(len(self.client.ls('/dir/')), 21)
+        resp, content = self.client.connection.send_get('/dir/3.txt')
+        self.assertEquals(resp.status, 200)
+        self.assertEquals(content, 'file 3')
+        self.assertEquals(resp['accept-ranges'], 'bytes')
+
+    def test_multiplexing(self):
+        connection = self.client.connection
+        def head(index):
+            return connection.clone().send_head('/dir/%d.txt' % index).status
+        statuses = TaskPool(16).map(head, range(20))
+        self.assertEquals(statuses, [200] * 20)
+        self.assertEquals(self.transport.connections, 1)
+        self.assertTrue(self.server.httpd.h2_peak > 1)
+
+    def test_stream_limit(self):
+        connection = self.client.connection
+        TaskPool(20).map(lambda index: connection.send_head('/dir/%d.txt' % index), range(20))
+        self.assertTrue(self.transport.peak_streams <= 8)
+        self.assertTrue(self.server.httpd.h2_peak <= 8)
+
+    def test_flow_control(self):
+        data = ''.join(chr(i % 256) for i in range(300000))
+        resp, content = self.client.connection.send_put('/big', data)
+        self.assertEquals(resp.status, 201)
+        self.assertEquals(self.server.store.get('/big').data, data)
+        resp, content = self.client.connection.send_get('/big')
+        self.assertEquals(content, data)
+
+    def test_reconnect(self):
+        self.transport.close()
+        resp, content = self.client.connection.send_get('/dir/1.txt')
+        self.assertEquals(content, 'file 1')
+        self.assertEquals(self.transport.connections, 2)
+
+    def test_timeout(self):
+        self.server.httpd.h2_delay = 0.5
+        self.transport.timeout = 0.1
+        self.assertRaises(socket.timeout, self.client.connection.send_get, '/dir/1.txt')
+        self.transport.timeout = 5
+        resp, content = self.client.connection.send_get('/dir/1.txt')
+        self.assertEquals(content, 'file 1')
+        self.assertEquals(self.transport.connections, 1)
@@ -0,0 +1,83 @@
+import unittest
+import datetime
+import time
+import pydav.client
+import pydav.index
+from davserver import DavServer, DavHandler
+
+class AbsoluteHrefHandler(DavHandler):
+    """ Answers with absolute URIs as hrefs
+    """
+    def _propstat(self, path, res, names):
+        response = DavHandler._propstat(self, path, res, names)
+        href = response.find('{DAV:}href')
+        href.text = 'http://127.0.0.1:%d%s' % (self.server.server_address[1], href.text)
+        return response
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self, handler=DavHandler):
+        self.server = DavServer(handler=handler).start()
+        store = self.server.store
+        for path in ('/data/', '/data/csv/', '/data/csv/old/', '/data/bin/'):
+            store.mkcol(path)
+        store.put('/data/csv/a.csv', 'a' * 10)
+        store.put('/data/csv/b.csv', 'b' * 2000)
+        store.put('/data/csv/old/c.csv', 'c' * 30)
+        store.put('/data/bin/d.bin', 'd' * 5000)
+        self.client = pydav.client.Client(self.server.settings())
+        self.index = pydav.index.MetadataIndex(self.client, root='data')
+        self.index.refresh()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _paths(self, **criteria):
+        return [entry.path for entry in self.index.query(**criteria)]
+
+    def test_query(self):
+        self.assertEquals(self._paths(pattern='*.csv'),
+                          ['/data/csv/a.csv', '/data/csv/b.csv', '/data/csv/old/c.csv'])
+        self.assertEquals(self._paths(min_size=1000, order_by='size DESC'),
+                          ['/data/bin/d.bin', '/data/csv/b.csv'])
+        self.assertEquals(self._paths(pattern='*.csv', max_size=20), ['/data/csv/a.csv'])
+        self.assertEquals(self._paths(collections=True, under='data/csv'), ['/data/csv/old/'])
+        self.assertEquals(self._paths(pattern='/data/csv/*.csv', until=time.time() - 3600), [])
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        self.assertEquals(len(self._paths(since=yesterday, collections=False)), 4)
+
+    def test_aggregate(self):
+        self.assertEquals(self.index.aggregate(), [(None, 4, 7040)])
+        self.assertEquals(self.index.aggregate(by='ext'), [('.bin', 1, 5000), ('.csv', 3, 2040)])
+        self.assertEquals(self.index.aggregate(by='parent', under='data/csv'),
+                          [('/data/csv/', 2, 2010), ('/data/csv/old/', 1, 30)])
+
+    def test_unchanged_tree_costs_one_request(self):
+        self.assertEquals(self.index.refresh(), 1)
+
+    def test_only_changed_collections_are_listed(self):
+        self.server.store.put('/data/csv/old/e.csv', 'e')
+        self.server.store.delete('/data/bin/')
+        before = len(self.server.requests)
+        # root (depth 0), /data/, /data/csv/ and /data/csv/old/
+        self.assertEquals(self.index.refresh(), 4)
+        listed = [r[1] for r in self.server.requests[before:]]
+        self.assertFalse('/data/bin/' in listed)
+        self.assertEquals(self._paths(pattern='*.bin'), [])
+        self.assertEquals(self._paths(pattern='e.csv'), ['/data/csv/old/e.csv'])
+
+    def test_walk_changed(self):
+        tags = dict((itself.path, itself.tag) for itself, members in
+                    pydav.index.walk_changed(self.client, '/data/', lambda path: None))
+        self.assertEquals(sorted(tags), ['/data/', '/data/bin/', '/data/csv/', '/data/csv/old/'])
+        self.assertEquals(list(pydav.index.walk_changed(self.client, '/data/', tags.get)), [])
+        self.server.store.put('/data/bin/e.bin', 'e')
+        walked = list(pydav.index.walk_changed(self.client, '/data/', tags.get))
+        self.assertEquals([itself.path for itself, members in walked], ['/data/', '/data/bin/'])
+        self.assertEquals(sorted(member.path for member in walked[1][1]), ['/data/bin/d.bin', '/data/bin/e.bin'])
+
+    def test_absolute_hrefs(self):
+        self.tearDown()
+        self.setUp(AbsoluteHrefHandler)
+        self.assertEquals(self._paths(pattern='*.csv'),
+                          ['/data/csv/a.csv', '/data/csv/b.csv', '/data/csv/old/c.csv'])
+        self.assertEquals(self.index.refresh(), 1)
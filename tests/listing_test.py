@@ -0,0 +1,41 @@
+import unittest
+import math
+import pydav.client
+import pydav.listing
+from davserver import DavServer
+
+class TestListing(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.server.store.mkcol('/dir/')
+        self.server.store.mkcol('/dir/sub/')
+        self.server.store.put('/dir/small', 'x')
+        self.server.store.put('/dir/big', 'x' * 1000)
+        self.client = pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_columns(self):
+        listing = self.client.lsColumns('dir')
+        self.assertEquals(listing.hrefs, ['/dir/', '/dir/big', '/dir/small', '/dir/sub/'])
+        self.assertEquals(list(listing.sizes), [-1, 1000, 1, -1])
+        self.assertEquals(list(listing.collections), [1, 0, 0, 1])
+        self.assertEquals(listing.etags[1], self.server.store.get('/dir/big').etag)
+        self.assertTrue(abs(listing.mtimes[1] - self.server.store.get('/dir/big').mtime) < 2)
+
+    def test_projection(self):
+        listing = self.client.lsColumns('dir', properties=['getcontentlength'])
+        self.assertEquals(listing.etags, [None] * 4)
+        self.assertTrue(math.isnan(listing.mtimes[1]))
+
+    def test_extra_properties(self):
+        listing = self.client.lsColumns('dir', extra=['displayname', '{urn:x}missing'])
+        self.assertEquals(listing.extra['displayname'], ['dir', 'big', 'small', 'sub'])
+        self.assertEquals(listing.extra['{urn:x}missing'], [None] * 4)
+
+    def test_numpy(self):
+        listing = self.client.lsColumns('dir', numpy=True)
+        self.assertEquals(list(listing.hrefs[listing.sizes > 10]), ['/dir/big'])
+        self.assertEquals(list(listing.hrefs[listing.collections]), ['/dir/', '/dir/sub/'])
+        self.assertEquals(str(listing.sizes.dtype), 'int64')
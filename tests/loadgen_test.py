@@ -0,0 +1,66 @@
+import os
+import json
+import tempfile
+import unittest
+from pydav.loadgen import LoadGenerator, WorkloadProfile, percentile
+from davserver import DavServer
+
+class TestProfile(unittest.TestCase):
+    def test_validation(self):
+        self.assertRaises(ValueError, WorkloadProfile, mix={'TRACE': 1})
+        self.assertRaises(ValueError, WorkloadProfile, mix={'GET': 0})
+        self.assertEquals(WorkloadProfile(root='load').root, 'load/')
+
+    def test_load(self):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, json.dumps({'mix': {'GET': 1}, 'sizes': [[10, 1]], 'concurrency': 2}))
+        os.close(handle)
+        try:
+            profile = WorkloadProfile.load(path)
+        finally:
+            os.remove(path)
+        self.assertEquals((profile.mix, profile.sizes, profile.concurrency), ({'GET': 1}, [(10, 1)], 2))
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEquals([percentile(values, r) for r in (0.5, 0.95, 0.99, 1)], [50, 95, 99, 100])
+        self.assertEquals(percentile([], 0.5), None)
+        self.assertEquals(percentile([7], 0.99), 7)
+
+class TestLoadGenerator(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_run(self):
+        profile = WorkloadProfile(mix={'PROPFIND': 4, 'GET': 3, 'HEAD': 1, 'PUT': 2, 'MKCOL': 1, 'DELETE': 1},
+                                  sizes=[(100, 1), (5000, 1)], depth=2, fanout=2, files=2,
+                                  concurrency=4, requests=300, seed=1)
+        generator = LoadGenerator(self.server.settings(), profile)
+        generator.prepare()
+        self.assertEquals(len(generator.collections), 7)
+        self.assertEquals(len(generator.files), 14)
+        self.assertFalse(self.server.store.get('/pydav-load/c1/c0/f1') is None)
+        report = generator.run()
+        self.assertEquals(report.requests, 300)
+        self.assertEquals(sorted(report.stats), ['DELETE', 'GET', 'HEAD', 'MKCOL', 'PROPFIND', 'PUT'])
+        for stats in report.stats.values():
+            if stats.count > stats.errors:
+                self.assertTrue(0 <= stats.p50 <= stats.p95 <= stats.p99 <= stats.max)
+                self.assertTrue(stats.rate > 0)
+        # only GET and HEAD of files deleted meanwhile may fail
+        self.assertEquals(report.stats['PROPFIND'].errors + report.stats['PUT'].errors +
+                          report.stats['MKCOL'].errors, 0)
+        self.assertTrue(report.stats['GET'].bytes > 0)
+        self.assertTrue('PROPFIND' in report.summary())
+        generator.cleanup()
+        self.assertEquals(self.server.store.get('/pydav-load/'), None)
+
+    def test_duration(self):
+        profile = WorkloadProfile(mix={'PROPFIND': 1}, depth=0, files=0, concurrency=2, duration=0.3)
+        report = LoadGenerator(self.server.settings(), profile).run()
+        self.assertTrue(0.3 <= report.elapsed < 2)
+        self.assertTrue(report.requests > 0)
+        self.assertEquals(report.errors, 0)
@@ -0,0 +1,87 @@
+import time
+import unittest
+import pydav.client
+from davserver import DavServer
+
+class TestLockManager(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.server.store.mkcol('/dir/')
+        self.server.store.put('/dir/a.txt', 'a')
+        self.client = pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def _sent(self, method):
+        return [r for r in self.server.requests if r[0] == method]
+
+    def test_lock_and_write(self):
+        token = self.client.getLock('/dir/a.txt')
+        self.assertTrue(token.bare.startswith('opaquelocktoken:'))
+        self.assertEquals(token.timeout, 600)
+        self.client.connection.send_put('/dir/a.txt', 'b')
+        put = self._sent('PUT')[-1]
+        self.assertTrue('<%s>' % token.bare in put[2]['if'])
+        self.assertEquals(self.server.store.get('/dir/a.txt').data, 'b')
+
+    def test_other_client_is_locked_out(self):
+        self.client.getLock('/dir/a.txt')
+        other = pydav.client.Client(self.server.settings())
+        resp, content = other.connection.send_put('/dir/a.txt', 'c')
+        self.assertEquals(resp.status, 423)
+
+    def test_token_reuse(self):
+        first = self.client.getLock('/dir/a.txt')
+        second = self.client.getLock('dir/a.txt')
+        self.assertTrue(first is second)
+        self.assertEquals(len(self._sent('LOCK')), 1)
+
+    def test_depth_infinity_covers_members(self):
+        token = self.client.getLock('/dir/', maxdepth=-1)
+        self.assertEquals(token.depth, 'infinity')
+        resp, content = self.client.connection.send_put('/dir/new.txt', 'n')
+        self.assertEquals(resp.status, 201)
+
+    def test_move_sends_lock_of_source(self):
+        token = self.client.getLock('/dir/a.txt')
+        self.client.mv('/dir/a.txt', '/b.txt')
+        condition = self._sent('MOVE')[-1][2]['if']
+        self.assertTrue(condition.endswith('/dir/a.txt> (<%s>)' % token.bare))
+        self.assertEquals(self.server.store.get('/b.txt').data, 'a')
+
+    def test_release(self):
+        self.client.getLock('/dir/a.txt')
+        resp = self.client.releaseLock('/dir/a.txt')
+        self.assertEquals(resp.status, 204)
+        self.assertEquals(self.server.store.locks, {})
+        self.assertEquals(self.client.releaseLock('/dir/a.txt'), False)
+        self.client.connection.send_put('/dir/a.txt', 'd')
+        self.assertFalse('if' in self._sent('PUT')[-1][2])
+
+    def test_background_refresh(self):
+        self.client.getLock('/dir/a.txt', timeout=1)
+        time.sleep(1.5)
+        refreshes = [r for r in self._sent('LOCK') if 'if' in r[2]]
+        self.assertTrue(len(refreshes) >= 1)
+        resp, content = self.client.connection.send_put('/dir/a.txt', 'e')
+        self.assertEquals(resp.status, 204)
+        other = pydav.client.Client(self.server.settings())
+        self.assertEquals(other.connection.send_put('/dir/a.txt', 'f')[0].status, 423)
+
+    def test_lost_lock(self):
+        lost = []
+        manager = self.client.locks
+        manager.on_lost = lost.append
+        self.client.getLock('/dir/a.txt', timeout=1)
+        self.server.store.locks.clear()
+        time.sleep(1.2)
+        self.assertEquals(lost, ['/dir/a.txt'])
+        self.assertEquals(manager.locks, {})
+
+    def test_close_releases_all(self):
+        self.client.getLock('/dir/a.txt')
+        self.client.getLock('/dir/', maxdepth=0)
+        self.client.close()
+        self.assertEquals(self.server.store.locks, {})
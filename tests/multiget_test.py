@@ -0,0 +1,66 @@
+import unittest
+import pydav.client
+from pydav.answer import Answer
+from pydav.multiget import MultiGet
+from davserver import DavServer
+
+class TestMultiGet(unittest.TestCase):
+    def _client(self, **options):
+        self.server = DavServer(**options).start()
+        self.server.store.mkcol('/contacts/')
+        for index in range(25):
+            self.server.store.put('/contacts/c%d.vcf' % index, 'BEGIN:VCARD\nFN:C\xc3\xa9 %d\nEND:VCARD' % index)
+        self.hrefs = ['/contacts/c%d.vcf' % index for index in range(25)]
+        return pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _requests(self, method):
+        return [r for r in self.server.requests if r[0] == method]
+
+    def test_batches(self):
+        client = self._client()
+        results = client.getMany('/contacts/', self.hrefs + ['/contacts/missing.vcf'], batch=10)
+        self.assertEquals([r.status for r in results], [200] * 25 + [404])
+        self.assertEquals(results[3].data, 'BEGIN:VCARD\nFN:C\xc3\xa9 3\nEND:VCARD')
+        self.assertEquals(results[3].etag, self.server.store.get('/contacts/c3.vcf').etag)
+        self.assertEquals(len(self._requests('REPORT')), 3)
+        self.assertFalse(any('depth' in r[2] for r in self._requests('REPORT')))
+        self.assertEquals(self._requests('GET'), [])
+
+    def test_calendar(self):
+        client = self._client()
+        operation = MultiGet(client.connection, 'calendar', batch=100)
+        results = operation.fetch('/contacts/', self.hrefs[:2])
+        self.assertEquals(results[1].data, 'BEGIN:VCARD\nFN:C\xc3\xa9 1\nEND:VCARD')
+        self.assertEquals((operation.reports, operation.gets), (1, 0))
+
+    def test_fallback_to_get(self):
+        client = self._client(multiget=False)
+        operation = MultiGet(client.connection, 'addressbook', batch=10)
+        results = operation.fetch('/contacts/', self.hrefs)
+        self.assertEquals(results[24].data, 'BEGIN:VCARD\nFN:C\xc3\xa9 24\nEND:VCARD')
+        # the first answer tells the report is not supported
+        self.assertTrue(1 <= operation.reports <= 3)
+        self.assertEquals(operation.gets, 25)
+
+    def test_no_capability(self):
+        client = self._client(multiget=False)
+        operation = MultiGet(client.connection)
+        self.assertEquals(operation.kind, None)
+        operation.fetch('/contacts/', self.hrefs[:3])
+        self.assertEquals((operation.reports, operation.gets), (0, 3))
+
+class TestIterResponses(unittest.TestCase):
+    def test_iterresponses(self):
+        xml = ('<D:multistatus xmlns:D="DAV:">' +
+               ''.join('<D:response><D:href>/%d</D:href></D:response>' % index for index in range(3)) +
+               '</D:multistatus>')
+        hrefs = []
+        for response in Answer.iterresponses(xml):
+            hrefs.append(response.findtext('{DAV:}href'))
+            # the former responses are freed
+            preceding = list(response.itersiblings(preceding=True))
+            self.assertTrue(len(preceding) <= 1 and all(len(e) == 0 for e in preceding))
+        self.assertEquals(hrefs, ['/0', '/1', '/2'])
@@ -0,0 +1,260 @@
+""" Network condition emulation for the test suite and the benchmarks.
+
+	A TCP proxy in front of a local server (a DavServer typically) which
+	delays, throttles and breaks the connections going through it, to run
+	pydav against WAN-like links instead of the loopback interface.
+
+	Usage:
+		server = DavServer().start()
+		proxy = NetemProxy(server, **WAN).start()
+		... Client(proxy.settings()) ...
+		proxy.stop()
+		server.stop()
+"""
+import time
+import Queue
+import random
+import socket
+import struct
+import threading
+
+# 80ms round trip time, 10Mbit/s, a little jitter and packet loss
+WAN = {'latency': 0.04, 'jitter': 0.005, 'bandwidth': 1250000, 'loss': 0.005}
+
+class _Link(object):
+	""" Bandwidth of one direction of the emulated network, shared by all
+		the connections as on a real link
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.free = 0.0
+
+	def reserve(self, size, bandwidth, after):
+		""" Time at which size bytes ready at after are through the link
+		"""
+		with self.lock:
+			self.free = max(self.free, after) + float(size) / bandwidth
+			return self.free
+
+class _Pipe(object):
+	""" One direction of a proxied connection. A reader thread timestamps
+		the data as it comes, a writer thread forwards it when it is due:
+		latency delays the data without limiting the throughput, as on a
+		real link.
+	"""
+	def __init__(self, proxy, connection, source, destination, link):
+		self.proxy = proxy
+		self.connection = connection
+		self.source = source
+		self.destination = destination
+		self.link = link
+		self.queue = Queue.Queue()
+		self.last = 0.0
+
+	def start(self):
+		for target in (self._read, self._write):
+			thread = threading.Thread(target=target)
+			thread.daemon = True
+			thread.start()
+
+	def _read(self):
+		while True:
+			try:
+				data = self.source.recv(65536)
+			except socket.error:
+				data = ''
+			if not data:
+				self.queue.put(None)
+				return
+			self.last = max(time.time() + self.proxy.delay(), self.last)#no reordering
+			self.queue.put((self.last, data))
+
+	def _write(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				break
+			due, data = item
+			if self.proxy.rng.random() < self.proxy.reset:
+				self.connection.reset()
+				break
+			if self.proxy.bandwidth:
+				due = self.link.reserve(len(data), self.proxy.bandwidth, due)
+			delay = due - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			try:
+				self.destination.sendall(data)
+			except socket.error:
+				break
+			with self.proxy.lock:
+				self.proxy.bytes += len(data)
+		self.connection.done(self.destination)
+
+class _Connection(object):
+	""" A client connection and the one opened to the server for it
+	"""
+	def __init__(self, proxy, client):
+		self.proxy = proxy
+		self.client = client
+		self.server = socket.create_connection(proxy.target)
+		self.lock = threading.Lock()
+		self.open = 2
+		self.pipes = [_Pipe(proxy, self, client, self.server, proxy.upstream),
+					  _Pipe(proxy, self, self.server, client, proxy.downstream)]
+
+	def start(self):
+		for pipe in self.pipes:
+			pipe.start()
+
+	def done(self, destination):
+		""" One direction is over: pass the end of stream on, and close the
+			sockets when both are
+		"""
+		try:
+			destination.shutdown(socket.SHUT_WR)
+		except socket.error:
+			pass
+		with self.lock:
+			self.open -= 1
+			last = self.open == 0
+		if last:
+			self.close()
+
+	def reset(self):
+		""" Abort both sides with a RST
+		"""
+		with self.proxy.lock:
+			self.proxy.resets += 1
+		for sock in (self.client, self.server):
+			try:
+				sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+			except socket.error:
+				pass
+		self.close(socket.SHUT_RD)#no FIN: the RST is sent on close
+
+	def close(self, how=socket.SHUT_RDWR):
+		for sock in (self.client, self.server):
+			# shutdown wakes the reader threads up: the descriptor is only
+			# released once they let go of it
+			for operation in (lambda: sock.shutdown(how), sock.close):
+				try:
+					operation()
+				except socket.error:
+					pass
+		self.proxy.forget(self)
+
+class NetemProxy(object):
+	""" TCP proxy emulating the network conditions between the clients and
+		a server. The conditions are attributes, which may be changed while
+		it runs.
+
+		latency: one way delay in seconds of each direction (the round trip
+		time is twice as much). jitter: extra random delay, up to that many
+		seconds; data is never reordered. bandwidth: bytes per second of each
+		direction, shared by all the connections, unlimited when None.
+		loss: probability that a chunk of data is lost, emulated by delaying
+		it for a retransmission timeout (rto seconds) as TCP would. reset:
+		probability that a connection is reset instead of forwarding a chunk.
+	"""
+	def __init__(self, server, latency=0.0, jitter=0.0, bandwidth=None, loss=0.0, rto=0.2, reset=0.0, seed=None):
+		""" Set up the object
+
+			:param server: Server to forward to: anything with a port attribute and a settings() method, as DavServer
+		"""
+		self.server = server
+		self.target = ('127.0.0.1', server.port)
+		self.latency = latency
+		self.jitter = jitter
+		self.bandwidth = bandwidth
+		self.loss = loss
+		self.rto = rto
+		self.reset = reset
+		self.rng = random.Random(seed)
+		self.upstream = _Link()
+		self.downstream = _Link()
+		self.lock = threading.Lock()
+		self.connections = set()
+		# statistics
+		self.accepted = 0
+		self.resets = 0
+		self.bytes = 0
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind(('127.0.0.1', 0))
+		self.listener.listen(64)
+		self.listener.settimeout(0.05)
+		self.thread = None
+		self.running = False
+
+	@property
+	def port(self):
+		return self.listener.getsockname()[1]
+
+	def settings(self, **extra):
+		""" Settings of the server, going through the proxy
+		"""
+		settings = self.server.settings(**extra)
+		settings['host'] = 'http://127.0.0.1:%d' % self.port
+		settings['port'] = self.port
+		settings.update(extra)
+		return settings
+
+	def delay(self):
+		""" One way delay of a chunk of data
+		"""
+		delay = self.latency
+		if self.jitter:
+			delay += self.rng.uniform(0, self.jitter)
+		if self.loss and self.rng.random() < self.loss:
+			delay += self.rto
+		return delay
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self._accept)
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def _accept(self):
+		while self.running:
+			try:
+				client, address = self.listener.accept()
+			except socket.timeout:
+				continue
+			except socket.error:
+				break
+			client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			try:
+				connection = _Connection(self, client)
+			except socket.error:
+				client.close()
+				continue
+			connection.server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			with self.lock:
+				self.accepted += 1
+				self.connections.add(connection)
+			connection.start()
+
+	def forget(self, connection):
+		with self.lock:
+			self.connections.discard(connection)
+
+	def drop(self):
+		""" Reset every open connection
+		"""
+		with self.lock:
+			connections = list(self.connections)
+		for connection in connections:
+			connection.reset()
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+		self.listener.close()
+		with self.lock:
+			connections = list(self.connections)
+		for connection in connections:
+			connection.close()
@@ -0,0 +1,97 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import pydav.client
+import pydav.connection
+from pydav.listing import walk
+from pydav.workers import ConnectionPool, TaskPool
+from davserver import DavServer
+from netem import NetemProxy
+
+class TestNetemProxy(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.proxy = NetemProxy(self.server, seed=1).start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _timed(self, function, *args):
+        start = time.time()
+        function(*args)
+        return time.time() - start
+
+    def test_transparent(self):
+        self.server.store.put('/file', 'data')
+        client = pydav.client.Client(self.proxy.settings())
+        local = os.path.join(self.directory, 'file')
+        client.getFile('file', local)
+        self.assertEquals(open(local).read(), 'data')
+        self.assertEquals(self.proxy.accepted, 1)
+        self.assertTrue(self.proxy.bytes > 0)
+
+    def test_latency(self):
+        self.server.store.put('/file', 'data')
+        connection = pydav.connection.Connection(self.proxy.settings())
+        self.proxy.latency = 0.05
+        elapsed = self._timed(connection.send_head, '/file')
+        self.assertTrue(0.1 <= elapsed < 0.3)#one round trip
+        self.proxy.jitter = 0.05
+        elapsed = self._timed(connection.send_head, '/file')
+        self.assertTrue(0.1 <= elapsed < 0.4)
+
+    def test_bandwidth(self):
+        self.server.store.put('/big', 'x' * 200000)
+        connection = pydav.connection.Connection(self.proxy.settings())
+        self.proxy.bandwidth = 1000000
+        elapsed = self._timed(connection.send_get, '/big')
+        self.assertTrue(0.18 <= elapsed < 0.5)
+
+    def test_loss(self):
+        self.server.store.put('/file', 'data')
+        connection = pydav.connection.Connection(self.proxy.settings())
+        self.proxy.loss, self.proxy.rto = 1.0, 0.1
+        self.assertTrue(self._timed(connection.send_head, '/file') >= 0.2)
+
+    def test_reset(self):
+        self.server.store.put('/file', 'data')
+        connection = pydav.connection.Connection(self.proxy.settings())
+        self.proxy.reset = 1.0
+        self.assertRaises(Exception, connection.send_get, '/file')
+        self.assertEquals(self.proxy.resets, 1)
+        self.proxy.reset = 0.0
+        connection = pydav.connection.Connection(self.proxy.settings())
+        self.assertEquals(connection.send_get('/file')[1], 'data')
+
+    def test_parallel_paths(self):
+        """ Under 80ms of round trip time the concurrent paths must beat
+            the serial ones
+        """
+        self.proxy.latency = 0.04
+        client = pydav.client.Client(self.proxy.settings())
+        files = []
+        for index in range(8):
+            self.server.store.mkcol('/dir%d/' % index)
+            local = os.path.join(self.directory, 'f%d' % index)
+            local_fd = open(local, 'wb')
+            local_fd.write('x' * 1000)
+            local_fd.close()
+            files.append(('dir%d/f' % index, local))
+        serial = self._timed(lambda: [client.sendFile(path, local) for path, local in files])
+        parallel = self._timed(client.sendFiles, files, {}, 8)
+        self.assertTrue(parallel < serial / 2)
+
+        serial = self._timed(lambda: [client.ls('dir%d' % index) for index in range(8)])
+        pool = ConnectionPool(client.connection)
+        parallel = self._timed(TaskPool(8).map, lambda index: pool.get().send_propfind('dir%d/' % index, [], 1),
+                               range(8))
+        self.assertTrue(parallel < serial / 2)
+        self.assertEquals(len(walk(pool.get(), '/dir0', 8)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
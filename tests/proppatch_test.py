@@ -0,0 +1,66 @@
+import unittest
+import pydav.client
+from collections import OrderedDict
+from pydav.answer import Answer, build_propertyupdate
+from pydav.proppatch import BulkPropPatch
+from lxml import etree
+from davserver import DavServer
+
+OC = 'http://owncloud.org/ns'
+
+class TestBuild(unittest.TestCase):
+    def test_namespaces(self):
+        xml = build_propertyupdate(OrderedDict([('displayname', u'caf\xe9 & co'),
+                                                ('{%s}favorite' % OC, '1'),
+                                                ('{urn:x}tag', None)]), {'oc': OC})
+        root = etree.XML(xml)
+        self.assertEquals(root.findtext('{DAV:}set/{DAV:}prop/{DAV:}displayname'), u'caf\xe9 & co')
+        self.assertEquals(root.findtext('{DAV:}set/{DAV:}prop/{%s}favorite' % OC), '1')
+        self.assertTrue(root.find('{DAV:}remove/{DAV:}prop/{urn:x}tag') is not None)
+        self.assertTrue('xmlns:oc=' in xml)
+
+    def test_resource_properties(self):
+        xml = ('<D:response xmlns:D="DAV:"><D:href>/a</D:href><D:propstat><D:prop>'
+               '<D:displayname>a</D:displayname><D:getcontenttype>text/plain</D:getcontenttype>'
+               '</D:prop></D:propstat></D:response>')
+        props = Answer('<D:multistatus xmlns:D="DAV:">%s</D:multistatus>' % xml).props[0]
+        props['displayname'] = 'b'
+        props['displayname'] = 'c'
+        del props['getcontenttype']
+        self.assertEquals(list(props.edits), ['displayname'])
+        root = etree.XML(props.buildProppatch())
+        self.assertEquals(root.findtext('{DAV:}set/{DAV:}prop/{DAV:}displayname'), 'c')
+        self.assertTrue(root.find('{DAV:}remove/{DAV:}prop/{DAV:}getcontenttype') is not None)
+        self.assertEquals((len(props.edits), len(props.dels)), (0, 0))
+
+class TestBulkPropPatch(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        for index in range(20):
+            self.server.store.put('/f%d' % index, 'x')
+        self.client = pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_tag_many(self):
+        updates = [('/f%d' % index, {'{%s}tag' % OC: 'red', 'displayname': 'F%d' % index})
+                   for index in range(20)]
+        results = self.client.setPropertiesMany(updates, namespaces={'oc': OC})
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEquals(results[3].properties, {'{%s}tag' % OC: 200, 'displayname': 200})
+        self.assertEquals(self.server.store.get('/f3').props,
+                          {'{%s}tag' % OC: 'red', '{DAV:}displayname': 'F3'})
+        self.assertEquals(len([r for r in self.server.requests if r[0] == 'PROPPATCH']), 20)
+
+        results = self.client.setPropertiesMany([('/f1', {'{%s}tag' % OC: None})])
+        self.assertTrue(results[0].ok)
+        self.assertEquals(self.server.store.get('/f1').props, {'{DAV:}displayname': 'F1'})
+
+    def test_failures(self):
+        results = self.client.setPropertiesMany([('/f0', {'getetag': 'x', 'displayname': 'y'}),
+                                                 ('/missing', {'displayname': 'y'})])
+        self.assertEquals(results[0].properties, {'getetag': 403, 'displayname': 424})
+        self.assertFalse(results[0].ok)
+        self.assertEquals((results[1].status, results[1].properties), (404, {}))
+        self.assertEquals(BulkPropPatch.summary(results), {'getetag': {403: 1}, 'displayname': {424: 1}})
@@ -0,0 +1,170 @@
+import unittest
+import os
+import time
+import pydav.client
+from davserver import DavServer
+
+class TestRemoteFile(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.data = ''.join(chr(i % 251) for i in range(10000))
+        self.server.store.put('/big.bin', self.data)
+        self.client = pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _ranges(self):
+        return [r[2].get('range') for r in self.server.requests if r[0] == 'GET']
+
+    def test_seek_read_tell(self):
+        remote = self.client.open('big.bin', blocksize=100)
+        remote.seek(-10, os.SEEK_END)
+        self.assertEquals(remote.read(), self.data[-10:])
+        self.assertEquals(remote.tell(), 10000)
+        self.assertEquals(remote.read(5), '')
+        remote.seek(1234)
+        self.assertEquals(remote.read(300), self.data[1234:1534])
+        remote.seek(-34, os.SEEK_CUR)
+        self.assertEquals(remote.read(10), self.data[1500:1510])
+
+    def test_readinto(self):
+        remote = self.client.open('big.bin', blocksize=100)
+        buf = bytearray(50)
+        remote.seek(9980)
+        self.assertEquals(remote.readinto(buf), 20)
+        self.assertEquals(str(buf[:20]), self.data[9980:])
+
+    def test_cached_blocks_are_not_fetched_again(self):
+        remote = self.client.open('big.bin', blocksize=100, size=10000, readahead=0)
+        remote.seek(500)
+        remote.read(10)
+        remote.seek(505)
+        remote.read(10)
+        self.assertEquals(self._ranges(), ['bytes=500-599'])
+
+    def test_misses_are_coalesced(self):
+        remote = self.client.open('big.bin', blocksize=100, size=10000, readahead=0)
+        remote.seek(200)
+        remote.read(10)
+        remote.seek(0)
+        self.assertEquals(remote.read(400), self.data[:400])
+        self.assertEquals(self._ranges(), ['bytes=200-299', 'bytes=0-199', 'bytes=300-399'])
+
+    def test_lru_eviction(self):
+        remote = self.client.open('big.bin', blocksize=100, cacheblocks=2,
+                                  size=10000, readahead=0)
+        for offset in (0, 1000, 2000, 0):
+            remote.seek(offset)
+            remote.read(1)
+        self.assertEquals(len(self._ranges()), 4)
+        self.assertEquals(sorted(remote.blocks), [0, 20])
+
+    def test_sequential_read_ahead(self):
+        remote = self.client.open('big.bin', blocksize=100, size=10000, readahead=8)
+        data = ''.join(iter(lambda: remote.read(100), ''))
+        self.assertEquals(data, self.data)
+        self.assertTrue(len(self._ranges()) < 20)
+
+class TestWritableRemoteFile(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.server.store.put('/log.txt', '0123456789')
+        self.client = pydav.client.Client(self.server.settings())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _writes(self):
+        return [r for r in self.server.requests if r[0] in ('PUT', 'PATCH')]
+
+    def test_regions_are_coalesced_and_patched_on_close(self):
+        remote = self.client.open('log.txt', 'r+')
+        remote.seek(2)
+        remote.write('ab')
+        remote.write('cd')
+        remote.seek(3)
+        remote.write('X')
+        remote.seek(8)
+        remote.write('yz!')
+        self.assertEquals(self._writes(), [])
+        remote.close()
+        self.assertEquals(self.server.store.get('/log.txt').data, '01aXcd67yz!')
+        ranges = [r[2]['x-update-range'] for r in self._writes()]
+        self.assertEquals(ranges, ['bytes=2-5', 'bytes=8-10'])
+
+    def test_append(self):
+        with self.client.open('log.txt', 'a') as remote:
+            remote.write('abc')
+            remote.seek(0)
+            remote.write('def')
+        self.assertEquals(self.server.store.get('/log.txt').data, '0123456789abcdef')
+        self.assertEquals(len(self._writes()), 1)
+
+    def test_many_appends(self):
+        remote = self.client.open('log.txt', 'r+', max_dirty=10 ** 9)
+        remote.seek(10)
+        start = time.time()
+        for index in range(20000):
+            remote.write('x' * 100)
+        self.assertTrue(time.time() - start < 2)
+        self.assertEquals(len(remote.dirty), 1)
+        self.assertEquals(remote.dirty_bytes, 2000000)
+        remote.seek(5)
+        remote.write('ab')
+        remote.seek(20)
+        remote.write('cd')
+        self.assertEquals(remote.dirty_bytes, 2000002)
+        remote.close()
+        self.assertEquals(self.server.store.get('/log.txt').data,
+                          '01234ab789' + 'x' * 10 + 'cd' + 'x' * 1999988)
+
+    def test_size_threshold(self):
+        remote = self.client.open('log.txt', 'w', max_dirty=4)
+        remote.write('abc')
+        self.assertEquals(len(self._writes()), 1)
+        remote.write('def')
+        self.assertEquals(len(self._writes()), 2)
+        self.assertEquals(self.server.store.get('/log.txt').data, 'abcdef')
+        remote.close()
+        self.assertEquals(len(self._writes()), 2)
+
+    def test_time_threshold(self):
+        remote = self.client.open('log.txt', 'r+', flush_interval=0.1)
+        remote.write('a')
+        self.assertEquals(self._writes(), [])
+        time.sleep(0.5)#no other call: the timer flushes
+        self.assertEquals(self.server.store.get('/log.txt').data, 'a123456789')
+        self.assertEquals(remote.dirty, [])
+        remote.close()
+        self.assertEquals(len(self._writes()), 1)
+
+    def test_failed_flush_resends_only_unsent_regions(self):
+        remote = self.client.open('log.txt', 'r+')
+        remote.write('ab')
+        remote.seek(8)
+        remote.write('yz')
+        send_patch = remote.connection.send_patch
+        calls = []
+        def failing(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise IOError('connection lost')
+            return send_patch(*args)
+        remote.connection.send_patch = failing
+        self.assertRaises(IOError, remote.flush)
+        remote.close()
+        ranges = [r[2]['x-update-range'] for r in self._writes()]
+        self.assertEquals(ranges, ['bytes=0-1', 'bytes=8-9'])
+        self.assertEquals(self.server.store.get('/log.txt').data, 'ab234567yz')
+
+    def test_content_range_put_without_patch(self):
+        self.server.stop()
+        self.server = DavServer(partial_update=False).start()
+        self.server.store.put('/log.txt', '0123456789')
+        client = pydav.client.Client(self.server.settings())
+        with client.open('log.txt', 'r+') as remote:
+            remote.seek(9)
+            remote.write('XY')
+        self.assertEquals(self.server.store.get('/log.txt').data, '012345678XY')
+        self.assertEquals(self._writes()[0][2]['content-range'], 'bytes 9-10/11')
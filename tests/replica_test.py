@@ -0,0 +1,148 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import httplib2
+from pydav.replica import ReplicatedClient, QuorumError
+from davserver import DavServer, DavHandler
+
+class FlakyHandler(DavHandler):
+    """ Answers late by server.delay seconds, or with a 503 when
+        server.broken is set
+    """
+    def _unavailable(self):
+        time.sleep(getattr(self.server, 'delay', 0))
+        if not getattr(self.server, 'broken', False):
+            return False
+        self._body()
+        self._reply(503)
+        return True
+
+    def do_GET(self):
+        if not self._unavailable():
+            DavHandler.do_GET(self)
+
+    def do_PROPFIND(self):
+        if not self._unavailable():
+            DavHandler.do_PROPFIND(self)
+
+    def do_PUT(self):
+        if not self._unavailable():
+            DavHandler.do_PUT(self)
+
+    def do_MKCOL(self):
+        if not self._unavailable():
+            DavHandler.do_MKCOL(self)
+
+class TestReplicatedClient(unittest.TestCase):
+    def setUp(self):
+        self.servers = dict((name, DavServer(handler=FlakyHandler).start()) for name in ('a', 'b', 'c'))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for server in self.servers.values():
+            server.stop()
+        shutil.rmtree(self.directory)
+
+    def _replicated(self, **options):
+        return ReplicatedClient(dict((name, server.settings()) for name, server in self.servers.items()),
+                                **options)
+
+    def _local(self, name, data):
+        path = os.path.join(self.directory, name)
+        local_fd = open(path, 'wb')
+        local_fd.write(data)
+        local_fd.close()
+        return path
+
+    def _fill(self, path='file', data='replicated data'):
+        for server in self.servers.values():
+            server.store.put('/' + path, data)
+
+    def test_writes_fan_out(self):
+        replicated = self._replicated()
+        replicated.mkdir('dir')
+        replicated.sendFile('dir/file', self._local('up', 'content'))
+        time.sleep(0.2)#stragglers past the quorum
+        for server in self.servers.values():
+            self.assertEquals(server.store.get('/dir/file').data, 'content')
+        replicated.rm('dir/file')
+        time.sleep(0.2)
+        for server in self.servers.values():
+            self.assertEquals(server.store.get('/dir/file'), None)
+
+    def test_quorum(self):
+        self.servers['c'].httpd.broken = True
+        self._replicated().sendFile('file', self._local('up', 'content'))
+        self.assertEquals(self.servers['a'].store.get('/file').data, 'content')
+        self.servers['b'].httpd.broken = True
+        try:
+            self._replicated().sendFile('other', self._local('up', 'content'))
+        except QuorumError, error:
+            self.assertTrue(error.successes in ([], ['a']))#raised as soon as b and c failed
+            self.assertEquals(sorted(error.failures), ['b', 'c'])
+        else:
+            self.fail('no QuorumError')
+        self.assertRaises(QuorumError, self._replicated(quorum=3).mkdir, 'dir')
+
+    def test_set_properties(self):
+        self._fill()
+        replicated = self._replicated(quorum=3)
+        found = [prop for prop in replicated.getProperties('', 1).props if prop.href == '/file']
+        properties = found[0]
+        properties['displayname'] = 'renamed'
+        replicated.setProperties(properties)
+        for server in self.servers.values():
+            self.assertEquals(server.store.get('/file').props.get('{DAV:}displayname'), 'renamed')
+
+    def test_fastest_replica(self):
+        self._fill()
+        self.servers['a'].httpd.delay = 0.1
+        replicated = self._replicated(hedge_percentile=None)
+        for index in range(8):
+            replicated.getProperties('')
+        replicas = replicated.replicas
+        self.assertEquals(replicas['a'].wins, 1)#tried once, being unmeasured
+        self.assertTrue(replicas['a'].latency > replicas['b'].latency)
+        self.assertEquals(replicated.ranked()[-1].name, 'a')
+
+    def test_failover(self):
+        self._fill()
+        self.servers['a'].httpd.broken = True
+        replicated = self._replicated(hedge_percentile=None)
+        local = os.path.join(self.directory, 'down')
+        replicated.getFile('file', local)
+        self.assertEquals(open(local).read(), 'replicated data')
+        self.assertEquals(replicated.failovers, 1)
+        self.assertFalse(replicated.replicas['a'].healthy())
+        self.assertTrue(replicated.replicas['a'].errors > 0)
+        self.assertEquals(sorted(os.listdir(self.directory)), ['down'])
+        replicated.getFile('file', local)
+        self.assertEquals(replicated.failovers, 1)#not tried while backing off
+        self.servers['b'].httpd.broken = self.servers['c'].httpd.broken = True
+        self.assertRaises(Exception, replicated.ls, '')#no multistatus to parse
+
+    def test_hedge(self):
+        self._fill()
+        self.servers['a'].httpd.delay = 0.5
+        replicated = self._replicated(hedge_delay=0.05)
+        local = os.path.join(self.directory, 'hedged')
+        start = time.time()
+        replicated.getFile('file', local)
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEquals(replicated.hedges, 1)
+        self.assertEquals(replicated.replicas['b'].wins, 1)
+        self.assertEquals(open(local).read(), 'replicated data')
+        time.sleep(0.6)#the slow attempt finishes, its file is removed
+        self.assertEquals(sorted(os.listdir(self.directory)), ['hedged'])
+        self.assertTrue(replicated.replicas['a'].latency >= 0.5)
+
+    def test_not_found(self):
+        replicated = self._replicated()
+        self.assertRaises(httplib2.HttpLib2Error, replicated.getFile, 'missing', os.path.join(self.directory, 'x'))
+        self.assertEquals(replicated.failovers, 0)
+        self.assertTrue(all(replica.healthy() for replica in replicated.replicas.values()))
+
+if __name__ == '__main__':
+    unittest.main()
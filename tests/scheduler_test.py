@@ -0,0 +1,232 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import pydav.client
+from pydav.scheduler import TransferScheduler, DONE, PAUSED, CANCELLED, FAILED
+from davserver import DavServer, DavHandler
+
+class SlowPutHandler(DavHandler):
+    def do_PUT(self):
+        server = self.server
+        with server.slow_lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(0.05)
+        try:
+            DavHandler.do_PUT(self)
+        finally:
+            with server.slow_lock:
+                server.active -= 1
+
+def slow_server():
+    server = DavServer(handler=SlowPutHandler)
+    server.httpd.slow_lock = threading.Lock()
+    server.httpd.active = server.httpd.max_active = 0
+    return server.start()
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.client = pydav.client.Client(self.server.settings())
+        self.directory = tempfile.mkdtemp()
+        self.events = []
+        self.ended = []
+        self.scheduler = TransferScheduler(workers=1, chunksize=100, callback=self._record, interval=0)
+
+    def tearDown(self):
+        self.scheduler.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _record(self, event):
+        self.events.append(event)
+        if event.job.state == DONE:
+            self.ended.append(event.job)
+
+    def _local(self, name, size):
+        local = os.path.join(self.directory, name)
+        local_fd = open(local, 'wb')
+        local_fd.write(''.join(chr(i % 251) for i in range(size)))
+        local_fd.close()
+        return local
+
+    def _read(self, local):
+        local_fd = open(local, 'rb')
+        data = local_fd.read()
+        local_fd.close()
+        return data
+
+    def test_shortest_first(self):
+        with self.scheduler._cond:#nothing starts before all are queued
+            jobs = [self.scheduler.upload(self.client, 'f%d' % size, self._local('f%d' % size, size))
+                    for size in (3000, 10, 500, 0)]
+        self.assertTrue(self.scheduler.wait(10))
+        self.assertEquals([job.path for job in self.ended], ['f0', 'f10', 'f500', 'f3000'])
+        for job in jobs:
+            self.assertEquals(job.state, DONE)
+            self.assertEquals(self.server.store.get('/' + job.path).data, self._read(job.local_path))
+
+    def test_unknown_size_last(self):
+        self.server.store.put('/big', 'x' * 1000)
+        self.server.store.put('/small', 'y' * 10)
+        with self.scheduler._cond:
+            unknown = self.scheduler.download(self.client, 'small', os.path.join(self.directory, 'a'))
+            known = self.scheduler.download(self.client, 'big', os.path.join(self.directory, 'b'), 1000)
+        self.assertTrue(self.scheduler.wait(10))
+        self.assertEquals(self.ended, [known, unknown])
+        self.assertEquals(unknown.size, 10)
+        self.assertEquals(self._read(os.path.join(self.directory, 'a')), 'y' * 10)
+
+    def test_progress(self):
+        local = self._local('f', 1000)
+        self.scheduler.upload(self.client, 'f', local)
+        self.server.store.put('/g', 'g' * 500)
+        self.scheduler.download(self.client, 'g', os.path.join(self.directory, 'g'), 500)
+        self.assertTrue(self.scheduler.wait(10))
+        last = self.events[-1]
+        self.assertEquals((last.transferred, last.total, last.finished, last.jobs), (1500, 1500, 2, 2))
+        transferred = [e.transferred for e in self.events]
+        self.assertEquals(transferred, sorted(transferred))
+        self.assertTrue(len(self.events) > 10)
+        self.assertTrue(last.rate >= 0)
+
+    def test_cancel_queued(self):
+        with self.scheduler._cond:
+            first = self.scheduler.upload(self.client, 'a', self._local('a', 10))
+            second = self.scheduler.upload(self.client, 'b', self._local('b', 20))
+            second.cancel()
+        self.assertTrue(second.wait(1))
+        self.assertTrue(self.scheduler.wait(10))
+        self.assertEquals((first.state, second.state), (DONE, CANCELLED))
+        self.assertEquals(self.server.store.get('/b'), None)
+        self.assertEquals(self.scheduler.total, 10)
+
+    def test_cancel_running(self):
+        local = self._local('f', 5000)
+        def cancel(event):
+            if event.job.transferred >= 1000:
+                event.job.cancel()
+        self.scheduler.callback = cancel
+        job = self.scheduler.upload(self.client, 'f', local)
+        self.assertTrue(job.wait(10))
+        self.assertEquals(job.state, CANCELLED)
+        self.assertTrue(job.transferred < 5000)
+        self.assertEquals(self.scheduler.transferred, 0)
+
+    def _pause_once(self, event):
+        if event.job.transferred >= 300 and not getattr(event.job, 'paused_once', False):
+            event.job.paused_once = True
+            event.job.pause()
+
+    def test_pause_resume_download(self):
+        data = ''.join(chr(i % 251) for i in range(2000))
+        self.server.store.put('/f', data)
+        self.scheduler.callback = self._pause_once
+        local = os.path.join(self.directory, 'f')
+        job = self.scheduler.download(self.client, 'f', local, 2000)
+        self.scheduler.wait(10)
+        self.assertEquals(job.state, PAUSED)
+        paused_at = job.transferred
+        self.assertTrue(0 < paused_at < 2000)
+        job.resume()
+        self.assertTrue(job.wait(10))
+        self.assertEquals(job.state, DONE)
+        self.assertEquals(self._read(local), data)
+        ranges = [r[2].get('range') for r in self.server.requests if r[0] == 'GET']
+        self.assertEquals(ranges, [None, 'bytes=%d-' % paused_at])
+
+    def test_pause_resume_upload(self):
+        local = self._local('f', 2000)
+        self.scheduler.callback = self._pause_once
+        job = self.scheduler.upload(self.client, 'f', local)
+        self.scheduler.wait(10)
+        self.assertEquals(job.state, PAUSED)
+        requests = len([r for r in self.server.requests if r[0] in ('PUT', 'PATCH')])
+        job.resume()
+        self.assertTrue(job.wait(10))
+        self.assertEquals(job.state, DONE)
+        self.assertEquals(self.server.store.get('/f').data, self._read(local))
+        # nothing sent twice
+        self.assertEquals(len([r for r in self.server.requests if r[0] in ('PUT', 'PATCH')]), 20)
+        self.assertTrue(requests < 20)
+
+    def test_resume_before_pause_takes_effect(self):
+        local = self._local('f', 2000)
+        def pause_resume(event):
+            if event.job.transferred >= 300 and not getattr(event.job, 'paused_once', False):
+                event.job.paused_once = True
+                event.job.pause()
+                event.job.resume()
+        self.scheduler.callback = pause_resume
+        job = self.scheduler.upload(self.client, 'f', local)
+        self.assertTrue(job.wait(10))
+        self.assertEquals(job.state, DONE)
+        self.assertEquals(self.server.store.get('/f').data, self._read(local))
+
+    def test_pause_resume_streamed_upload(self):
+        server = DavServer(partial_update=False).start()
+        try:
+            client = pydav.client.Client(server.settings())
+            local = self._local('f', 2000)
+            self.scheduler.callback = self._pause_once
+            job = self.scheduler.upload(client, 'f', local)
+            self.scheduler.wait(10)
+            self.assertEquals(job.state, PAUSED)
+            job.resume()
+            self.assertTrue(job.wait(10))
+            self.assertEquals(job.state, DONE)
+            self.assertEquals(job.transferred, 2000)
+            self.assertEquals(server.store.get('/f').data, self._read(local))
+        finally:
+            server.stop()
+
+    def test_failure(self):
+        job = self.scheduler.download(self.client, 'missing', os.path.join(self.directory, 'm'))
+        self.assertTrue(job.wait(10))
+        self.assertEquals(job.state, FAILED)
+        self.assertEquals(job.error.args[0][0].status, 404)
+
+class TestHostCaps(unittest.TestCase):
+    def setUp(self):
+        self.servers = [slow_server(), slow_server()]
+        self.directory = tempfile.mkdtemp()
+        self.local = os.path.join(self.directory, 'f')
+        local_fd = open(self.local, 'wb')
+        local_fd.write('data')
+        local_fd.close()
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_per_host(self):
+        scheduler = TransferScheduler(workers=6, per_host=2)
+        for server in self.servers:
+            client = pydav.client.Client(server.settings())
+            for index in range(6):
+                scheduler.upload(client, 'f%d' % index, self.local)
+        self.assertTrue(scheduler.wait(10))
+        scheduler.close()
+        self.assertEquals([s.httpd.max_active for s in self.servers], [2, 2])
+        self.assertTrue(all(job.state == DONE for job in scheduler.jobs))
+
+class TestSendFileProgress(unittest.TestCase):
+    def test_progress(self):
+        server = DavServer().start()
+        directory = tempfile.mkdtemp()
+        try:
+            local = os.path.join(directory, 'f')
+            local_fd = open(local, 'wb')
+            local_fd.write('x' * 250)
+            local_fd.close()
+            client = pydav.client.Client(server.settings(maxChunkSize=100))
+            seen = []
+            client.sendFile('f', local, progress=lambda sent, size: seen.append((sent, size)))
+            self.assertEquals(seen, [(100, 250), (200, 250), (250, 250)])
+        finally:
+            server.stop()
+            shutil.rmtree(directory)
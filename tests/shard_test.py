@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pydav.shard import HashRing, ShardedClient
+from davserver import DavServer
+
+class TestHashRing(unittest.TestCase):
+    def test_balanced(self):
+        ring = HashRing(['a', 'b', 'c'])
+        keys = ['dir/file%d' % index for index in range(3000)]
+        counts = {}
+        for key in keys:
+            counts[ring.get(key)] = counts.get(ring.get(key), 0) + 1
+        self.assertEquals(sorted(counts), ['a', 'b', 'c'])
+        self.assertTrue(min(counts.values()) > 700)
+
+    def test_minimal_moves(self):
+        ring = HashRing(['a', 'b', 'c'])
+        keys = ['dir/file%d' % index for index in range(3000)]
+        before = dict((key, ring.get(key)) for key in keys)
+        ring.add('d')
+        moved = [key for key in keys if ring.get(key) != before[key]]
+        self.assertTrue(all(ring.get(key) == 'd' for key in moved))
+        self.assertTrue(500 < len(moved) < 1000)
+        ring.remove('d')
+        self.assertEquals(dict((key, ring.get(key)) for key in keys), before)
+
+    def test_empty(self):
+        self.assertEquals(HashRing().get('x'), None)
+
+class TestShardedClient(unittest.TestCase):
+    def setUp(self):
+        self.servers = dict((name, DavServer().start()) for name in ('a', 'b', 'c'))
+        self.sharded = ShardedClient(dict((name, server.settings())
+                                          for name, server in self.servers.items() if name != 'c'))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for server in self.servers.values():
+            server.stop()
+        shutil.rmtree(self.directory)
+
+    def _local(self, name, data):
+        path = os.path.join(self.directory, name)
+        local_fd = open(path, 'wb')
+        local_fd.write(data)
+        local_fd.close()
+        return path
+
+    def _holder(self, path):
+        return [name for name, server in sorted(self.servers.items())
+                if server.store.get('/' + path) is not None]
+
+    def _fill(self, count=40):
+        self.sharded.mkdir('dir')
+        paths = ['dir/f%d' % index for index in range(count)]
+        for path in paths:
+            self.sharded.sendFile(path, self._local('x', path))
+        return paths
+
+    def test_routing(self):
+        paths = self._fill()
+        holders = [self._holder(path) for path in paths]
+        self.assertTrue(all(len(found) == 1 for found in holders))
+        self.assertEquals(set(found[0] for found in holders), set(['a', 'b']))
+        for path in paths:
+            self.assertEquals(self._holder(path), [self.sharded.backend(path)])
+        local = os.path.join(self.directory, 'back')
+        self.sharded.getFile(paths[3], local)
+        self.assertEquals(open(local).read(), paths[3])
+        self.sharded.rm(paths[3])
+        self.assertEquals(self._holder(paths[3]), [])
+
+    def test_ls_merged(self):
+        paths = self._fill(10)
+        listed = self.sharded.ls('dir')
+        self.assertEquals(sorted(listed), sorted(['dir/'] + paths))
+
+    def test_pin(self):
+        self.sharded.pin('photos', 'b')
+        self.sharded.mkdir('photos')
+        self.assertEquals(self._holder('photos/'), ['b'])
+        for index in range(10):
+            self.sharded.sendFile('photos/p%d' % index, self._local('x', 'p'))
+        self.assertEquals(set(self._holder('photos/p%d' % index)[0] for index in range(10)), set(['b']))
+        self.assertEquals(len(self.sharded.ls('photos')), 11)
+
+    def test_add_backend(self):
+        paths = self._fill()
+        before = dict((path, self.sharded.backend(path)) for path in paths)
+        moves = self.sharded.addBackend('c', self.servers['c'].settings())
+        self.assertTrue(moves)
+        self.assertTrue(all(move.destination == 'c' for move in moves))
+        moved = set(move.path for move in moves)
+        self.assertEquals(moved, set(path for path in paths if self.sharded.backend(path) != before[path]))
+        for path in paths:
+            self.assertEquals(self._holder(path), [self.sharded.backend(path)])
+        self.assertEquals(self.servers['c'].store.get('/' + moves[0].path).data, moves[0].path)
+        copies = [r for r in self.servers['a'].requests + self.servers['b'].requests if r[0] == 'GET']
+        self.assertEquals(len(copies), len(moves))
+        self.assertEquals(sorted(self.sharded.ls('dir')), sorted(['dir/'] + paths))
+        self.assertEquals(self.sharded.rebalance(), [])
+
+    def test_remove_backend(self):
+        paths = self._fill(20)
+        self.sharded.removeBackend('b')
+        self.assertEquals(sorted(self.sharded.backends), ['a'])
+        for path in paths:
+            self.assertEquals(self._holder(path), ['a'])
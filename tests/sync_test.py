@@ -0,0 +1,57 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pydav.client
+import pydav.sync
+from davserver import DavServer
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.server.store.mkcol('/share/')
+        for name in ('a', 'b', 'c'):
+            self.server.store.put('/share/' + name, name)
+        self.client = pydav.client.Client(self.server.settings())
+        self.directory = tempfile.mkdtemp()
+        self.state = os.path.join(self.directory, 'sync.db')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _changes(self, **options):
+        return sorted((c.kind, c.href) for c in self.client.changes('share', self.state, **options))
+
+    def test_initial_sync_reports_everything(self):
+        self.assertEquals(self._changes(), [('added', '/share/a'), ('added', '/share/b'),
+                                            ('added', '/share/c')])
+        self.assertEquals(self._changes(), [])
+
+    def test_delta(self):
+        self._changes()
+        self.server.store.put('/share/b', 'bb')
+        self.server.store.put('/share/d', 'd')
+        self.server.store.delete('/share/a')
+        self.assertEquals(self._changes(), [('added', '/share/d'), ('changed', '/share/b'),
+                                            ('removed', '/share/a')])
+        report = [r for r in self.server.requests if r[0] == 'REPORT']
+        self.assertEquals(len(report), 2)
+
+    def test_paging(self):
+        self.assertEquals(len(self._changes(limit=2)), 3)
+        self.assertEquals(len([r for r in self.server.requests if r[0] == 'REPORT']), 2)
+
+    def test_changed_properties(self):
+        self._changes()
+        self.server.store.put('/share/c', 'cc')
+        change = list(self.client.changes('share', self.state))[0]
+        self.assertEquals(change.properties['getetag'], self.server.store.get('/share/c').etag)
+
+    def test_invalid_token_triggers_full_resync(self):
+        self._changes()
+        self.server.store.delete('/share/c')
+        self.server.store.forget_tokens()
+        self.assertEquals(self._changes(), [('changed', '/share/a'), ('changed', '/share/b'),
+                                            ('removed', '/share/c')])
+        self.assertEquals(self._changes(), [])
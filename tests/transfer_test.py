@@ -0,0 +1,131 @@
+import base64
+import unittest
+import httplib2
+import pydav.connection
+import pydav.transfer
+from davserver import DavServer, DavHandler
+from transport_test import AuthHandler
+
+class NoRangesHandler(DavHandler):
+    """ Announces no range support, and ignores Range headers when
+        server.ignore_ranges is set
+    """
+    def _file_headers(self, res):
+        headers = DavHandler._file_headers(self, res)
+        del headers['Accept-Ranges']
+        return headers
+
+    def do_GET(self):
+        if self.server.ignore_ranges and 'range' in self.headers:
+            del self.headers['range']
+        DavHandler.do_GET(self)
+
+class PutAuthHandler(DavHandler):
+    """ Requires Basic credentials wibble:fish on PUT requests only
+    """
+    def do_PUT(self):
+        if self.headers.get('authorization') != 'Basic ' + base64.b64encode('wibble:fish'):
+            self._record()
+            self._body()
+            return self._reply(401, headers={'WWW-Authenticate': 'Basic realm="test"'})
+        DavHandler.do_PUT(self)
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.source = DavServer().start()
+        self.data = ''.join(chr(i % 253) for i in range(100000))
+        self.source.store.put('/big', self.data)
+        self.source.store.put('/small', 'tiny')
+
+    def tearDown(self):
+        self.source.stop()
+        self.destination.stop()
+
+    def _transfer(self, partial_update=True, handler=DavHandler, without=(), **options):
+        self.destination = DavServer(partial_update=partial_update, handler=handler).start()
+        for method in without:
+            self.destination.httpd.methods.remove(method)
+        return pydav.transfer.Transfer(
+            pydav.connection.Connection(self.source.settings()),
+            pydav.connection.Connection(self.destination.settings()),
+            chunksize=8192, **options)
+
+    def test_parallel_chunks(self):
+        transfer = self._transfer()
+        result = transfer.copy('/big', '/copy')
+        self.assertEquals((result.size, result.mode), (100000, 'parallel'))
+        self.assertEquals(self.destination.store.get('/copy').data, self.data)
+        patches = [r for r in self.destination.requests if r[0] == 'PATCH']
+        self.assertEquals(len(patches), 12)
+
+    def test_streaming_put(self):
+        transfer = self._transfer(partial_update=False, buffered_chunks=2)
+        result = transfer.copy('/big', '/copy')
+        self.assertEquals(result.mode, 'stream')
+        self.assertEquals(self.destination.store.get('/copy').data, self.data)
+        puts = [r for r in self.destination.requests if r[0] == 'PUT']
+        self.assertEquals(len(puts), 1)
+
+    def test_copy_many(self):
+        transfer = self._transfer()
+        results = transfer.copy_many([('/big', '/a'), ('/small', '/b'), ('/big', '/c')])
+        self.assertEquals([r.mode for r in results], ['parallel', 'memory', 'parallel'])
+        self.assertEquals(self.destination.store.get('/b').data, 'tiny')
+        self.assertEquals(self.destination.store.get('/c').data, self.data)
+
+    def _no_ranges(self, ignore):
+        self.source.stop()
+        self.source = DavServer(handler=NoRangesHandler)
+        self.source.httpd.ignore_ranges = ignore
+        self.source.start()
+        self.source.store.put('/big', self.data)
+        self.source.store.put('/small', 'tiny')
+
+    def test_probe_ranges(self):
+        self._no_ranges(False)
+        transfer = self._transfer(partial_update=False)
+        results = transfer.copy_many([('/big', '/a'), ('/small', '/b')])
+        self.assertEquals([(r.size, r.mode) for r in results], [(100000, 'stream'), (4, 'memory')])
+        self.assertEquals(self.destination.store.get('/a').data, self.data)
+        gets = [r for r in self.source.requests if r[0] == 'GET' and r[1].endswith('/big')]
+        # the probe answer is the first chunk
+        self.assertEquals(len(gets), 13)
+
+    def test_ranges_ignored(self):
+        self._no_ranges(True)
+        transfer = self._transfer(buffered_chunks=1)
+        result = transfer.copy('/big', '/copy')
+        self.assertEquals((result.size, result.mode), (100000, 'stream'))
+        self.assertEquals(self.destination.store.get('/copy').data, self.data)
+        gets = [r for r in self.source.requests if r[0] == 'GET']
+        self.assertEquals(len(gets), 1)
+
+    def test_streaming_put_without_head(self):
+        transfer = self._transfer(partial_update=False, without=['HEAD'])
+        result = transfer.copy('/big', '/copy')
+        self.assertEquals(result.mode, 'stream')
+        self.assertEquals(self.destination.store.get('/copy').data, self.data)
+
+    def test_streaming_put_authentication(self):
+        transfer = self._transfer(partial_update=False, handler=AuthHandler)
+        result = transfer.copy('/big', '/copy')
+        self.assertEquals(result.mode, 'stream')
+        self.assertEquals(self.destination.store.get('/copy').data, self.data)
+        puts = [r for r in self.destination.requests if r[0] == 'PUT']
+        self.assertEquals(len(puts), 1)
+
+    def test_streaming_put_replay(self):
+        transfer = self._transfer(partial_update=False, handler=PutAuthHandler)
+        # the HEAD sent first gets no challenge: the PUT one can not be answered
+        self.assertRaises(httplib2.HttpLib2Error, transfer.copy, '/big', '/copy')
+        self.assertEquals(self.destination.store.get('/copy'), None)
+
+class TestChunkPipe(unittest.TestCase):
+    def test_read_once(self):
+        pipe = pydav.transfer.ChunkPipe(2)
+        pipe.feed('abc')
+        pipe.finish()
+        self.assertEquals(pipe.read(2), 'ab')
+        self.assertEquals(pipe.read(), 'c')
+        self.assertEquals(pipe.read(), '')
+        self.assertRaises(pydav.transfer.TransferError, pipe.read)
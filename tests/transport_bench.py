@@ -0,0 +1,58 @@
+""" Per-request overhead of the transports: sequential HEAD and PROPFIND
+	requests on one keep-alive connection to the stand-in server, and the
+	cost of Connection.get_uri against the former double urljoin.
+	The server runs in another process, so that the client CPU time per
+	request (the transport overhead) is measured apart from the wall time.
+
+	Usage: PYTHONPATH=.:tests python tests/transport_bench.py [requests]
+"""
+import sys
+import time
+import urlparse
+import multiprocessing
+import pydav.connection
+from davserver import DavServer
+
+def timed(function, count):
+	""" Wall and CPU microseconds per call
+	"""
+	start, cpu = time.time(), time.clock()
+	for index in xrange(count):
+		function(index)
+	return (time.time() - start) / count * 1e6, (time.clock() - cpu) / count * 1e6
+
+def serve(pipe):
+	server = DavServer().start()
+	server.store.put('/file', 'x' * 100)
+	pipe.send(server.settings())
+	pipe.recv()
+	server.stop()
+
+def main():
+	requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	pipe, child = multiprocessing.Pipe()
+	process = multiprocessing.Process(target=serve, args=(child,))
+	process.start()
+	try:
+		settings = pipe.recv()
+		for name in ('httplib2', 'httplib'):
+			settings['transport'] = name
+			connection = pydav.connection.Connection(dict(settings))
+			head = timed(lambda index: connection.send_head('/file'), requests)
+			propfind = timed(lambda index: connection.send_propfind('/file', ['getetag'], 0, raw=True),
+							 requests)
+			print '%-10s HEAD %6.0f us wall %6.0f us cpu   PROPFIND %6.0f us wall %6.0f us cpu' % (
+				(name,) + head + propfind)
+	finally:
+		pipe.send('stop')
+		process.join()
+
+	connection.host, connection.path = 'http://example.com:8080', '/remote.php/webdav/'
+	paths = ['dir/file%d.txt' % index for index in range(1000)]
+	joined = timed(lambda index: urlparse.urljoin(urlparse.urljoin(connection.host, connection.path),
+												  paths[index % 1000]), 100000)
+	fast = timed(lambda index: connection.get_uri(paths[index % 1000]), 100000)
+	print 'get_uri    urljoin %5.2f us   precomputed base %5.2f us' % (joined[0], fast[0])
+
+if __name__ == '__main__':
+	main()
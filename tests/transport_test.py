@@ -0,0 +1,106 @@
+import base64
+import unittest
+import urlparse
+import pydav.client
+import pydav.connection
+from pydav.transport import HttplibTransport, clone_transport, open_connection
+from davserver import DavHandler, DavServer
+
+class AuthHandler(DavHandler):
+    """ Requires Basic credentials wibble:fish on every request
+    """
+    def handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline:
+            self.close_connection = 1
+            return
+        if not self.parse_request():
+            return
+        expected = 'Basic ' + base64.b64encode('wibble:fish')
+        if self.headers.get('authorization') != expected:
+            self._record()
+            self._body()
+            self._reply(401, headers={'WWW-Authenticate': 'Basic realm="test"'})
+            self.wfile.flush()
+            return
+        getattr(self, 'do_' + self.command)()
+        self.wfile.flush()
+
+class TestHttplibTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        self.server.store.mkcol('/dir/')
+        self.server.store.put('/dir/a.txt', 'hello')
+        self.client = pydav.client.Client(self.server.settings(transport='httplib'))
+        self.transport = self.client.connection.httpcon
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_requests(self):
+        self.assertTrue(isinstance(self.transport, HttplibTransport))
+        self.assertEquals(len(self.client.ls('/dir/')), 2)
+        resp, content = self.client.connection.send_get('/dir/a.txt')
+        self.assertEquals((resp.status, content), (200, 'hello'))
+        self.assertEquals(resp['etag'], self.server.store.get('/dir/a.txt').etag)
+        resp = self.client.connection.send_head('/dir/a.txt')
+        self.assertEquals(resp['content-length'], '5')
+        self.client.connection.send_put('/dir/b.txt', 'data')
+        self.assertEquals(self.server.store.get('/dir/b.txt').data, 'data')
+        self.client.rm('/dir/b.txt')
+        self.assertEquals(self.server.store.get('/dir/b.txt'), None)
+
+    def test_keep_alive(self):
+        for index in range(10):
+            self.client.connection.send_get('/dir/a.txt')
+        self.assertEquals(self.transport.connections, 1)
+
+    def test_reconnect(self):
+        self.client.connection.send_get('/dir/a.txt')
+        self.transport._conn.sock.close()
+        resp, content = self.client.connection.send_get('/dir/a.txt')
+        self.assertEquals(content, 'hello')
+        self.assertEquals(self.transport.connections, 2)
+
+    def test_clone(self):
+        # Connection answers challenges itself: the transport knows no credentials
+        self.assertFalse(hasattr(self.transport, 'credentials'))
+        other = clone_transport(self.transport)
+        self.assertFalse(other is self.transport)
+        self.assertEquals(other._conn, None)
+        self.assertEquals(self.client.connection.clone().send_get('/dir/a.txt')[1], 'hello')
+
+    def test_open_connection(self):
+        transport = HttplibTransport('https://example.com/', timeout=7, ca_certs='/ca.pem',
+                                     disable_ssl_certificate_validation=True)
+        conn = open_connection(transport, 'https', 'example.com', 443)
+        self.assertEquals((conn.timeout, conn.ca_certs, conn.disable_ssl_certificate_validation),
+                          (7, '/ca.pem', True))
+        conn = open_connection(self.client.connection.httpcon, 'http', '127.0.0.1', 80)
+        self.assertEquals(conn.timeout, self.client.connection.httpcon.timeout)
+
+    def test_basic_auth(self):
+        server = DavServer(handler=AuthHandler).start()
+        try:
+            connection = pydav.connection.Connection(server.settings(transport='httplib'))
+            self.assertTrue('PROPFIND' in connection.methods)
+            connection.send_get('/')
+            connection.send_get('/')
+            # only the first request was challenged
+            self.assertEquals([r[0] for r in server.requests], ['OPTIONS', 'OPTIONS', 'GET', 'GET'])
+        finally:
+            server.stop()
+
+class TestGetUri(unittest.TestCase):
+    def test_same_as_urljoin(self):
+        server = DavServer().start()
+        try:
+            connection = pydav.connection.Connection(server.settings(path='/base/dir'))
+        finally:
+            server.stop()
+        for path in ['', 'a', 'a/b/', '/a', '/a/b c', './a', '../a', 'a/../b', 'a?x=1',
+                     '//other/a', 'http://other/a', '.hidden', 'a;p', '%20x']:
+            joined = urlparse.urljoin(urlparse.urljoin(connection.host, connection.path), path)
+            self.assertEquals(connection.get_uri(path), joined)
+        connection.host = 'http://example.com:81'
+        self.assertEquals(connection.get_uri('a'), 'http://example.com:81/base/dir/a')
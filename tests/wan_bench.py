@@ -0,0 +1,80 @@
+""" Serial against concurrent transfers and listings over an emulated WAN
+	link (see netem.NetemProxy): uploads (sendFile in a loop, sendFiles),
+	downloads (getFile in a loop, a TransferScheduler) and listings of a
+	tree (one depth 1 PROPFIND after the other, listing.walk).
+
+	Usage: PYTHONPATH=.:tests python tests/wan_bench.py [files] [size] [rtt] [bandwidth] [loss] [workers]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import pydav.client
+from pydav.listing import list_collection, walk
+from pydav.scheduler import TransferScheduler
+from davserver import DavServer
+from netem import NetemProxy, WAN
+
+def timed(function, *args):
+	start = time.time()
+	function(*args)
+	return time.time() - start
+
+def serial_walk(connection, path):
+	pending, found = [path], []
+	while pending:
+		itself, members = list_collection(connection, pending.pop())
+		found.extend(members)
+		pending.extend(entry.path for entry in members if entry.collection)
+	return found
+
+def main():
+	files = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+	size = int(sys.argv[2]) if len(sys.argv) > 2 else 65536
+	rtt = float(sys.argv[3]) if len(sys.argv) > 3 else WAN['latency'] * 2
+	bandwidth = float(sys.argv[4]) if len(sys.argv) > 4 else WAN['bandwidth']
+	loss = float(sys.argv[5]) if len(sys.argv) > 5 else WAN['loss']
+	workers = int(sys.argv[6]) if len(sys.argv) > 6 else 8
+	server = DavServer().start()
+	proxy = NetemProxy(server, latency=rtt / 2, jitter=WAN['jitter'], bandwidth=bandwidth or None,
+					   loss=loss, seed=0).start()
+	directory = tempfile.mkdtemp()
+	try:
+		client = pydav.client.Client(proxy.settings())
+		local_files = []
+		for index in range(files):
+			server.store.mkcol('/d%d/' % (index % workers))
+			local = os.path.join(directory, 'f%d' % index)
+			local_fd = open(local, 'wb')
+			local_fd.write(os.urandom(size))
+			local_fd.close()
+			local_files.append(('d%d/f%d' % (index % workers, index), local))
+
+		def download(client):
+			scheduler = TransferScheduler(workers=workers, per_host=workers)
+			for path, local in local_files:
+				scheduler.download(client, path, local + '.down', size)
+			scheduler.wait()
+			scheduler.close()
+
+		print '%d files of %d bytes, rtt %.0fms, %.0f bytes/s, %.1f%% loss, %d workers' % (
+			files, size, rtt * 1000, bandwidth, loss * 100, workers)
+		for name, serial, parallel in (
+				('sendFile', lambda: [client.sendFile(path, local) for path, local in local_files],
+				 lambda: client.sendFiles(local_files, workers=workers)),
+				('getFile', lambda: [client.getFile(path, local + '.down') for path, local in local_files],
+				 lambda: download(client)),
+				('ls', lambda: serial_walk(client.connection, '/'),
+				 lambda: walk(client.connection, '/', workers))):
+			serial_time, parallel_time = timed(serial), timed(parallel)
+			print '%-10s serial %7.3fs  parallel %7.3fs  speedup %5.1fx' % (name, serial_time, parallel_time,
+																		  serial_time / parallel_time)
+		print 'proxy: %d connections, %d bytes, %d resets' % (proxy.accepted, proxy.bytes, proxy.resets)
+	finally:
+		proxy.stop()
+		server.stop()
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main()
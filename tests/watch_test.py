@@ -0,0 +1,77 @@
+import unittest
+import pydav.client
+from davserver import DavServer
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.server = DavServer().start()
+        store = self.server.store
+        for path in ('/data/', '/data/a/', '/data/a/deep/', '/data/b/'):
+            store.mkcol(path)
+        for index in range(10):
+            store.put('/data/b/f%d' % index, 'x')
+        store.put('/data/a/deep/g', 'g')
+        self.client = pydav.client.Client(self.server.settings())
+        self.seen = []
+        self.watcher = self.client.watch('data', callback=self.seen.append)
+        self.assertEquals(self.watcher.poll(), [])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _events(self):
+        return sorted((e.kind, e.path) for e in self.watcher.poll())
+
+    def test_unchanged_tree_costs_one_request(self):
+        self.assertEquals(self._events(), [])
+        self.assertEquals(self.watcher.requests, 1)
+
+    def test_events(self):
+        store = self.server.store
+        store.put('/data/a/deep/g', 'changed')
+        store.put('/data/a/deep/h', 'new')
+        store.mkcol('/data/c/')
+        store.put('/data/c/i', 'i')
+        store.delete('/data/b/f3')
+        self.assertEquals(self._events(), [
+            ('created', '/data/a/deep/h'),
+            ('created', '/data/c/'),
+            ('created', '/data/c/i'),
+            ('deleted', '/data/b/f3'),
+            ('modified', '/data/a/deep/g'),
+        ])
+        self.assertEquals(len(self.seen), 5)
+        # root, /data/, /data/a/, /data/a/deep/, /data/b/, /data/c/
+        self.assertEquals(self.watcher.requests, 6)
+
+    def test_pruned(self):
+        self.server.store.put('/data/a/deep/g', 'changed')
+        before = len(self.server.requests)
+        self.assertEquals(self._events(), [('modified', '/data/a/deep/g')])
+        listed = [r[1] for r in self.server.requests[before:]]
+        self.assertFalse('/data/b/' in listed)
+
+    def test_deleted_subtree(self):
+        self.server.store.delete('/data/a/')
+        self.assertEquals(self._events(), [('deleted', '/data/a/'), ('deleted', '/data/a/deep/'),
+                                           ('deleted', '/data/a/deep/g')])
+        self.assertEquals(self.watcher.poll(), [])
+
+    def test_interrupted_poll(self):
+        self.server.store.put('/data/a/deep/h', 'new')
+        original = self.client.lsColumns
+        def failing(path, *args, **kwargs):
+            if path.endswith('/deep/'):
+                raise IOError('network down')
+            return original(path, *args, **kwargs)
+        self.client.lsColumns = failing
+        self.assertRaises(IOError, self.watcher.poll)
+        self.client.lsColumns = original
+        self.assertEquals(self._events(), [('created', '/data/a/deep/h')])
+
+    def test_iterator(self):
+        self.server.store.put('/data/new', 'n')
+        events = self.watcher.watch(interval=0)
+        self.assertEquals(next(events).path, '/data/new')
+        self.watcher.stop()
+        self.assertEquals(list(events), [])